@@ -1,16 +1,21 @@
 import pickle
-from copy import deepcopy
 import pandas as pd
 
-from aco.aco_final.MuseumGraphManager import MuseumGraphManager
 from aco.aco_final.ant import Colony
+from aco.aco_final.graph_cache import GraphCache
+from aco.aco_final.history import SnapshotStore
+from aco.aco_final.parallel import ParallelColony
 from aco.aco_final.solvers import Solver
+from aco.aco_final.subset_routing import SubsetRouter
 
 
 class AlgorithmController:
 
     def __init__(self, raw_museum_floorplan=None, alpha=1, beta=3,
-                 rho=0.02, pts=False, pts_factor=0.5, num_ants=100, start_room=1, start_node='D1-1'):
+                 rho=0.02, pts=False, pts_factor=0.5, num_ants=100, start_room=1, start_node='D1-1',
+                 array_engine=False, batch_ants=False, seed=None, n_workers=None, chunk_size=25,
+                 history_keep_last=None, history_log_spaced=False, lazy_evaporation=False, hierarchical=False,
+                 sparsify=None, unreachable='raise', max_door_hops=None, cost_factor=None, completion='shortest_path'):
 
         self.alpha = alpha
         self.beta = beta
@@ -18,8 +23,27 @@ class AlgorithmController:
         self.pts = pts
         self.pts_factor = pts_factor
         self.num_ants = num_ants
+        self.array_engine = array_engine
+        self.batch_ants = batch_ants
+        self.lazy_evaporation = lazy_evaporation
+        self.hierarchical = hierarchical
+        # Nearest neighbors kept in every room of the graph (None links every pair, see MuseumGraphManager)
+        self.sparsify = sparsify
+        # Exhibits that cannot be reached from start_node: 'raise' an error or 'prune' them from the tours
+        self.unreachable = unreachable
+        # Bounded construction: tours cut after max_door_hops fruitless door moves or above cost_factor
+        # times the record, then finished through shortest paths or dropped (completion='abort')
+        self.max_door_hops = max_door_hops
+        self.cost_factor = cost_factor
+        self.completion = completion
+        self.seed = seed
+        # Construction of the tours in a pool of n_workers processes (None to build them in this process)
+        self.parallel = ParallelColony(n_workers=n_workers, chunk_size=chunk_size, seed=seed, alpha=alpha,
+                                       beta=beta) if n_workers is not None else None
         self.graph = self._initialise_graph(raw_museum_floorplan)
-        self.algorithm_states = []
+        # Live state of the algorithm, and checkpoints of it after every computation
+        self.state = None
+        self.history = SnapshotStore(keep_last=history_keep_last, log_spaced=history_log_spaced)
         self.start_room = start_room
         self.start_node = start_node
         self.graph_original_state = None # graph.copy() if graph is not None else None
@@ -29,47 +53,125 @@ class AlgorithmController:
         # else:
         #    self.graph = graph
 
+    @property
+    def algorithm_states(self):
+        """ Checkpoints of the algorithm (read only views with the same attributes as State) """
+        return self.history
+
     def _initialise_graph(self, raw_museum_floorplan):
-        graph_manager = MuseumGraphManager(raw_museum_floorplan)
-        graph = graph_manager.door_graph
-        graph_manager.initialise_pheromones(graph)
+        # The manager is kept to apply changes of the museum (add_exhibit, close_door...) to the graph
+        self.graph_manager = GraphCache().get_manager(raw_museum_floorplan, sparsify=self.sparsify)
+        graph = self.graph_manager.door_graph
+        self.graph_manager.initialise_pheromones(graph)
         return graph
 
+    # Changes of the museum applied to the live graph, keeping the learned pheromone trails
+
+    def add_exhibit(self, name, room, location):
+        self._mutate(self.graph_manager.add_exhibit, name, room, location)
+
+    def remove_exhibit(self, name):
+        self._mutate(self.graph_manager.remove_exhibit, name)
+
+    def close_door(self, door):
+        self._mutate(self.graph_manager.close_door, door)
+
+    def open_door(self, door):
+        self._mutate(self.graph_manager.open_door, door)
+
+    def close_room(self, room):
+        self._mutate(self.graph_manager.close_room, room)
+
+    def open_room(self, room):
+        self._mutate(self.graph_manager.open_room, room)
+
+    def _mutate(self, change, *args):
+        if self.state is not None:
+            # The graph must hold the current pheromone trails (the removed edges are stored with them)
+            self.state.sync_graph()
+        change(*args)
+        if self.state is not None:
+            self.state.graph_changed()
+        print(f'Museum graph changed ({change.__name__}{args}), training continues from the current trails')
+
     def compute_initial_iterations(self, limit=200):
 
         print(f'Starting mmas algorithm with {limit} initial iterations.')
 
         colony = Colony(alpha=self.alpha, beta=self.beta)
-        solver = Solver(rho=self.rho, pts=self.pts, pts_factor=self.pts_factor)
+        solver = Solver(rho=self.rho, pts=self.pts, pts_factor=self.pts_factor,
+                        array_engine=self.array_engine, batch_ants=self.batch_ants, seed=self.seed,
+                        parallel=self.parallel, lazy_evaporation=self.lazy_evaporation,
+                        hierarchical=self.hierarchical, unreachable=self.unreachable,
+                        max_door_hops=self.max_door_hops, cost_factor=self.cost_factor, completion=self.completion)
         state = solver.solve(self.graph, colony=colony, n_ants=self.num_ants, limit=limit,
                              start_room=self.start_room, start_node=self.start_node)
         self.graph = state.graph
-        self.algorithm_states.append(state)
+        self.state = state
+        self.history.record(state)
 
         print(f'Finished computing the initial {limit} iterations')
 
     def compute_next_iterations(self, limit=15):
 
-        if not self.algorithm_states:
+        if self.state is None:
             raise Exception("No saved states. You must run the algorithm for the first time using start()")
 
         print(f'Continuing mmas algorithm execution with {limit} more iterations.')
-        # Retrieve the  most recent state
-        last_state = deepcopy(self.algorithm_states[-1])
-        solver = Solver(rho=self.rho, pts=self.pts, pts_factor=self.pts_factor, state=last_state)
-        next_state = solver.solve(self.graph, limit=limit)
-        self.graph = next_state.graph
-        self.algorithm_states.append(next_state)
+        # Continue from the live state: the history only keeps compressed checkpoints of it
+        solver = Solver(rho=self.rho, pts=self.pts, pts_factor=self.pts_factor, state=self.state,
+                        array_engine=self.array_engine, batch_ants=self.batch_ants, parallel=self.parallel,
+                        lazy_evaporation=self.lazy_evaporation, hierarchical=self.hierarchical,
+                        unreachable=self.unreachable, max_door_hops=self.max_door_hops, cost_factor=self.cost_factor,
+                        completion=self.completion)
+        self.state = solver.solve(self.graph, limit=limit)
+        self.graph = self.state.graph
+        self.history.record(self.state)
         print(f"Done {limit} iterations. Waiting for more feedback")
 
+    def compute_within_budget(self, time_budget=0.05, stagnation_limit=None, limit=None, callback=None):
+        """
+        Anytime computation: keeps iterating (from the current state, if any) until the time budget
+        (seconds) is spent or the record has not improved for stagnation_limit iterations.
+        Every new record is passed to callback (returning False stops the search).
+        Returns the best solution found so far.
+        """
+        colony = Colony(alpha=self.alpha, beta=self.beta) if self.state is None else None
+        solver = Solver(rho=self.rho, pts=self.pts, pts_factor=self.pts_factor, state=self.state,
+                        array_engine=self.array_engine, batch_ants=self.batch_ants, seed=self.seed,
+                        parallel=self.parallel, lazy_evaporation=self.lazy_evaporation,
+                        hierarchical=self.hierarchical, unreachable=self.unreachable,
+                        max_door_hops=self.max_door_hops, cost_factor=self.cost_factor, completion=self.completion)
+        self.state = solver.solve_anytime(self.graph, colony=colony, n_ants=self.num_ants, time_budget=time_budget,
+                                          stagnation_limit=stagnation_limit, limit=limit,
+                                          start_room=self.start_room, start_node=self.start_node,
+                                          callback=callback)
+        self.graph = self.state.graph
+        self.history.record(self.state)
+        return self.state.record
+
+    def personalized_tour(self, exhibits, start_node=None, end_node=None):
+        """
+        Shortest tour through the exhibits chosen by a visitor, solved on the walking distances
+        between them instead of the whole door graph (see SubsetRouter).
+        Returns a dict with the 'cost', the visiting 'order' of the exhibits and the door-level 'path'.
+        """
+        router = SubsetRouter(self.graph_manager.walking_distances, seed=self.seed)
+        order, path, cost = router.solve(start_node or self.start_node, exhibits, end=end_node)
+        return {'cost': cost, 'order': order, 'path': path}
+
     def manual_pheromone_update(self, edge, multiplier=250):
         print("Manual pheromone update of edge:", edge)
         u, v = edge
-        pheromome = self.graph[u][v]['pheromone']
-        new_pheromone = pheromome * multiplier
-        self.graph[u][v]['pheromone'] = new_pheromone
-        # if new_pheromone >= self.algorithm_states[-1].current_upper_bound:
-        #    self.graph[u][v]['pheromone'] = self.algorithm_states[-1].current_upper_bound
+        if self.state is None:
+            self.graph[u][v]['pheromone'] = self.graph[u][v]['pheromone'] * multiplier
+            return
+
+        # Only the updated edge is touched (graph, pheromone arrays and cached attractiveness)
+        new_pheromone = self.state.get_pheromone(u, v) * multiplier
+        self.state.set_pheromone(u, v, new_pheromone)
+        # if new_pheromone >= self.state.current_upper_bound:
+        #    self.graph[u][v]['pheromone'] = self.state.current_upper_bound
 
     def manual_pheromone_and_continue_iters(self, edge, multiplier=250, limit=15):
         self.manual_pheromone_update(edge, multiplier=multiplier)
@@ -77,8 +179,7 @@ class AlgorithmController:
 
     def pheromone_info(self, edges=None, state_idx=-1, use_dataframe=False):
         edge_data = []
-        state = self.algorithm_states[state_idx]
-        graph = state.graph
+        graph = self.history[state_idx].graph
         if edges is None:
             edges = graph.edges()
 
@@ -101,8 +202,8 @@ class AlgorithmController:
         print("*******************************")
         print("Saving iML GRAPH with knowledge")
         print("*******************************")
-        state = self.algorithm_states[-1]
-        pickle.dump(state.graph, open('../virtual_museum_iml.pickle', 'wb'))
+        self.state.sync_graph()
+        pickle.dump(self.state.graph, open('../virtual_museum_iml.pickle', 'wb'))
         print("Pickle Where is it")
 
     def load_graph(self):
@@ -112,12 +213,16 @@ class AlgorithmController:
         self.graph = pickle.load(open('../virtual_museum_iml.pickle', 'rb'))
 
     def print_best_sol(self):
-        state = self.algorithm_states[-1]
-        best_cost = state.record.cost
-        best_path = state.record.path
+        best_cost = self.state.record.cost
+        best_path = self.state.record.path
         print(best_cost)
         print(best_path)
 
+    def close(self):
+        """ Stops the worker processes of the parallel mode (if any) """
+        if self.parallel is not None:
+            self.parallel.close()
+
     def reset_algorithm(self):
         self.graph = self.graph_original_state.copy()
         print("Algorithm has been reset")
\ No newline at end of file
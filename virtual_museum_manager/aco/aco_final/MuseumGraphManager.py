@@ -1,13 +1,20 @@
 import networkx as nx
 import numpy as np
 import re
-from itertools import combinations
 # import matplotlib.pyplot as plt
 
+from aco.aco_final.sparsification import sparse_room_links
+from aco.aco_final.graph_index import GraphIndex
+from aco.aco_final.reachability import Reachability
+from aco.aco_final.walking_distances import WalkingDistances
+
 
 class MuseumGraphManager:
 
-    def __init__(self, rooms_map, rooms_subset=None, grid_dimensions=[100, 70]):
+    initial_pheromone_value = 0.9
+
+    def __init__(self, rooms_map, rooms_subset=None, grid_dimensions=[100, 70], build_door_graph=True,
+                 sparsify=None):
 
         """
         Graph of Rooms
@@ -15,13 +22,51 @@ class MuseumGraphManager:
         Parameters
         ----------
         rooms_map: map of the rooms
+        build_door_graph: if False only the array form of the door graph (door_arrays) is built
+        sparsify: number of nearest neighbors kept by every element of a room instead of linking all of them
+                  (see sparse_room_links). Either a single k for every room or a dict {room number: k}
+                  (rooms not in the dict are not sparsified). None links every pair of elements.
 
         """
         self.grid_dimensions = grid_dimensions
+        self.sparsify = sparsify
+        # Links of every room before and after sparsification
+        self.sparsification_report = []
 
         self._rooms = self._prepare_room_map(rooms_map, rooms_subset=rooms_subset)
         self.room_graph = self._create_room_graph()
-        self.door_graph = self._create_door_graph()
+        # Array form of the door graph (see _compile_door_arrays), the networkx graph is built from it
+        self.door_arrays = self._compile_door_arrays()
+        self.door_graph = self._create_door_graph() if build_door_graph else None
+        # All-pairs walking distances of the door graph, built on first use (see walking_distances)
+        self._walking_distances = None
+        self._reachability = None
+        self._init_mutations()
+
+    @classmethod
+    def from_compiled(cls, door_arrays, room_graph, grid_dimensions=[100, 70], build_door_graph=True):
+        """
+        Creates a manager from an already compiled door graph (door_arrays) and room graph,
+        without processing the rooms map again (see GraphCache).
+        """
+        manager = cls.__new__(cls)
+        manager.grid_dimensions = grid_dimensions
+        manager.sparsify = None
+        manager.sparsification_report = []
+        manager._rooms = None
+        manager.room_graph = room_graph
+        manager.door_arrays = door_arrays
+        manager.door_graph = manager._create_door_graph() if build_door_graph else None
+        manager._walking_distances = None
+        manager._reachability = None
+        manager._init_mutations()
+        return manager
+
+    def _init_mutations(self):
+        # Location of every node, and elements removed by close_door / close_room (to be restored)
+        self.node_locations = dict(zip(self.door_arrays['node_names'], self.door_arrays['node_location']))
+        self._closed_doors = {}
+        self._closed_rooms = {}
 
     def _prepare_room_map(self, rooms_map, rooms_subset=None):
 
@@ -110,57 +155,316 @@ class MuseumGraphManager:
 
     def _create_door_graph(self):
         """
-        Create a Graph of Doors
+        Create a Graph of Doors from the compiled door arrays (see _compile_door_arrays)
         """
 
+        arrays = self.door_arrays
+        names = arrays['node_names']
+
         # create empty graph
         g = nx.Graph()
-        g.graph.update({"n_doors_per_room": {}})
-        link_list = []
-        nodes_list = []
-        for room in self._rooms:  # ([self._rooms[5]] + [self._rooms[12]]):
-            # [self._rooms[0]] + [self._rooms[2]] + [self._rooms[4]] + [self._rooms[5]] +  [self._rooms[12]]
-            # Make all possible two pair combinations inside the room.
-            # (door-door, exhibits-exhibit, door-exhibit)
-            room_number_origin = int(re.findall(r"\d+", room['room_name'])[0])
-            node_combinations = list(combinations(room['doors'] + room['exhibits'], 2))
-
-            for node1, node2 in node_combinations:
-
-                n1_with_info = (node1['name'], {'type': node1['type'], 'room': room_number_origin})
-                n2_with_info = (node2['name'], {'type': node2['type'], 'room': room_number_origin})
-
-                if n1_with_info not in nodes_list:
-                    nodes_list.append(n1_with_info)
-                if n2_with_info not in nodes_list:
-                    nodes_list.append(n2_with_info)
-
-                distance = np.linalg.norm(node1['location'] - node2['location'])
-                n1_name, n2_name = node1['name'], node2['name']
-                link = (n1_name, n2_name, {'weight': np.around(distance, 2), 'pheromone': 0,
-                                           'room': room_number_origin})
-                # print(link)
-                link_list.append(link)
+        g.graph.update({"n_doors_per_room": dict(arrays['n_doors_per_room'])})
+        g.add_nodes_from((name, {'type': node_type, 'room': room})
+                         for name, node_type, room in zip(names, arrays['node_type'], arrays['node_room'].tolist()))
+        g.add_edges_from((names[u], names[v], {'weight': weight, 'pheromone': 0, 'room': room})
+                         for (u, v), weight, room in zip(arrays['edge_nodes'].tolist(), arrays['edge_weight'],
+                                                         arrays['edge_room'].tolist()))
+        # Integer node types, rooms and neighbors of the graph, shared by the ants and the pheromone engine
+        GraphIndex.publish(g)
+        return g
 
-            doors_in_room = len(room['doors'])
-            g.graph['n_doors_per_room'][f'{room_number_origin}'] = doors_in_room
+    def _compile_door_arrays(self):
+        """
+        Compiles the door graph in array form.
 
-        # Add links to graph (this automatically creates nodes)
-        g.add_nodes_from(nodes_list)
-        g.add_edges_from(link_list)
+        Every pair of elements (door-door, exhibit-exhibit, door-exhibit) inside a room is linked,
+        unless the room is sparsified (see sparsify).
+        The distances of each room are computed as a single pairwise block, and nodes are
+        deduplicated with a dict (a door belongs to the two rooms it connects: its attributes are
+        those of the last room, as when adding the same node twice to a networkx graph).
+        Duplicated links keep their first position and the attributes of the last one, and self loops are removed.
 
-        self_loops = [(u, v) for u, v in g.edges() if u == v]
-        g.remove_edges_from(self_loops)
-        return g
+        Returns
+        -------
+        arrays (dict): node_names (list), node_type (list), node_room (int array), node_location (N x 2 array),
+        edge_nodes (E x 2 int array of node ids), edge_weight (float array), edge_room (int array)
+        and n_doors_per_room (dict).
+        """
+        node_ids = {}
+        node_type, node_room, node_location = [], [], []
+        edge_u, edge_v, edge_weight, edge_room = [], [], [], []
+        n_doors_per_room = {}
 
+        for room in self._rooms:
+            room_number_origin = int(re.findall(r"\d+", room['room_name'])[0])
+            n_doors_per_room[f'{room_number_origin}'] = len(room['doors'])
+            elements = room['doors'] + room['exhibits']
+            # Elements of rooms without any pair are not part of the graph
+            if len(elements) < 2:
+                continue
+
+            ids = np.empty(len(elements), dtype=np.int64)
+            for position, element in enumerate(elements):
+                node_id = node_ids.setdefault(element['name'], len(node_ids))
+                if node_id == len(node_type):
+                    node_type.append(None)
+                    node_room.append(None)
+                    node_location.append(None)
+                node_type[node_id] = element['type']
+                node_room[node_id] = room_number_origin
+                node_location[node_id] = element['location']
+                ids[position] = node_id
+
+            # Pairwise distances of the room, pairs in the same order as itertools.combinations
+            locations = np.array([element['location'] for element in elements], dtype=np.float64)
+            first, second = np.triu_indices(len(elements), 1)
+            difference = locations[:, None, :] - locations[None, :, :]
+            pairwise = np.sqrt((difference ** 2).sum(axis=2))
+            distances = pairwise[first, second]
+
+            k = self._sparsify_k(room_number_origin)
+            if k is not None:
+                is_door = np.array([element['type'] == 'door' for element in elements])
+                kept = sparse_room_links(pairwise, is_door, k)[first, second]
+                self.sparsification_report.append({'room': room_number_origin, 'k': k,
+                                                   'edges_before': len(first),
+                                                   'edges_after': int(np.count_nonzero(kept))})
+                first, second, distances = first[kept], second[kept], distances[kept]
+
+            edge_u.append(ids[first])
+            edge_v.append(ids[second])
+            edge_weight.append(np.around(distances, 2))
+            edge_room.append(np.full(len(first), room_number_origin, dtype=np.int64))
+
+        n_nodes = len(node_ids)
+        if edge_u:
+            u, v = np.concatenate(edge_u), np.concatenate(edge_v)
+            weight, room_of_edge = np.concatenate(edge_weight), np.concatenate(edge_room)
+        else:
+            u = v = room_of_edge = np.empty(0, dtype=np.int64)
+            weight = np.empty(0, dtype=np.float64)
+
+        # Remove self loops (doors listed twice in the same room)
+        keep = u != v
+        u, v, weight, room_of_edge = u[keep], v[keep], weight[keep], room_of_edge[keep]
+
+        # Duplicated links: position of the first occurrence, attributes of the last one
+        keys = np.minimum(u, v) * max(n_nodes, 1) + np.maximum(u, v)
+        _, first_occurrence, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        last_occurrence = np.zeros(len(first_occurrence), dtype=np.int64)
+        last_occurrence[inverse.ravel()] = np.arange(len(keys))
+        order = np.argsort(first_occurrence, kind='stable')
+        first_occurrence, last_occurrence = first_occurrence[order], last_occurrence[order]
+
+        return {'node_names': list(node_ids),
+                'node_type': node_type,
+                'node_room': np.array(node_room, dtype=np.int64),
+                'node_location': np.array(node_location, dtype=np.float64).reshape(n_nodes, 2),
+                'edge_nodes': np.stack([u[first_occurrence], v[first_occurrence]], axis=1).reshape(-1, 2),
+                'edge_weight': weight[last_occurrence],
+                'edge_room': room_of_edge[last_occurrence],
+                'n_doors_per_room': n_doors_per_room}
+
+    def _sparsify_k(self, room_number):
+        if isinstance(self.sparsify, dict):
+            return self.sparsify.get(room_number)
+        return self.sparsify
+
+    def door_csr(self):
+        """
+        Compressed sparse row (CSR) form of the door graph, built from the compiled arrays.
 
+        Returns
+        -------
+        indptr (int array): neighbors of node i are indices[indptr[i]:indptr[i + 1]].
+        indices (int array): neighbor node ids.
+        edge_ids (int array): edge id (row of the compiled edge arrays) of every entry of indices.
+        """
+        arrays = self.door_arrays
+        n_nodes = len(arrays['node_names'])
+        edges = arrays['edge_nodes']
+        sources = np.concatenate([edges[:, 0], edges[:, 1]])
+        targets = np.concatenate([edges[:, 1], edges[:, 0]])
+        edge_ids = np.tile(np.arange(len(edges), dtype=np.int64), 2)
+
+        order = np.argsort(sources, kind='stable')
+        indptr = np.zeros(n_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=n_nodes), out=indptr[1:])
+        return indptr, targets[order], edge_ids[order]
 
     def initialise_pheromones(self, graph):
-        initial_pheromone_value = 0.9
+        initial_pheromone_value = self.initial_pheromone_value
         for edge in graph.edges():
             u, v = edge
             graph[u][v]['pheromone'] = initial_pheromone_value
 
+    # Incremental changes of the door graph (the learned pheromone trails of the other edges are kept)
+
+    def add_exhibit(self, name, room, location):
+        """
+        Adds an exhibit to a room, linked to every element of the room.
+        The pheromone of every new link is seeded from the links of the element it leads to (see _seed_pheromone).
+
+        Parameters
+        ----------
+        name: name of the exhibit.
+        room: room number.
+        location: location of the exhibit, as in space.json ({'x': .., 'y': ..}).
+        """
+        graph = self._mutable_door_graph()
+        if name in graph:
+            raise ValueError(f'Node {name} already exists')
+        members = self.room_members(room)
+        if not members:
+            raise ValueError(f'Room {room} has no elements in the graph')
+
+        location = self._denormalize_coordinate(location)
+        self.node_locations[name] = location
+        pheromones = {member: self._seed_pheromone(member, room) for member in members}
+        graph.add_node(name, type='exhibit', room=room)
+        for member in members:
+            distance = np.linalg.norm(location - self.node_locations[member])
+            graph.add_edge(name, member, weight=np.around(distance, 2), pheromone=pheromones[member], room=room)
+        self._door_graph_changed()
+
+    def remove_exhibit(self, name):
+        graph = self._mutable_door_graph()
+        if graph.nodes[name]['type'] != 'exhibit':
+            raise ValueError(f'Node {name} is not an exhibit')
+        graph.remove_node(name)
+        self.node_locations.pop(name, None)
+        self._door_graph_changed()
+
+    def close_door(self, name):
+        """
+        Closes a door: the door and its links are removed from the graph, and kept (with their
+        pheromone) to be restored by open_door.
+        """
+        graph = self._mutable_door_graph()
+        if graph.nodes[name]['type'] != 'door':
+            raise ValueError(f'Node {name} is not a door')
+        if name in self.reachability.door_articulation_points:
+            print(f'Closing door {name} splits the museum: some exhibits will no longer be reachable')
+        self._closed_doors[name] = self._remove_nodes([name])
+        self._door_graph_changed()
+
+    def open_door(self, name):
+        """
+        Opens a door closed with close_door, restoring its links (and their pheromone) to the elements
+        still in the graph.
+        """
+        if name not in self._closed_doors:
+            raise ValueError(f'Door {name} has not been closed with close_door')
+        self._mutable_door_graph()
+        self._restore_nodes(self._closed_doors.pop(name))
+        self._door_graph_changed()
+
+    def close_room(self, room):
+        """
+        Closes a room: its exhibits and doors (including those shared with the neighbor rooms) are removed
+        from the graph, and kept to be restored by open_room.
+        """
+        self._mutable_door_graph()
+        members = self.room_members(room)
+        if not members:
+            raise ValueError(f'Room {room} has no elements in the graph')
+        self._closed_rooms[room] = self._remove_nodes(members)
+        self._door_graph_changed()
+
+    def open_room(self, room):
+        """
+        Opens a room closed with close_room, restoring its exhibits, doors and links (and their pheromone)
+        to the elements still in the graph.
+        """
+        if room not in self._closed_rooms:
+            raise ValueError(f'Room {room} has not been closed with close_room')
+        self._mutable_door_graph()
+        self._restore_nodes(self._closed_rooms.pop(room))
+        self._door_graph_changed()
+
+    def room_members(self, room):
+        """
+        Nodes of the door graph linked inside the room (its exhibits and doors).
+        """
+        graph = self.door_graph
+        members = {}
+        for u, v, edge_room in graph.edges(data='room'):
+            if edge_room == room:
+                members[u] = members[v] = None
+        # Elements without links (e.g. a single exhibit left in the room)
+        members.update((n, None) for n, node_room in graph.nodes(data='room')
+                       if node_room == room and graph.nodes[n]['type'] == 'exhibit')
+        return list(members)
+
+    def _mutable_door_graph(self):
+        if self.door_graph is None:
+            raise ValueError('The door graph has not been built (build_door_graph=False)')
+        return self.door_graph
+
+    def _seed_pheromone(self, node, room):
+        """
+        Pheromone of a new link to node: mean pheromone of the links of node in the room
+        (only links with pheromone), or the initial pheromone if there are none.
+        """
+        graph = self.door_graph
+        pheromones = [data['pheromone'] for _, _, data in graph.edges(node, data=True)
+                      if data['room'] == room and data['pheromone'] != 0]
+        if pheromones:
+            return float(np.mean(pheromones))
+        any_pheromone = any(data != 0 for _, _, data in graph.edges(data='pheromone'))
+        return self.initial_pheromone_value if any_pheromone else 0
+
+    def _remove_nodes(self, names):
+        graph = self.door_graph
+        removed = {'nodes': [(n, dict(graph.nodes[n]), self.node_locations.get(n)) for n in names],
+                   'edges': [(u, v, dict(data)) for u, v, data in graph.edges(names, data=True)],
+                   'n_doors_per_room': dict(graph.graph['n_doors_per_room'])}
+        graph.remove_nodes_from(names)
+        # Doors of every room
+        for n, attributes, _ in removed['nodes']:
+            if attributes['type'] == 'door':
+                for room in {data['room'] for u, v, data in removed['edges'] if n in (u, v)}:
+                    graph.graph['n_doors_per_room'][f'{room}'] -= 1
+        return removed
+
+    def _restore_nodes(self, removed):
+        graph = self.door_graph
+        for n, attributes, location in removed['nodes']:
+            graph.add_node(n, **attributes)
+            if location is not None:
+                self.node_locations[n] = location
+        # Links to elements removed in the meantime are not restored
+        graph.add_edges_from((u, v, data) for u, v, data in removed['edges'] if u in graph and v in graph)
+        for n, attributes, _ in removed['nodes']:
+            if attributes['type'] == 'door':
+                for room in {data['room'] for u, v, data in removed['edges'] if n in (u, v)}:
+                    graph.graph['n_doors_per_room'][f'{room}'] += 1
+
+    def _door_graph_changed(self):
+        """
+        Recompiles the array form of the door graph and drops the structures built from it.
+        """
+        self.door_arrays = self._door_arrays_from_graph(self.door_graph)
+        GraphIndex.publish(self.door_graph)
+        self._walking_distances = None
+        self._reachability = None
+
+    def _door_arrays_from_graph(self, graph):
+        node_names = list(graph.nodes())
+        node_index = {name: idx for idx, name in enumerate(node_names)}
+        edges = list(graph.edges(data=True))
+        missing = np.full(2, np.nan)
+        return {'node_names': node_names,
+                'node_type': [graph.nodes[n]['type'] for n in node_names],
+                'node_room': np.array([graph.nodes[n]['room'] for n in node_names], dtype=np.int64),
+                'node_location': np.array([self.node_locations.get(n, missing) for n in node_names],
+                                          dtype=np.float64).reshape(-1, 2),
+                'edge_nodes': np.array([(node_index[u], node_index[v]) for u, v, _ in edges],
+                                       dtype=np.int64).reshape(-1, 2),
+                'edge_weight': np.array([data['weight'] for _, _, data in edges], dtype=np.float64),
+                'edge_room': np.array([data['room'] for _, _, data in edges], dtype=np.int64),
+                'n_doors_per_room': dict(graph.graph['n_doors_per_room'])}
+
 
     def _create_room_graph(self):
         """
@@ -196,9 +500,37 @@ class MuseumGraphManager:
         pass
 
 
+    @property
+    def walking_distances(self):
+        """
+        WalkingDistances of the door graph: constant-time distance and path lookups between any two nodes.
+        """
+        if self._walking_distances is None:
+            self._walking_distances = WalkingDistances.from_arrays(self.door_arrays)
+        return self._walking_distances
+
+    @property
+    def reachability(self):
+        """
+        Reachability of the door graph: connected components, door articulation points and
+        exhibits reachable from every start door.
+        """
+        if self._reachability is None:
+            self._reachability = Reachability(self._mutable_door_graph())
+        return self._reachability
+
     def get_shortest_path(self, graph, origin, dest):
+        # Weights of the door graph never change: its distances are looked up in the precomputed matrix
+        if graph is None or graph is self.door_graph:
+            return self.walking_distances.distance(origin, dest)
         return nx.shortest_path_length(graph, source=origin, target=dest, weight='weight')
 
+    def get_walking_path(self, origin, dest):
+        """
+        Shortest path (list of nodes) between two nodes of the door graph.
+        """
+        return self.walking_distances.path(origin, dest)
+
     def get_neighbors(self, graph, node, neighbor_type=""):
 
         if (neighbor_type == 'door'):
@@ -209,8 +541,12 @@ class MuseumGraphManager:
             return graph[node]
 
     def _nearest_neighbor_heuristic(self, graph, start, objectives):
-        sps = [nx.shortest_path_length(graph, source=start,
-                                       target=objective, weight='weight') for objective in objectives]
+        if graph is None or graph is self.door_graph:
+            sps = [self.walking_distances.distance(start, objective) for objective in objectives]
+        else:
+            # A single Dijkstra for all objectives
+            lengths = nx.single_source_dijkstra_path_length(graph, start, weight='weight')
+            sps = [lengths[objective] for objective in objectives]
         furthest_exhibit = max(sps)
         sum_paths = sum(sps)
         estimated_cost = sum_paths / 1.8
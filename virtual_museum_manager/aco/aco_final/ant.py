@@ -3,6 +3,11 @@ import bisect
 import random
 import sys
 
+import numpy as np
+
+from aco.aco_final.batch_ant import BatchColony
+from aco.aco_final.graph_index import GraphIndex
+from aco.aco_final.hierarchical import HierarchicalColony
 from aco.aco_final.solvers import Solution
 
 
@@ -205,113 +210,74 @@ class Ant:
         self.alpha = alpha
         self.beta = beta
 
-    def construct_tour(self, exhibit_and_door_graph, start_room=1, start_door='D1-1'):
-        """ Construct a tour including all chosen exhibits
+    def construct_tour(self, exhibit_and_door_graph, start_room=1, start_door='D1-1', attractiveness=None,
+                       objectives=None, bounds=None, index=None):
+        """ Construct a tour including all chosen exhibits.
+        If an AttractivenessTable is specified, edge scores are read from it instead of being computed
+        from the graph edges.
+        objectives are the exhibits to visit, as one byte per node id of GraphIndex.of(graph) (all exhibits
+        of the graph by default). They must be reachable from start_door (see Reachability.objectives).
+        If TourBounds are specified, the tour is completed through shortest paths (or dropped,
+        returning None) once it exceeds them.
+        index is the GraphIndex of the graph (the one of the AttractivenessTable engine, or GraphIndex.of(graph)
+        by default): colonies resolve it once for all their ants.
         """
 
-        start_node = start_door
-        solution = Solution(exhibit_and_door_graph, start_node, ant=self)
-        all_unexplored_exhibits = self.get_unexplored_exhibits(solution, exhibit_and_door_graph)
-
-        while all_unexplored_exhibits:
-            feasible_neighbors = self._get_feasible_neighbors(exhibit_and_door_graph, solution)
-            next_node = self._choose_destination(exhibit_and_door_graph, solution, feasible_neighbors)
-            solution.add_node(next_node)
-            all_unexplored_exhibits = self._remove_node_safe(all_unexplored_exhibits, next_node)
-
-        return solution
-
-    def _get_feasible_neighbors(self, graph, solution):
-
-        available_neighbours = []
-        for nb in graph.neighbors(solution.current):
-            is_exhibit = graph.nodes[nb]["type"] == "exhibit"
-            is_door = graph.nodes[nb]["type"] == "door"
-            if is_exhibit and nb not in solution:
-                available_neighbours.append(nb)
-            elif is_door:
-                available_neighbours.append(nb)
-
-        return available_neighbours
-
-    def __construct_tour(self, exhibit_and_door_graph, start_room=1, start_door='D1-1'):
-        """
-        Construct a tour including all chosen exhibits
-        """
-        start_node = start_door
-        solution = Solution(exhibit_and_door_graph, start_node, ant=self)
-        all_unexplored_exhibits = self.get_unexplored_exhibits(solution, exhibit_and_door_graph)
-        while all_unexplored_exhibits:
-            unexplored_neighbor_exhibits = self.get_unexplored_neighbor_exhibits(exhibit_and_door_graph, solution,
-                                                                                 solution.current)
-            while not unexplored_neighbor_exhibits:
-                neighbor_doors = self.get_neighbor_doors(exhibit_and_door_graph, solution.current)
-                next_door = self._choose_destination(exhibit_and_door_graph, solution, neighbor_doors)
-                solution.add_node(next_door)
-                unexplored_neighbor_exhibits = self.get_unexplored_neighbor_exhibits(exhibit_and_door_graph, solution,
-                                                                                     solution.current)
-            next_exhibit = self._choose_destination(exhibit_and_door_graph, solution, unexplored_neighbor_exhibits)
-            solution.add_node(next_exhibit)
-            all_unexplored_exhibits = self._remove_node_safe(all_unexplored_exhibits, next_exhibit)
+        graph = exhibit_and_door_graph
+        # Integer view of the graph (node types and neighbors split by type, see GraphIndex)
+        if index is None:
+            index = attractiveness.engine.index if attractiveness is not None else GraphIndex.of(graph)
+        names = index.node_names
+        door_neighbors, exhibit_neighbors = index.typed_neighbors()
+        scores = attractiveness.entries if attractiveness is not None else None
+
+        solution = Solution(graph, start_door, ant=self)
+        current = previous = index.node_index[start_door]
+        # Exhibits still to visit (one byte per node id)
+        pending = bytearray(index.exhibit_bitmask if objectives is None else objectives)
+        pending[current] = 0
+        n_pending = pending.count(1)
+        door_hops = 0
+
+        while n_pending:
+            # Unvisited exhibits and every door are feasible
+            choices = [choice for choice in exhibit_neighbors[current] if pending[choice[0]]]
+            choices += door_neighbors[current]
+            if len(choices) > 1:
+                # Avoid ant going back and forth between two nodes, unless there is no other option
+                choices = [choice for choice in choices if choice[0] != previous] or choices
+            elif not choices:
+                raise ValueError(f'Ant got stuck at node {names[current]}: no feasible neighbors left')
+
+            if len(choices) == 1:
+                next_node, _ = choices[0]
+            elif scores is not None:
+                next_node, _ = self._choose_node(choices, [scores[edge_id] for _, edge_id in choices])
+            else:
+                edges = graph[names[current]]
+                next_node, _ = self._choose_node(choices, [self._score_edge(edges[names[node]])
+                                                           for node, _ in choices])
+
+            solution.add_node(names[next_node])
+            previous, current = current, next_node
+            if pending[next_node]:
+                pending[next_node] = 0
+                n_pending -= 1
+                door_hops = 0
+            else:
+                door_hops += 1
+
+            if bounds is not None and n_pending and bounds.exceeded(door_hops, solution.cost):
+                left = [names[node] for node in np.flatnonzero(np.frombuffer(pending, dtype=np.uint8))]
+                completion, _ = bounds.complete(names[current], left)
+                if completion is None:
+                    return None
+                for node in completion:
+                    solution.add_node(node)
+                break
 
         return solution
 
-    def _remove_node_safe(self, node_list, node):
-        try:
-            node_list.remove(node)
-        except ValueError:
-            pass
-        finally:
-            return node_list
-
-    def get_unexplored_exhibits(self, solution, exhibit_and_door_graph):
-        # node_type is "exhibit" or "door"
-        available_exhibits = []
-
-        for n in exhibit_and_door_graph.nodes():
-            if exhibit_and_door_graph.nodes[n]["type"] == "exhibit" and n not in solution:
-                available_exhibits.append(n)
-
-        return available_exhibits
-
-    def get_neighbor_doors(self, exhibit_and_door_graph, current_node):
-        available_neighbours = [nb for nb in exhibit_and_door_graph.neighbors(current_node)]
-        available_doors = [n for n in available_neighbours if exhibit_and_door_graph.nodes[n]["type"] == "door"]
-        return available_doors
-
-    def get_unexplored_neighbor_exhibits(self, exhibit_and_door_graph, solution, current_node):
-        available_exhibits = [nb for nb in exhibit_and_door_graph.neighbors(current_node)
-                              if (nb not in solution and exhibit_and_door_graph.nodes[nb]["type"] == "exhibit")]
-        return available_exhibits
-
-    def _choose_destination(self, graph, solution, neighbours_of_current):
-        """
-        Returns next node to visit
-        """
-        current = solution.current
-
-        if len(neighbours_of_current) == 1:
-            return neighbours_of_current[0]
-
-        if solution.previous in neighbours_of_current:
-            # Avoid ant going back and forth between two nodes,
-            # unless there is no other option
-            self._remove_node_safe(neighbours_of_current, solution.previous)
-
-        scores = self._get_scores(graph, current, neighbours_of_current)
-        return self._choose_node(neighbours_of_current, scores)
-
-    def _get_scores(self, graph, current, destinations):
-        """
-        Return scores for the given destinations
-        """
-        scores = []
-        for node in destinations:
-            edge = graph[current][node]
-            score = self._score_edge(edge)
-            scores.append(score)
-        return scores
-
     def _choose_node(self, choices, scores):
         """
         Return one of the choices
@@ -345,3 +311,9 @@ class Colony:
 
     def get_ants(self, num_ants):
         return [Ant(**vars(self)) for i in range(num_ants)]
+
+    def get_batch_colony(self, seed=None):
+        return BatchColony(alpha=self.alpha, beta=self.beta, seed=seed)
+
+    def get_hierarchical_colony(self, graph, index=None, seed=None):
+        return HierarchicalColony(graph, index=index, alpha=self.alpha, beta=self.beta, seed=seed)
@@ -0,0 +1,171 @@
+import sys
+
+import numpy as np
+
+from aco.aco_final.solvers import CompactSolution
+
+
+class BatchColony:
+    """
+    Lock-step tour construction for a whole colony.
+
+    All ants are advanced together: the current node of every ant is kept in a vector,
+    visited exhibits in a boolean (ants x exhibits) matrix and the candidate moves are
+    gathered from the padded neighbor table of the graph, so every step of the colony is
+    a handful of NumPy operations. The transition rule is the same one used by Ant:
+    unvisited exhibits and doors are feasible, going back to the previous node is avoided
+    unless it is the only option, and the next node is drawn proportionally to
+    tau^alpha * eta^beta.
+
+    Parameters
+    ----------
+    alpha: pheromone importance.
+    beta: weight (distance) importance.
+    seed: seed of the random generator used to draw the moves.
+
+    """
+
+    def __init__(self, alpha=1, beta=3, seed=None):
+        self.alpha = alpha
+        self.beta = beta
+        self.rng = np.random.default_rng(seed)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(alpha={self.alpha}, beta={self.beta})'
+
+    def construct_tours(self, attractiveness, n_ants, start_door='D1-1', objectives=None, bounds=None):
+        """
+        Construct n_ants tours including all exhibits of the graph.
+
+        Parameters
+        ----------
+        attractiveness: AttractivenessTable with the edge scores of the current iteration.
+        n_ants: number of tours to build.
+        start_door: node where every tour starts.
+        objectives: boolean mask (by exhibit slot) of the exhibits to visit. All of them by default.
+        bounds: TourBounds of the construction (None for unbounded tours).
+
+        Returns
+        -------
+        solutions (list CompactSolution): one solution per ant.
+        """
+        engine = attractiveness.engine
+        index = engine.index
+        max_door_hops, cost_limit = (bounds.max_door_hops, bounds.cost_limit) if bounds is not None else (None, None)
+        nodes, costs, cut = self.construct_tour_arrays(index, attractiveness.scores, engine.weight,
+                                                       n_ants, index.node_index[start_door], objectives=objectives,
+                                                       max_door_hops=max_door_hops, cost_limit=cost_limit)
+        return self.solutions(index, nodes, costs, cut, bounds=bounds, objectives=objectives)
+
+    @staticmethod
+    def solutions(index, nodes, costs, cut, bounds=None, objectives=None):
+        """
+        CompactSolutions of the tours built by construct_tour_arrays, completing (or dropping) the cut ones.
+        """
+        solutions = []
+        for ant_nodes, cost, ant_cut in zip(nodes, costs, cut):
+            if ant_cut:
+                ant_nodes, cost = bounds.complete_arrays(index, ant_nodes, cost, objectives=objectives)
+                if ant_nodes is None:
+                    continue
+            solutions.append(CompactSolution(index, ant_nodes, cost))
+        return solutions
+
+    def construct_tour_arrays(self, index, scores, weight, n_ants, start, rng=None, objectives=None,
+                              max_door_hops=None, cost_limit=None):
+        """
+        Array version of construct_tours. Moves are drawn from rng (the colony generator by default).
+        Exhibits left out of objectives are treated as already visited.
+        Ants stop early (cut) after max_door_hops consecutive door moves without a new exhibit, or
+        once their cost exceeds cost_limit (see TourBounds).
+
+        Returns
+        -------
+        nodes (list int array): node ids of the tour of each ant (start included).
+        costs (float array): cost of the tour of each ant.
+        cut (bool array): ants whose tour was stopped before visiting all exhibits.
+        """
+        rng = rng if rng is not None else self.rng
+        neighbors, neighbor_edges = index.neighbor_table()
+        exhibit_slot = index.exhibit_slot
+        max_degree = neighbors.shape[1]
+
+        # Scores must be summed along a row without overflowing
+        scores = np.minimum(scores, sys.float_info.max / max(max_degree, 1))
+
+        current = np.full(n_ants, start, dtype=np.int64)
+        previous = current.copy()
+        if objectives is None:
+            visited = np.zeros((n_ants, index.n_exhibits), dtype=bool)
+        else:
+            visited = np.repeat(~np.asarray(objectives, dtype=bool)[None, :], n_ants, axis=0)
+        if exhibit_slot[start] >= 0:
+            visited[:, exhibit_slot[start]] = True
+        remaining = index.n_exhibits - visited.sum(axis=1)
+        costs = np.zeros(n_ants)
+        door_hops = np.zeros(n_ants, dtype=np.int64)
+        cut = np.zeros(n_ants, dtype=bool)
+        steps = [current.copy()]
+
+        active = np.flatnonzero(remaining > 0)
+        while active.size:
+            here = current[active]
+            candidates = neighbors[here]
+            valid = candidates >= 0
+
+            # Exhibits already visited are not feasible (doors always are)
+            slots = np.where(valid, exhibit_slot[candidates], -1)
+            is_exhibit = slots >= 0
+            seen = visited[active[:, None], np.where(is_exhibit, slots, 0)] & is_exhibit
+            valid &= ~seen
+
+            # Avoid going back and forth between two nodes, unless there is no other option
+            n_valid = valid.sum(axis=1)
+            if not n_valid.all():
+                stuck = index.node_names[here[np.argmin(n_valid)]]
+                raise ValueError(f'Ant got stuck at node {stuck}: no feasible neighbors left')
+            going_back = valid & (candidates == previous[active][:, None]) & (n_valid > 1)[:, None]
+            valid &= ~going_back
+
+            # Weighted random choice of every ant at once
+            candidate_scores = np.where(valid, scores[neighbor_edges[here]], 0.0)
+            cumulative = np.cumsum(candidate_scores, axis=1)
+            total = cumulative[:, -1]
+            draw = rng.random(active.size) * total
+            choice = (cumulative <= draw[:, None]).sum(axis=1)
+            # No pheromone at all in the feasible moves: take the last feasible neighbor
+            no_score = total == 0
+            if no_score.any():
+                choice[no_score] = max_degree - 1 - np.argmax(valid[no_score][:, ::-1], axis=1)
+            choice = np.minimum(choice, max_degree - 1)
+
+            rows = np.arange(active.size)
+            chosen = candidates[rows, choice]
+            costs[active] += weight[neighbor_edges[here, choice]]
+            previous[active] = here
+            current[active] = chosen
+
+            chosen_slots = exhibit_slot[chosen]
+            new_exhibit = chosen_slots >= 0
+            visited[active[new_exhibit], chosen_slots[new_exhibit]] = True
+            remaining[active[new_exhibit]] -= 1
+            door_hops[active] = np.where(new_exhibit, 0, door_hops[active] + 1)
+
+            step = np.full(n_ants, -1, dtype=np.int64)
+            step[active] = chosen
+            steps.append(step)
+            active = active[remaining[active] > 0]
+            if max_door_hops is not None or cost_limit is not None:
+                exceeded = np.zeros(active.size, dtype=bool)
+                if max_door_hops is not None:
+                    exceeded |= door_hops[active] >= max_door_hops
+                if cost_limit is not None:
+                    exceeded |= costs[active] > cost_limit
+                cut[active[exceeded]] = True
+                active = active[~exceeded]
+
+        # Ants finish at different steps: every ant's tour is the prefix of its column until the -1 padding
+        steps = np.stack(steps, axis=1)
+        lengths = (steps >= 0).sum(axis=1)
+        nodes = [steps[ant, :lengths[ant]] for ant in range(n_ants)]
+        return nodes, costs, cut
@@ -0,0 +1,130 @@
+import numpy as np
+
+from aco.aco_final.walking_distances import WalkingDistances
+
+
+class TourBounds:
+    """
+    Limits of the tour construction, so that the time spent on every iteration is predictable.
+
+    Doors are always feasible moves, so an ant can wander between rooms for a long time before
+    finding the last exhibits. A tour is cut when the ant has moved max_door_hops times through
+    doors without visiting a new exhibit, or when its cost exceeds cost_factor times the current
+    record. Cut tours are then either finished by walking the shortest paths to the nearest
+    pending exhibits (completion='shortest_path') or dropped (completion='abort').
+
+    Parameters
+    ----------
+    graph: door graph whose edges hold 'weight' and 'room' attributes.
+    max_door_hops: consecutive moves through doors without a new exhibit allowed (None for no limit).
+    cost_factor: maximum cost of a tour, as a multiple of the current record (None for no limit).
+    completion: 'shortest_path' or 'abort'.
+
+    """
+
+    def __init__(self, graph, max_door_hops=None, cost_factor=None, completion='shortest_path'):
+        if completion not in ('shortest_path', 'abort'):
+            raise ValueError(f"completion must be 'shortest_path' or 'abort', not {completion!r}")
+        self.graph = graph
+        self.max_door_hops = max_door_hops
+        self.cost_factor = cost_factor
+        self.completion = completion
+        # Cost limit of the tours of the current iteration (see update)
+        self.cost_limit = None
+        # Tours cut and dropped since the bounds were created
+        self.n_cut = 0
+        self.n_aborted = 0
+        self._distances = None
+
+    def __repr__(self):
+        return (f'{self.__class__.__name__}(max_door_hops={self.max_door_hops}, cost_factor={self.cost_factor}, '
+                f'completion={self.completion!r})')
+
+    @property
+    def settings(self):
+        return self.max_door_hops, self.cost_factor, self.completion
+
+    @property
+    def distances(self):
+        """
+        WalkingDistances of the graph, built the first time a tour has to be completed.
+        """
+        if self._distances is None:
+            self._distances = WalkingDistances.from_graph(self.graph)
+        return self._distances
+
+    def graph_changed(self):
+        self._distances = None
+
+    def update(self, record):
+        """
+        Sets the cost limit of the next iteration from the current record (a solution or None).
+        """
+        self.cost_limit = None if self.cost_factor is None or record is None else self.cost_factor * record.cost
+
+    def exceeded(self, door_hops, cost):
+        return ((self.max_door_hops is not None and door_hops >= self.max_door_hops) or
+                (self.cost_limit is not None and cost > self.cost_limit))
+
+    def complete(self, current, pending):
+        """
+        Finishes a cut tour, visiting the pending exhibits in nearest neighbor order through shortest paths.
+
+        Parameters
+        ----------
+        current: node where the tour was cut.
+        pending: exhibits still to be visited.
+
+        Returns
+        -------
+        nodes (list): nodes visited after current, or None if the tour must be dropped.
+        cost (float): cost of the completion.
+        """
+        self.n_cut += 1
+        if self.completion == 'abort':
+            self.n_aborted += 1
+            return None, np.inf
+
+        pending = list(pending)
+        distances = self.distances.matrix([current] + pending)
+        position = 0
+        left = np.ones(len(pending) + 1, dtype=bool)
+        left[0] = False
+        order = []
+        cost = 0.0
+        while left.any():
+            candidates = np.flatnonzero(left)
+            nearest = candidates[np.argmin(distances[position, candidates])]
+            cost += distances[position, nearest]
+            order.append(nearest)
+            left[nearest] = False
+            position = nearest
+
+        nodes = []
+        names = [current] + pending
+        previous = current
+        for position in order:
+            nodes += self.distances.path(previous, names[position])[1:]
+            previous = names[position]
+        return nodes, cost
+
+    def complete_arrays(self, index, nodes, cost, objectives=None):
+        """
+        complete for the node id tours of the array constructors. Pending exhibits are the
+        objectives (boolean mask by exhibit slot, all exhibits by default) not in nodes.
+
+        Returns
+        -------
+        nodes (int array): the whole tour, or None if it must be dropped.
+        cost (float): cost of the whole tour.
+        """
+        pending = index.is_exhibit.copy()
+        if objectives is not None:
+            pending[index.is_exhibit] = objectives
+        pending[nodes] = False
+        names = [index.node_names[n] for n in np.flatnonzero(pending)]
+        completion, completion_cost = self.complete(index.node_names[nodes[-1]], names)
+        if completion is None:
+            return None, np.inf
+        completion = np.array([index.node_index[n] for n in completion], dtype=np.int64)
+        return np.concatenate([nodes, completion]), cost + completion_cost
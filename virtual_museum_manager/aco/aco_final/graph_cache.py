@@ -0,0 +1,145 @@
+import hashlib
+import json
+import os
+import tempfile
+
+import networkx as nx
+import numpy as np
+
+from aco.aco_final.MuseumGraphManager import MuseumGraphManager
+from utils.utils import get_project_root
+
+# Bump when the compiled format (or the way graphs are built) changes, so old files are not used
+CACHE_VERSION = 2
+
+DEFAULT_CACHE_DIR = os.path.join(get_project_root(), '.graph_cache')
+
+
+class GraphCache:
+    """
+    Persistent cache of compiled museum graphs.
+
+    Graphs are keyed by a hash of the content of the rooms map (space.json), the grid
+    dimensions, the rooms subset and the sparsification, so any change of the floorplan is a cache miss and the
+    graph is built again. Every entry is a .npz file with the compiled door graph
+    (MuseumGraphManager.door_arrays: node names, types, rooms and locations, edge node ids,
+    weights and rooms) and the room graph. Loading an entry skips the processing of the
+    rooms map, only the networkx door graph is built (in bulk) from the stored arrays.
+
+    Parameters
+    ----------
+    cache_dir: directory of the cache files (virtual_museum_manager/.graph_cache by default).
+
+    """
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir if cache_dir is not None else DEFAULT_CACHE_DIR
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(cache_dir={self.cache_dir!r})'
+
+    @staticmethod
+    def key(rooms_map, grid_dimensions=[100, 70], rooms_subset=None, sparsify=None):
+        if isinstance(sparsify, dict):
+            sparsify = sorted(sparsify.items())
+        content = json.dumps({'version': CACHE_VERSION,
+                              'rooms': rooms_map,
+                              'grid_dimensions': list(grid_dimensions),
+                              'rooms_subset': sorted(rooms_subset) if rooms_subset is not None else None,
+                              'sparsify': sparsify},
+                             sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, f'{key}.npz')
+
+    def get_manager(self, rooms_map, rooms_subset=None, grid_dimensions=[100, 70], sparsify=None):
+        """
+        Returns the MuseumGraphManager of the rooms map, loading it from the cache if it has already been built.
+        """
+        key = self.key(rooms_map, grid_dimensions, rooms_subset, sparsify)
+        manager = self.load(key, grid_dimensions)
+        if manager is None:
+            manager = MuseumGraphManager(rooms_map, rooms_subset=rooms_subset, grid_dimensions=grid_dimensions,
+                                         sparsify=sparsify)
+            self.store(key, manager)
+        return manager
+
+    def load(self, key, grid_dimensions=[100, 70]):
+        """
+        Loads a cached manager. Returns None if there is no (valid) cache file for the key.
+        """
+        path = self.path(key)
+        if not os.path.isfile(path):
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                door_arrays = {'node_names': data['node_names'].tolist(),
+                               'node_type': data['node_type'].tolist(),
+                               'node_room': data['node_room'],
+                               'node_location': data['node_location'],
+                               'edge_nodes': data['edge_nodes'],
+                               'edge_weight': data['edge_weight'],
+                               'edge_room': data['edge_room'],
+                               'n_doors_per_room': json.loads(str(data['n_doors_per_room']))}
+                room_graph = self._decode_graph(str(data['room_graph']))
+                sparsification_report = json.loads(str(data['sparsification_report']))
+        except (OSError, KeyError, ValueError) as e:
+            print(f"Ignoring invalid graph cache file {path}: {e!r}")
+            return None
+        manager = MuseumGraphManager.from_compiled(door_arrays, room_graph, grid_dimensions=grid_dimensions)
+        manager.sparsification_report = sparsification_report
+        return manager
+
+    def store(self, key, manager):
+        """
+        Writes the compiled graphs of the manager. The file is written atomically, so concurrent
+        readers never see a partial file.
+        """
+        arrays = manager.door_arrays
+        os.makedirs(self.cache_dir, exist_ok=True)
+        room_graph = self._encode_graph(manager.room_graph)
+
+        fd, tmp_path = tempfile.mkstemp(suffix='.npz', dir=self.cache_dir)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f,
+                         node_names=np.array(arrays['node_names'], dtype=str),
+                         node_type=np.array(arrays['node_type'], dtype=str),
+                         node_room=arrays['node_room'],
+                         node_location=arrays['node_location'],
+                         edge_nodes=arrays['edge_nodes'],
+                         edge_weight=arrays['edge_weight'],
+                         edge_room=arrays['edge_room'],
+                         n_doors_per_room=np.array(json.dumps(arrays['n_doors_per_room'])),
+                         room_graph=np.array(room_graph),
+                         sparsification_report=np.array(json.dumps(manager.sparsification_report)))
+            os.replace(tmp_path, self.path(key))
+        except OSError as e:
+            # The cache is only an optimization: failing to write it must not stop the model
+            print(f"Could not write graph cache file: {e!r}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    @staticmethod
+    def _encode_graph(graph):
+        # Nodes and edges in iteration order, so the decoded graph iterates in the same order
+        return json.dumps({'nodes': list(graph.nodes(data=True)), 'edges': list(graph.edges(data=True))})
+
+    @staticmethod
+    def _decode_graph(content):
+        content = json.loads(content)
+        graph = nx.Graph()
+        graph.add_nodes_from((node, attributes) for node, attributes in content['nodes'])
+        graph.add_edges_from((u, v, attributes) for u, v, attributes in content['edges'])
+        return graph
+
+    def clear(self):
+        """
+        Removes every cache file.
+        """
+        if not os.path.isdir(self.cache_dir):
+            return
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.npz'):
+                os.remove(os.path.join(self.cache_dir, name))
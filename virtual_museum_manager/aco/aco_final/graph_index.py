@@ -0,0 +1,173 @@
+import numpy as np
+
+
+class GraphIndex:
+    """
+    Integer view of a museum door graph.
+
+    Nodes and edges are numbered following networkx iteration order, so that
+    per-edge attributes (pheromone, weight...) can be stored in contiguous
+    NumPy arrays and addressed by edge id instead of through attribute dicts.
+
+    Parameters
+    ----------
+    graph: networkx graph (usually MuseumGraphManager.door_graph)
+
+    """
+
+    # Values of node_type
+    DOOR = 0
+    EXHIBIT = 1
+
+    def __init__(self, graph):
+        self.node_names = list(graph.nodes())
+        self.node_index = {name: idx for idx, name in enumerate(self.node_names)}
+
+        edges = list(graph.edges())
+        self.edge_nodes = np.array([(self.node_index[u], self.node_index[v]) for u, v in edges],
+                                   dtype=np.int64).reshape(-1, 2)
+
+        # Undirected graph: both orientations of an edge map to the same id
+        self.edge_index = {}
+        for edge_id, (u, v) in enumerate(edges):
+            self.edge_index[(u, v)] = edge_id
+            self.edge_index[(v, u)] = edge_id
+
+        # Exhibits are numbered separately (slot) so that visited exhibits fit in a boolean matrix
+        self.is_exhibit = np.array([graph.nodes[n].get('type') == 'exhibit' for n in self.node_names], dtype=bool)
+        self.exhibit_slot = np.full(self.n_nodes, -1, dtype=np.int64)
+        self.exhibit_slot[self.is_exhibit] = np.arange(np.count_nonzero(self.is_exhibit))
+        self.exhibit_ids = np.flatnonzero(self.is_exhibit)
+        self.node_type = np.where(self.is_exhibit, self.EXHIBIT, self.DOOR).astype(np.int8)
+        self.node_room = np.array([graph.nodes[n].get('room', -1) for n in self.node_names], dtype=np.int64)
+        # One byte per node (1 for exhibits): ants start every tour from a copy of it (bytearray)
+        self.exhibit_bitmask = self.is_exhibit.astype(np.uint8).tobytes()
+
+        # Sorted (min(u, v), max(u, v)) keys of the edges, to look up edge ids of node id pairs in bulk
+        low, high = self.edge_nodes.min(axis=1), self.edge_nodes.max(axis=1)
+        keys = low * self.n_nodes + high
+        order = np.argsort(keys)
+        self._pair_keys = keys[order]
+        self._pair_edge_ids = order
+
+        self._neighbor_table = None
+        self._typed_neighbors = None
+
+    @classmethod
+    def of(cls, graph):
+        """
+        GraphIndex published in the graph (graph.graph['index'], see MuseumGraphManager).
+        One is built and published if the graph has none, or if it does not match the graph
+        (edge count or node names, which also catches a node replaced by another one).
+        """
+        index = graph.graph.get('index')
+        if index is None or index.n_edges != graph.number_of_edges() or index.node_names != list(graph):
+            index = cls.publish(graph)
+        return index
+
+    @classmethod
+    def publish(cls, graph):
+        """
+        Builds the index of the graph and publishes it in graph.graph['index'].
+        """
+        index = graph.graph['index'] = cls(graph)
+        return index
+
+    @property
+    def n_nodes(self):
+        return len(self.node_names)
+
+    @property
+    def n_edges(self):
+        return len(self.edge_nodes)
+
+    @property
+    def n_exhibits(self):
+        return int(np.count_nonzero(self.is_exhibit))
+
+    def neighbor_table(self):
+        """
+        Padded adjacency of the graph.
+
+        Returns
+        -------
+        neighbors (N x max_degree int array): neighbor node ids of every node, padded with -1.
+        neighbor_edges (N x max_degree int array): id of the edge leading to each neighbor, padded with -1.
+        """
+        if self._neighbor_table is None:
+            degree = np.bincount(self.edge_nodes.ravel(), minlength=self.n_nodes)
+            max_degree = int(degree.max()) if self.n_nodes else 0
+            neighbors = np.full((self.n_nodes, max_degree), -1, dtype=np.int64)
+            neighbor_edges = np.full((self.n_nodes, max_degree), -1, dtype=np.int64)
+            filled = np.zeros(self.n_nodes, dtype=np.int64)
+            for edge_id, (u, v) in enumerate(self.edge_nodes):
+                neighbors[u, filled[u]], neighbor_edges[u, filled[u]] = v, edge_id
+                neighbors[v, filled[v]], neighbor_edges[v, filled[v]] = u, edge_id
+                filled[u] += 1
+                filled[v] += 1
+            self._neighbor_table = neighbors, neighbor_edges
+        return self._neighbor_table
+
+    def typed_neighbors(self):
+        """
+        Neighbors of every node split by type, for the ants' inner loop.
+
+        Returns
+        -------
+        door_neighbors (list): for every node id, list of (neighbor door id, edge id) pairs.
+        exhibit_neighbors (list): for every node id, list of (neighbor exhibit id, edge id) pairs.
+        """
+        if self._typed_neighbors is None:
+            door_neighbors = [[] for _ in range(self.n_nodes)]
+            exhibit_neighbors = [[] for _ in range(self.n_nodes)]
+            is_exhibit = self.is_exhibit.tolist()
+            for edge_id, (u, v) in enumerate(self.edge_nodes.tolist()):
+                (exhibit_neighbors if is_exhibit[v] else door_neighbors)[u].append((v, edge_id))
+                (exhibit_neighbors if is_exhibit[u] else door_neighbors)[v].append((u, edge_id))
+            self._typed_neighbors = door_neighbors, exhibit_neighbors
+        return self._typed_neighbors
+
+    def edge_id(self, u, v):
+        return self.edge_index[(u, v)]
+
+    def edge_ids(self, edges):
+        """
+        Returns the ids of the specified (u, v) edges as an int array.
+        """
+        return np.fromiter((self.edge_index[edge] for edge in edges), dtype=np.int64)
+
+    def pair_edge_ids(self, u_ids, v_ids):
+        """
+        Vectorized edge lookup: returns the ids of the edges (u_ids[i], v_ids[i]) in any orientation.
+        Raises KeyError if some pair is not an edge of the graph (as edge_id).
+        """
+        u_ids, v_ids = np.asarray(u_ids, dtype=np.int64), np.asarray(v_ids, dtype=np.int64)
+        keys = np.minimum(u_ids, v_ids) * self.n_nodes + np.maximum(u_ids, v_ids)
+        # Keys past the last edge (or any key, without edges) land out of bounds: clip them and let the check fail
+        positions = np.minimum(np.searchsorted(self._pair_keys, keys), max(len(self._pair_keys) - 1, 0))
+        found = self._pair_keys[positions] == keys if len(self._pair_keys) else np.zeros(keys.shape, dtype=bool)
+        if not found.all():
+            missing = np.flatnonzero(~found.ravel())[0]
+            u, v = u_ids.ravel()[missing], v_ids.ravel()[missing]
+            raise KeyError(f'No edge between nodes {u} and {v} in the graph index')
+        return self._pair_edge_ids[positions]
+
+    def edge_name(self, edge_id):
+        u, v = self.edge_nodes[edge_id]
+        return self.node_names[u], self.node_names[v]
+
+    def read_edge_attribute(self, graph, attribute):
+        """
+        Copies the given edge attribute of the graph into a float array indexed by edge id.
+        """
+        values = np.empty(self.n_edges, dtype=np.float64)
+        for edge_id, (u, v) in enumerate(self.edge_nodes):
+            values[edge_id] = graph[self.node_names[u]][self.node_names[v]][attribute]
+        return values
+
+    def write_edge_attribute(self, graph, attribute, values):
+        """
+        Writes the array of values (indexed by edge id) back into the graph edges.
+        """
+        for edge_id, (u, v) in enumerate(self.edge_nodes):
+            graph[self.node_names[u]][self.node_names[v]][attribute] = float(values[edge_id])
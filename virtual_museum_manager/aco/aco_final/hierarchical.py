@@ -0,0 +1,202 @@
+import bisect
+import random
+
+import networkx as nx
+import numpy as np
+
+from aco.aco_final.solvers import CompactSolution
+from aco.aco_final.subproblems import RoomSubproblems
+
+
+class HierarchicalSolution(CompactSolution):
+    """
+    CompactSolution of a tour built by HierarchicalColony, with the (room, next room)
+    transitions the ant chose, used by the room pheromone update.
+    """
+
+    __slots__ = ('room_transitions',)
+
+    def __init__(self, index, nodes, cost, room_transitions):
+        super().__init__(index, nodes, cost)
+        self.room_transitions = room_transitions
+
+
+class HierarchicalColony:
+    """
+    Two-level tour construction.
+
+    Ants choose a room visiting order with a room-level pheromone matrix: at every room the
+    next room (and the door leading to it) is drawn proportionally to
+    tau(room, next)^alpha * eta^beta, where eta favours doors close to the entry door and rooms
+    close (in number of rooms) to a room with exhibits still to be visited.
+    The first time a room with exhibits is crossed its exhibits are visited in the best order
+    between the entry and exit doors, taken from the RoomSubproblems cache, so building a tour
+    costs a few operations per room and not per exhibit.
+
+    Parameters
+    ----------
+    graph: door graph whose edges hold 'weight' and 'room' attributes.
+    index: GraphIndex of the graph (the one of the pheromone engine, if any).
+    alpha: room pheromone importance.
+    beta: heuristic importance.
+    seed: seed of the random generator used to draw the rooms.
+    exact_limit: maximum number of exhibits of a room ordered exactly (see RoomSubproblems).
+
+    """
+
+    initial_pheromone = 0.9
+
+    def __init__(self, graph, index=None, alpha=1, beta=3, seed=None, exact_limit=10):
+        self.alpha = alpha
+        self.beta = beta
+        self.rng = random.Random(seed)
+        self.subproblems = RoomSubproblems(graph, index=index, exact_limit=exact_limit)
+        self.index = self.subproblems.index
+
+        self.rooms = sorted(self.subproblems.room_exhibits)
+        self.room_position = {room: position for position, room in enumerate(self.rooms)}
+        # Doors leading out of every room, as (door, next room)
+        self.exits = {room: [] for room in self.rooms}
+        room_graph = nx.Graph()
+        room_graph.add_nodes_from(self.rooms)
+        for room in self.rooms:
+            for door in self.subproblems.room_doors[room].tolist():
+                for other in self.subproblems.node_rooms[door] - {room}:
+                    self.exits[room].append((door, other))
+                    room_graph.add_edge(room, other)
+
+        # Number of rooms between every pair of rooms
+        n_rooms = len(self.rooms)
+        self.hops = np.full((n_rooms, n_rooms), np.inf)
+        for room, lengths in nx.all_pairs_shortest_path_length(room_graph):
+            for other, length in lengths.items():
+                self.hops[self.room_position[room], self.room_position[other]] = length
+
+        self.pheromone = np.full((n_rooms, n_rooms), self.initial_pheromone)
+        self._options = {}
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(n_rooms={len(self.rooms)}, alpha={self.alpha}, beta={self.beta})'
+
+    def remap(self, graph, index=None):
+        """
+        Colony for a changed graph (see State.graph_changed), keeping the room pheromone of the
+        rooms that are still in the graph and the random generator.
+        """
+        colony = self.__class__(graph, index=index, alpha=self.alpha, beta=self.beta,
+                                exact_limit=self.subproblems.exact_limit)
+        colony.rng = self.rng
+        kept = [room for room in colony.rooms if room in self.room_position]
+        new_positions = [colony.room_position[room] for room in kept]
+        old_positions = [self.room_position[room] for room in kept]
+        colony.pheromone[np.ix_(new_positions, new_positions)] = self.pheromone[np.ix_(old_positions, old_positions)]
+        return colony
+
+    def construct_tours(self, n_ants, start_room=1, start_door='D1-1', objectives=None):
+        """
+        Construct n_ants tours including all exhibits of the graph.
+        If objectives (boolean mask by exhibit slot) is specified, only the rooms with some
+        of those exhibits are visited (rooms are visited as a whole).
+
+        Returns
+        -------
+        solutions (list HierarchicalSolution): one solution per ant.
+        """
+        start = self.index.node_index[start_door]
+        if start_room not in self.subproblems.node_rooms[start]:
+            start_room = min(self.subproblems.node_rooms[start])
+
+        if objectives is None:
+            pending = np.array([len(self.subproblems.room_exhibits[room]) > 0 for room in self.rooms])
+        else:
+            slots = self.index.exhibit_slot
+            pending = np.array([bool(objectives[slots[self.subproblems.room_exhibits[room]]].any())
+                                for room in self.rooms])
+        unreachable = pending & ~np.isfinite(self.hops[self.room_position[start_room]])
+        if unreachable.any():
+            rooms = [self.rooms[p] for p in np.flatnonzero(unreachable)]
+            raise ValueError(f'Rooms {rooms} cannot be reached from room {start_room}')
+
+        return [self._construct_tour(start_room, start, pending.copy()) for _ in range(n_ants)]
+
+    def _construct_tour(self, room, entry, pending):
+        segments = [np.array([entry], dtype=np.int64)]
+        transitions = []
+        cost = 0.0
+        n_pending = int(pending.sum())
+
+        while n_pending:
+            position = self.room_position[room]
+            room_pending = pending[position]
+            if room_pending and n_pending == 1:
+                # Last room: the tour ends at its last exhibit
+                nodes, segment_cost = self.subproblems.solve(room, entry)
+                segments.append(nodes)
+                cost += segment_cost
+                break
+
+            door, next_room = self._choose_exit(room, entry, room_pending, pending)
+            if room_pending:
+                nodes, segment_cost = self.subproblems.solve(room, entry, door)
+                pending[position] = False
+                n_pending -= 1
+            else:
+                # Just crossing the room
+                nodes, segment_cost = self.subproblems.crossing(room, entry, door)
+            segments.append(nodes)
+            cost += segment_cost
+            transitions.append((room, next_room))
+            room, entry = next_room, door
+
+        return HierarchicalSolution(self.index, np.concatenate(segments), cost, transitions)
+
+    def _choose_exit(self, room, entry, room_pending, pending):
+        options, next_positions, eta_distance = self._exit_options(room, entry, room_pending)
+
+        # Rooms to go through before reaching a room with exhibits still to be visited
+        hops = np.where(pending[next_positions], 0, self.hops[next_positions][:, pending].min(axis=1))
+        eta = eta_distance / (1 + hops)
+        scores = (self.pheromone[self.room_position[room], next_positions] ** self.alpha) * (eta ** self.beta)
+
+        cumulative = np.cumsum(scores)
+        if cumulative[-1] <= 0:
+            return options[0]
+        choice = bisect.bisect(cumulative, self.rng.random() * cumulative[-1])
+        return options[min(choice, len(options) - 1)]
+
+    def _exit_options(self, room, entry, room_pending):
+        """
+        Exits that can be taken from the room after entering through entry (cached):
+        options as (door, next room), positions of the next rooms and distance part of eta.
+        """
+        key = (room, entry, room_pending)
+        cached = self._options.get(key)
+        if cached is None:
+            options = self.exits[room]
+            if not room_pending and len(options) > 1:
+                # Just crossing the room: do not leave through the same door
+                options = [option for option in options if option[0] != entry] or options
+            next_positions = np.array([self.room_position[next_room] for _, next_room in options], dtype=np.int64)
+            eta_distance = np.array([1.0 / (1 + self.subproblems.distance(room, entry, door)) for door, _ in options])
+            cached = self._options[key] = options, next_positions, eta_distance
+        return cached
+
+    def room_transitions(self, solution):
+        """
+        (room, next room) transitions of a tour built by this colony.
+        """
+        if not isinstance(solution, HierarchicalSolution):
+            raise TypeError(f'Room transitions are only known for tours built by {self.__class__.__name__}, '
+                            f'got {solution!r}')
+        return solution.room_transitions
+
+    def update(self, best_solution, rho, lower_bound, upper_bound):
+        """
+        MMAS update of the room pheromone: evaporation, deposit on the room transitions of the
+        best solution and trail limits.
+        """
+        self.pheromone *= (1 - rho)
+        transitions = set(self.room_transitions(best_solution))
+        for room, next_room in transitions:
+            self.pheromone[self.room_position[room], self.room_position[next_room]] += 1.0 / best_solution.cost
+        np.clip(self.pheromone, lower_bound, upper_bound, out=self.pheromone)
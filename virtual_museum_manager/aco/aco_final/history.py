@@ -0,0 +1,256 @@
+import bisect
+import weakref
+import zlib
+
+import numpy as np
+
+from aco.aco_final.graph_index import GraphIndex
+from aco.aco_final.solvers import CompactSolution
+
+
+class _Layout:
+    """
+    Graph structure shared by consecutive checkpoints (index and a copy of the graph).
+    """
+
+    def __init__(self, graph, index):
+        self.graph = graph.copy()
+        self.index = index
+
+
+class Checkpoint:
+    """
+    Scalars, best record and compressed pheromone delta of the algorithm state at a given point.
+    """
+
+    __slots__ = ('sequence', 'current_iteration', 'limit', 'current_lower_bound', 'current_upper_bound',
+                 'best_iteration', 'record', 'layout', 'delta', 'standalone')
+
+    # State attributes exposed by StateSnapshot
+    FIELDS = ('current_iteration', 'limit', 'current_lower_bound', 'current_upper_bound', 'best_iteration', 'record')
+
+    def __init__(self, sequence, state, record, layout, delta):
+        self.sequence = sequence
+        self.current_iteration = state.current_iteration
+        self.limit = state.limit
+        self.current_lower_bound = state.current_lower_bound
+        self.current_upper_bound = state.current_upper_bound
+        self.best_iteration = state.best_iteration
+        self.record = record
+        self.layout = layout
+        self.delta = delta
+        # True once evicted from the store: delta is then the whole vector (against zeros)
+        self.standalone = False
+
+
+class StateSnapshot:
+    """
+    Read-only view of a stored checkpoint. Exposes the same attributes as State
+    (graph, bounds, limit, record...), the graph being rebuilt on first access.
+
+    Pickled snapshots are standalone: they hold the graph, pheromone vector and attributes
+    of the checkpoint, not the store.
+    """
+
+    def __init__(self, store, checkpoint):
+        self._store = store
+        self._checkpoint = checkpoint
+        self._graph = None
+        self._standalone = None
+        store._views.add(self)
+
+    def __getattr__(self, name):
+        # Private names are never forwarded (they may not be set yet, e.g. while unpickling)
+        if name.startswith('_'):
+            raise AttributeError(name)
+        if self._standalone is not None:
+            if name in self._standalone:
+                return self._standalone[name]
+            raise AttributeError(name)
+        return getattr(self._checkpoint, name)
+
+    def __getstate__(self):
+        state = {name: getattr(self, name) for name in Checkpoint.FIELDS}
+        state.update(graph=self.graph, pheromone=self.pheromone, index=self.index)
+        return state
+
+    def __setstate__(self, state):
+        self._store = None
+        self._checkpoint = None
+        self._graph = state['graph']
+        self._standalone = state
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(iteration={self.current_iteration})'
+
+    @property
+    def pheromone(self):
+        if self._standalone is not None:
+            return self._standalone['pheromone'].copy()
+        return self._store.pheromone(self._checkpoint)
+
+    @property
+    def index(self):
+        if self._standalone is not None:
+            return self._standalone['index']
+        return self._checkpoint.layout.index
+
+    @property
+    def graph(self):
+        if self._graph is None:
+            layout = self._checkpoint.layout
+            self._graph = layout.graph.copy()
+            layout.index.write_edge_attribute(self._graph, 'pheromone', self.pheromone)
+        return self._graph
+
+
+class SnapshotStore:
+    """
+    History of the algorithm states.
+
+    Instead of deep copies of the whole State, every checkpoint keeps the scalar bounds,
+    the best record (as a CompactSolution) and the pheromone vector, stored as a compressed
+    delta (XOR of the float bits) against the previous checkpoint. Any checkpoint can be
+    accessed (store[i]), rebuilding its pheromone vector from the deltas.
+
+    Retention policy: when keep_last is set only the last keep_last checkpoints are kept,
+    plus (if log_spaced) the checkpoints whose sequence number is a power of two.
+    Evicted deltas are merged into the next checkpoint, so the remaining ones stay exact.
+    Evicted checkpoints that a snapshot still refers to keep their whole vector instead.
+
+    Parameters
+    ----------
+    keep_last: number of most recent checkpoints to keep (None keeps all of them).
+    log_spaced: also keep log-spaced checkpoints (1st, 2nd, 4th, 8th...).
+
+    """
+
+    def __init__(self, keep_last=None, log_spaced=False):
+        self.keep_last = keep_last
+        self.log_spaced = log_spaced
+        self.checkpoints = []
+        # Sequence numbers of the checkpoints (sorted), to find them by bisection
+        self._sequences = []
+        self._sequence = 0
+        # Live snapshots, whose checkpoints must stay readable once evicted
+        self._views = weakref.WeakSet()
+        self._last_vector = None
+        self._cache = None
+
+    def __len__(self):
+        return len(self.checkpoints)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [StateSnapshot(self, checkpoint) for checkpoint in self.checkpoints[item]]
+        return StateSnapshot(self, self.checkpoints[item])
+
+    def __iter__(self):
+        return (StateSnapshot(self, checkpoint) for checkpoint in self.checkpoints)
+
+    def __bool__(self):
+        return bool(self.checkpoints)
+
+    def record(self, state):
+        """
+        Adds a checkpoint of the specified State.
+        """
+        if state.engine is not None:
+            index = state.engine.index
+            vector = state.engine.pheromone.copy()
+        else:
+            # Same index object as the previous checkpoint while the graph is unchanged (the
+            # manager publishes a new one on every change of the museum)
+            index = GraphIndex.of(state.graph)
+            vector = index.read_edge_attribute(state.graph, 'pheromone')
+
+        previous = self.checkpoints[-1].layout if self.checkpoints else None
+        if previous is not None and previous.index is index:
+            layout = previous
+            base = self._last_vector
+        else:
+            # New graph structure: delta against zeros (i.e. the whole vector)
+            layout = _Layout(state.graph, index)
+            base = np.zeros_like(vector)
+
+        record = state.record
+        if record is not None and not isinstance(record, CompactSolution):
+            record = CompactSolution.from_solution(record, index)
+
+        self._sequence += 1
+        self.checkpoints.append(Checkpoint(self._sequence, state, record, layout, self._encode(base, vector)))
+        self._sequences.append(self._sequence)
+        self._last_vector = vector
+        self._apply_retention()
+
+    def pheromone(self, checkpoint):
+        """
+        Rebuilds the pheromone vector of the specified checkpoint.
+        """
+        if self._cache is not None and self._cache[0] is checkpoint:
+            return self._cache[1].copy()
+        if checkpoint.standalone:
+            return self._decode(np.zeros(checkpoint.layout.index.n_edges, dtype=np.float64), checkpoint.delta)
+
+        position = bisect.bisect_left(self._sequences, checkpoint.sequence)
+        if position == len(self.checkpoints) or self.checkpoints[position] is not checkpoint:
+            raise ValueError(f'Checkpoint {checkpoint.sequence} does not belong to this store')
+        # Walk back to the first checkpoint of this layout (stored against zeros)
+        first = position
+        while first > 0 and self.checkpoints[first - 1].layout is checkpoint.layout:
+            first -= 1
+        vector = np.zeros(checkpoint.layout.index.n_edges, dtype=np.float64)
+        for cp in self.checkpoints[first:position + 1]:
+            vector = self._decode(vector, cp.delta)
+
+        self._cache = checkpoint, vector
+        return vector.copy()
+
+    def _apply_retention(self):
+        if self.keep_last is None:
+            return
+        n_checkpoints = len(self.checkpoints)
+        keep = [position >= n_checkpoints - self.keep_last or
+                (self.log_spaced and self._is_power_of_two(cp.sequence))
+                for position, cp in enumerate(self.checkpoints)]
+
+        viewed = {view._checkpoint for view in self._views}
+        for position in reversed(range(n_checkpoints)):
+            if keep[position]:
+                continue
+            evicted = self.checkpoints[position]
+            delta = evicted.delta
+            if evicted in viewed:
+                # Whole vector, computed before the delta is merged into the next checkpoint
+                evicted.delta = self._compress(self.pheromone(evicted).view(np.uint64))
+                evicted.standalone = True
+            del self.checkpoints[position]
+            del self._sequences[position]
+            following = self.checkpoints[position] if position < len(self.checkpoints) else None
+            if following is not None and following.layout is evicted.layout:
+                following.delta = self._merge(delta, following.delta)
+        self._cache = None
+
+    @staticmethod
+    def _is_power_of_two(n):
+        return n & (n - 1) == 0
+
+    @staticmethod
+    def _compress(bits):
+        # Byte shuffle: bytes of the same significance together compress much better
+        shuffled = np.ascontiguousarray(bits.view(np.uint8).reshape(-1, 8).T)
+        return zlib.compress(shuffled.tobytes())
+
+    @staticmethod
+    def _decompress(data):
+        shuffled = np.frombuffer(zlib.decompress(data), dtype=np.uint8).reshape(8, -1)
+        return np.ascontiguousarray(shuffled.T).view(np.uint64).ravel()
+
+    def _encode(self, base, vector):
+        return self._compress(base.view(np.uint64) ^ vector.view(np.uint64))
+
+    def _decode(self, base, delta):
+        return (base.view(np.uint64) ^ self._decompress(delta)).view(np.float64)
+
+    def _merge(self, first, second):
+        return self._compress(self._decompress(first) ^ self._decompress(second))
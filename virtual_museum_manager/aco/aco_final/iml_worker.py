@@ -0,0 +1,124 @@
+import queue
+import threading
+import time
+
+
+class ImlSolverWorker:
+    """
+    Runs the iML (interactive MMAS) training of an AlgorithmController in a background thread.
+
+    Visitor feedback edges are enqueued without blocking (submit_feedback). The worker
+    applies the manual pheromone updates and runs the next iterations on its own thread,
+    so the Tornado request handlers never wait for the solver. Feedback received while an
+    update is running is applied in a single round. After every round the best route is
+    published as a new dict (best_route), which handlers can read at any time.
+    If the controller has not been trained yet, the worker starts with its initial iterations.
+    Errors of a training round are logged and the worker keeps waiting for feedback.
+
+    Parameters
+    ----------
+    controller: AlgorithmController to train.
+    iterations_per_feedback: iterations computed after every round of feedback.
+    multiplier: manual pheromone multiplier applied to every feedback edge.
+    max_pending: maximum number of feedback edges waiting in the queue.
+
+    """
+
+    def __init__(self, controller, iterations_per_feedback=15, multiplier=250, max_pending=1000):
+        self.controller = controller
+        self.iterations_per_feedback = iterations_per_feedback
+        self.multiplier = multiplier
+
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = None
+        self._best_route = None
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(iterations_per_feedback={self.iterations_per_feedback})'
+
+    @property
+    def best_route(self):
+        """
+        Latest best route: {'cost', 'path', 'iteration', 'timestamp'} or None if nothing has been computed yet.
+        The dict is replaced as a whole on every publication, so readers never see a half-updated route.
+        """
+        return self._best_route
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._thread = threading.Thread(target=self._run, name='iml-solver-worker', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        if not self.running:
+            return
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def submit_feedback(self, edge):
+        """
+        Enqueues a feedback edge (u, v). Never blocks: returns False if the queue is full.
+        """
+        try:
+            self._queue.put_nowait(tuple(edge))
+            return True
+        except queue.Full:
+            print(f"iML feedback queue full, edge discarded: {edge}")
+            return False
+
+    def _run(self):
+        if self.controller.state is None:
+            # Usual warm-up of the controller (compute_initial_iterations default)
+            self._compute(self.controller.compute_initial_iterations)
+
+        while True:
+            edge = self._queue.get()
+            if edge is None:
+                return
+
+            # Apply every pending feedback edge before running a single round of iterations
+            edges = [edge]
+            while True:
+                try:
+                    edge = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if edge is None:
+                    self._train(edges)
+                    return
+                edges.append(edge)
+            self._train(edges)
+
+    def _train(self, edges):
+        for edge in edges:
+            try:
+                self.controller.manual_pheromone_update(edge, multiplier=self.multiplier)
+            except KeyError:
+                # Bad feedback (an edge that is not in the graph) must not stop the worker
+                print(f"iML worker discarded unknown feedback edge: {edge}")
+        if self.controller.state is None:
+            # The initial training failed: retry it (the feedback is already in the graph)
+            self._compute(self.controller.compute_initial_iterations)
+        else:
+            self._compute(self.controller.compute_next_iterations, limit=self.iterations_per_feedback)
+
+    def _compute(self, method, **kwargs):
+        # A failed training round must not stop the worker: the next feedback triggers a new one
+        try:
+            method(**kwargs)
+            self._publish()
+        except Exception as e:
+            print(f"iML worker could not run {method.__name__}: {e!r}")
+
+    def _publish(self):
+        state = self.controller.state
+        record = state.record
+        self._best_route = {'cost': record.cost,
+                            'path': record.path,
+                            'iteration': state.current_iteration,
+                            'timestamp': time.time()}
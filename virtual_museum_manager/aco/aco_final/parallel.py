@@ -0,0 +1,146 @@
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from aco.aco_final.batch_ant import BatchColony
+
+# Per-process data of the pool workers (set by _init_worker)
+_worker = {}
+
+
+def _init_worker(shm_name, n_edges, index, alpha, beta):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    tables = np.ndarray((2, n_edges), dtype=np.float64, buffer=shm.buf)
+    _worker.update(shm=shm, scores=tables[0], weight=tables[1], index=index,
+                   colony=BatchColony(alpha=alpha, beta=beta))
+
+
+def _construct_chunk(task):
+    """
+    Builds the tours of one chunk of ants, with the random stream of that chunk.
+    Only compact results are sent back: the concatenated node ids, the length of every tour, the costs
+    and the tours that were cut (completed by the main process, see TourBounds).
+    """
+    start, n_ants, seed_key, objectives, max_door_hops, cost_limit = task
+    rng = np.random.default_rng(seed_key)
+    nodes, costs, cut = _worker['colony'].construct_tour_arrays(_worker['index'], _worker['scores'],
+                                                                _worker['weight'], n_ants, start, rng=rng,
+                                                                objectives=objectives, max_door_hops=max_door_hops,
+                                                                cost_limit=cost_limit)
+    lengths = np.array([len(n) for n in nodes], dtype=np.int32)
+    return np.concatenate(nodes).astype(np.int32), lengths, costs, cut
+
+
+class ParallelColony:
+    """
+    Spreads the batched construction of the colony across a pool of worker processes.
+
+    The colony is split in chunks of chunk_size ants. Every chunk is built by BatchColony
+    with its own random stream, derived from (seed, iteration, chunk), so the tours only
+    depend on the seed and not on how many workers there are or which worker runs each
+    chunk: n_workers=1 builds the very same tours serially in the current process.
+    Edge scores and weights are shared with the workers (read only) through shared memory,
+    and workers only send back node ids and costs.
+
+    Parameters
+    ----------
+    n_workers: number of worker processes. Defaults to the number of CPUs.
+    chunk_size: number of ants built by each task.
+    seed: seed of the random streams.
+
+    """
+
+    def __init__(self, n_workers=None, chunk_size=25, seed=None, alpha=1, beta=3):
+        self.n_workers = n_workers if n_workers is not None else multiprocessing.cpu_count()
+        self.chunk_size = chunk_size
+        self.seed = seed if seed is not None else np.random.SeedSequence().entropy
+        self.alpha = alpha
+        self.beta = beta
+
+        self._pool = None
+        self._shm = None
+        self._tables = None
+        self._index = None
+        self._colony = BatchColony(alpha=alpha, beta=beta)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(n_workers={self.n_workers}, chunk_size={self.chunk_size})'
+
+    def __getstate__(self):
+        # Processes and shared memory cannot be pickled (or deep copied): they are restarted when needed
+        state = self.__dict__.copy()
+        state.update(_pool=None, _shm=None, _tables=None, _index=None)
+        return state
+
+    def construct_tours(self, attractiveness, n_ants, start_door='D1-1', iteration=0, objectives=None,
+                        bounds=None):
+        """
+        Construct n_ants tours including all exhibits of the graph.
+
+        Parameters
+        ----------
+        attractiveness: AttractivenessTable with the edge scores of the current iteration.
+        n_ants: number of tours to build.
+        start_door: node where every tour starts.
+        iteration: current iteration (selects the random streams of the chunks).
+        objectives: boolean mask (by exhibit slot) of the exhibits to visit. All of them by default.
+        bounds: TourBounds of the construction (None for unbounded tours).
+
+        Returns
+        -------
+        solutions (list CompactSolution): one solution per ant, in chunk order.
+        """
+        engine = attractiveness.engine
+        index = engine.index
+        start = index.node_index[start_door]
+        max_door_hops, cost_limit = (bounds.max_door_hops, bounds.cost_limit) if bounds is not None else (None, None)
+        tasks = [(start, min(self.chunk_size, n_ants - first), (self.seed, iteration, chunk), objectives,
+                  max_door_hops, cost_limit)
+                 for chunk, first in enumerate(range(0, n_ants, self.chunk_size))]
+
+        if self.n_workers <= 1:
+            results = []
+            for start, chunk_ants, seed_key, objectives, max_door_hops, cost_limit in tasks:
+                results.append(self._colony.construct_tour_arrays(index, attractiveness.scores, engine.weight,
+                                                                  chunk_ants, start,
+                                                                  rng=np.random.default_rng(seed_key),
+                                                                  objectives=objectives, max_door_hops=max_door_hops,
+                                                                  cost_limit=cost_limit))
+        else:
+            self._start(index)
+            self._tables[0] = attractiveness.scores
+            self._tables[1] = engine.weight
+            results = [(np.split(nodes, np.cumsum(lengths)[:-1]), costs, cut)
+                       for nodes, lengths, costs, cut in self._pool.map(_construct_chunk, tasks)]
+
+        return [solution for nodes, costs, cut in results
+                for solution in BatchColony.solutions(index, nodes, costs, cut, bounds=bounds, objectives=objectives)]
+
+    def _start(self, index):
+        """
+        Starts the pool (or restarts it if the graph has changed).
+        """
+        if self._pool is not None and self._index is index:
+            return
+        self.close()
+        self._index = index
+        self._shm = shared_memory.SharedMemory(create=True, size=max(2 * index.n_edges * 8, 1))
+        self._tables = np.ndarray((2, index.n_edges), dtype=np.float64, buffer=self._shm.buf)
+        self._pool = multiprocessing.Pool(self.n_workers, initializer=_init_worker,
+                                          initargs=(self._shm.name, index.n_edges, index, self.alpha, self.beta))
+
+    def close(self):
+        """
+        Stops the worker processes and releases the shared memory.
+        """
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+        if self._shm is not None:
+            self._tables = None
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+        self._index = None
@@ -0,0 +1,437 @@
+import sys
+
+import numpy as np
+
+from aco.aco_final.graph_index import GraphIndex
+
+
+class PheromoneEngine:
+    """
+    Array-backed storage of the MMAS pheromone trails.
+
+    Pheromone and weight live in contiguous NumPy arrays indexed by edge id, so that
+    evaporation, deposit and trail limits are applied as whole-array operations.
+    The networkx graph is only updated when explicitly asked to (sync_to_graph).
+
+    Parameters
+    ----------
+    graph: door graph whose edges hold 'pheromone' and 'weight' attributes.
+    index: GraphIndex of the graph. Built from the graph if not specified.
+
+    """
+
+    # Pheromone trails are always up to date (see LazyPheromoneEngine)
+    lazy = False
+
+    def __init__(self, graph, index=None):
+        self.index = index if index is not None else GraphIndex.of(graph)
+        self.pheromone = self.index.read_edge_attribute(graph, 'pheromone')
+        self.weight = self.index.read_edge_attribute(graph, 'weight')
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(n_edges={self.index.n_edges})'
+
+    def get(self, u, v):
+        return self.pheromone[self.index.edge_id(u, v)]
+
+    def set(self, u, v, value):
+        self.pheromone[self.index.edge_id(u, v)] = value
+
+    def evaporate(self, rho):
+        self.pheromone *= (1 - rho)
+
+    def deposit(self, edge_ids, amount):
+        # An edge travelled several times by the same path only gets one deposit
+        self.pheromone[np.unique(edge_ids)] += amount
+
+    def clamp(self, lower_bound, upper_bound):
+        """
+        Adjusts pheromone trails to the [lower_bound, upper_bound] limits.
+        Edges without pheromone (0) are left untouched.
+        """
+        self.pheromone = _clip(self.pheromone, lower_bound, upper_bound)
+
+    def update(self, edge_ids, rho, amount, lower_bound, upper_bound):
+        """
+        Full MMAS update: evaporation, deposit on the specified edges and trail limits.
+        """
+        self.evaporate(rho)
+        self.deposit(edge_ids, amount)
+        self.clamp(lower_bound, upper_bound)
+
+    def load_from_graph(self, graph):
+        self.pheromone = self.index.read_edge_attribute(graph, 'pheromone')
+        self.weight = self.index.read_edge_attribute(graph, 'weight')
+
+    def sync_to_graph(self, graph):
+        self.index.write_edge_attribute(graph, 'pheromone', self.pheromone)
+
+    def remap(self, graph):
+        """
+        Adapts the arrays to a change of the graph structure (nodes or edges added or removed).
+        Edges that were already in the graph keep their pheromone, new edges take the
+        pheromone stored in the graph (seeded by MuseumGraphManager).
+        """
+        old_index, old_pheromone = self.index, self.pheromone
+        self.index = GraphIndex.of(graph)
+        if self.index is old_index:
+            # The graph was changed without publishing a new index
+            self.index = GraphIndex.publish(graph)
+        pheromone = self.index.read_edge_attribute(graph, 'pheromone')
+        names = self.index.node_names
+        for edge_id, (u, v) in enumerate(self.index.edge_nodes.tolist()):
+            old_id = old_index.edge_index.get((names[u], names[v]))
+            if old_id is not None:
+                pheromone[edge_id] = old_pheromone[old_id]
+        self.pheromone = pheromone
+        self.weight = self.index.read_edge_attribute(graph, 'weight')
+
+
+class LazyPheromoneEngine(PheromoneEngine):
+    """
+    Pheromone engine with lazy evaporation.
+
+    Every edge stores its pheromone at the iteration it was last updated (deposit or set), so an
+    MMAS update only touches the edges that receive a deposit: O(path length) per iteration
+    instead of O(E).
+
+    Between updates an edge is evaporated and clamped to the trail limits of every iteration.
+    Since clamp(clamp(x * d, l1, u1) * d, l2, u2) = clamp(x * d^2, L, U) for some limits L, U, the
+    limits of all the iterations since an update fold into a single pair, shared by the edges
+    updated in the same iteration: the effective pheromone of an edge is
+    clamp(tau * (1 - rho)^(now - last), L[last], U[last]). Every iteration folds its limits into
+    one pair per update iteration still in use; a pair that collapses (L == U: the pheromone no
+    longer depends on the stored value) is merged with the older ones.
+    The pheromone is the same as with the eager PheromoneEngine, including pheromone written
+    with set (or loaded from the graph), which is not clamped until the next update.
+    """
+
+    lazy = True
+
+    def __init__(self, graph, index=None):
+        self.iteration = 0
+        self.rho = 0.0
+        self.lower_bound = None
+        self.upper_bound = None
+        # Evaporated in this iteration, limits not applied yet
+        self._open = False
+        self._powers = np.empty(0)
+        super().__init__(graph, index=index)
+
+    @property
+    def pheromone(self):
+        return self.effective(slice(None))
+
+    @pheromone.setter
+    def pheromone(self, values):
+        self._stored = np.asarray(values, dtype=np.float64).copy()
+        self.last_update = np.full(len(self._stored), self.iteration, dtype=np.int64)
+        self._reset_limits()
+        # Edges updated (deposit or set) in this iteration
+        self._recent = []
+        # Edges changed since the last call to changed_edges (None: every edge)
+        self._changed = None
+
+    def _reset_limits(self):
+        # Limits folded since every update iteration: entry 0 for updates before _first (merged),
+        # entry i for updates at _first + i - 1. The last one (this iteration) is not clamped yet.
+        self._first = self.iteration
+        self._lower = np.zeros(2)
+        self._upper = np.full(2, np.inf)
+
+    def stored(self, edge_ids):
+        """
+        Pheromone of the specified edges at their last update, and the iteration of that update.
+        """
+        return self._stored[edge_ids], self.last_update[edge_ids]
+
+    def update_limits(self):
+        """
+        Trail limits folded since every update iteration, as (first, lower, upper): the limits of the
+        edges last updated at iteration i are at position clip(i - first + 1, 0, len(lower) - 1).
+        """
+        return self._first, self._lower, self._upper
+
+    def effective(self, edge_ids):
+        """
+        Effective (evaporated and clamped) pheromone of the specified edges.
+        """
+        stored, last_update = self.stored(edge_ids)
+        applied = self.iteration - self._open
+        values = stored * self._evaporation(np.maximum(applied - last_update, 0))
+        positions = np.clip(last_update - self._first + 1, 0, len(self._lower) - 1)
+        # Edges without pheromone (0) are not clamped
+        lower = np.where(stored != 0, self._lower[positions], 0.0)
+        return np.minimum(np.maximum(values, lower), self._upper[positions])
+
+    def _evaporation(self, elapsed):
+        # (1 - rho)^elapsed, from a table of powers (much faster than a power per edge)
+        elapsed = np.asarray(elapsed)
+        needed = int(elapsed.max(initial=0)) + 1
+        if len(self._powers) < needed:
+            self._powers = (1 - self.rho) ** np.arange(max(needed, 2 * len(self._powers)))
+        return self._powers[elapsed]
+
+    def changed_edges(self):
+        """
+        Ids of the edges whose stored pheromone changed since the last call (None if they all may have).
+        Every other edge has only been evaporated and clamped.
+        """
+        changed, self._changed = self._changed, []
+        if changed is None:
+            return None
+        return np.unique(np.concatenate(changed)) if changed else np.empty(0, dtype=np.int64)
+
+    def _mark_updated(self, edge_ids):
+        edge_ids = np.asarray(edge_ids, dtype=np.int64).reshape(-1)
+        self._recent.append(edge_ids)
+        if self._changed is not None:
+            self._changed.append(edge_ids)
+
+    def get(self, u, v):
+        return float(self.effective(self.index.edge_id(u, v)))
+
+    def set(self, u, v, value):
+        edge_id = self.index.edge_id(u, v)
+        self._stored[edge_id] = value
+        self.last_update[edge_id] = self.iteration
+        self._mark_updated(edge_id)
+
+    def evaporate(self, rho):
+        if self._open:
+            # The previous iteration was not clamped
+            self._fold_limits(None, None)
+        if rho != self.rho:
+            # Evaporation since the last update of every edge used the old rho
+            self._stored = self.pheromone
+            self.last_update[:] = self.iteration
+            self._reset_limits()
+            self._powers = np.empty(0)
+            self._changed = None
+        # Evaporation is applied when edges are read
+        self.rho = rho
+        self.iteration += 1
+        self._lower = np.append(self._lower, 0.0)
+        self._upper = np.append(self._upper, np.inf)
+        self._recent = []
+        self._open = True
+
+    def deposit(self, edge_ids, amount):
+        edge_ids = np.unique(edge_ids)
+        # Pheromone at the end of the previous iteration, evaporated in this one (as the eager engine),
+        # unless it was set in this iteration
+        previous = self.effective(edge_ids)
+        if self._open:
+            previous = np.where(self.last_update[edge_ids] < self.iteration, previous * (1 - self.rho), previous)
+        self._stored[edge_ids] = previous + amount
+        self.last_update[edge_ids] = self.iteration
+        self._mark_updated(edge_ids)
+
+    def clamp(self, lower_bound, upper_bound):
+        """
+        Adjusts pheromone trails to the [lower_bound, upper_bound] limits: the edges updated in this
+        iteration are clamped, the limits of the others are folded with the previous ones.
+        """
+        if self._recent:
+            edge_ids = np.unique(np.concatenate(self._recent))
+            self._stored[edge_ids] = _clip(self._stored[edge_ids], lower_bound, upper_bound)
+            self._recent = []
+        self._fold_limits(lower_bound, upper_bound)
+        self.lower_bound = lower_bound
+        self.upper_bound = upper_bound
+
+    def _fold_limits(self, lower_bound, upper_bound):
+        # Limits of the edges updated before this iteration (every entry but the last one)
+        decay = (1 - self.rho) if self._open else 1.0
+        lower, upper = self._lower[:-1] * decay, self._upper[:-1] * decay
+        if lower_bound is not None:
+            lower, upper = _limit(lower, lower_bound, upper_bound), _limit(upper, lower_bound, upper_bound)
+        self._lower[:-1], self._upper[:-1] = lower, upper
+        self._open = False
+
+        # Updates whose limits collapsed (and all the older ones) are merged into entry 0
+        collapsed = np.flatnonzero(lower[1:] == upper[1:])
+        if len(collapsed):
+            last = collapsed[-1] + 1
+            self._lower = np.concatenate(([self._lower[last]], self._lower[last + 1:]))
+            self._upper = np.concatenate(([self._upper[last]], self._upper[last + 1:]))
+            self._first += last
+
+
+class AttractivenessTable:
+    """
+    Cached tau^alpha * eta^beta score of every edge.
+
+    eta^beta only depends on the weights, so it is computed once per graph. tau^alpha is
+    recomputed once after every pheromone update (refresh), and single entries can be
+    recomputed after manual pheromone changes (invalidate).
+    With a lazy engine, only the edges updated since the last refresh are recomputed
+    (LazyPheromoneEngine.changed_edges): the table keeps the score of every edge at its last
+    update, relative to a reference iteration. Evaporation since then is one factor for all the
+    edges, and the trail limits are applied when the scores are read (LazyScores). A single
+    lookup costs more than reading an array, so this pays off when the O(E) refresh of the eager
+    table dominates (large graphs, few lookups per iteration).
+
+    Parameters
+    ----------
+    engine: PheromoneEngine holding the pheromone and weight arrays.
+    alpha: pheromone importance.
+    beta: weight (distance) importance.
+
+    """
+
+    # Relative scores are recomputed before the evaporation factor gets this small
+    min_decay = 1e-100
+
+    def __init__(self, engine, alpha=1, beta=3):
+        self.engine = engine
+        self.alpha = alpha
+        self.beta = beta
+
+        weight = engine.weight
+        self._zero_weight = weight == 0
+        with np.errstate(divide='ignore'):
+            eta = np.where(self._zero_weight, 0.0, 1.0 / weight)
+        self.eta_beta = eta ** beta
+        self._scores = None
+        # Lazy engine: scores at the last update relative to the reference iteration, eta^beta of
+        # the edges that are clamped (0 for the others) and limits^alpha of every update iteration
+        self._relative = None
+        self._multiplier = None
+        self._limits = None
+        self._entries = None
+        self._reference = 0
+        self._rate = 1.0
+        self.refresh()
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(alpha={self.alpha}, beta={self.beta})'
+
+    @property
+    def scores(self):
+        """
+        Scores of all edges, as an array indexed by edge id.
+        """
+        if self.engine.lazy:
+            return self.entries[slice(None)]
+        return self._scores
+
+    @property
+    def entries(self):
+        """
+        Scores indexable by edge id, for lookups of a few edges at a time: the score array, or with
+        a lazy engine a LazyScores view that only computes the entries requested.
+        """
+        if self.engine.lazy:
+            if self._entries is None:
+                first, lower, upper = self._limits
+                self._entries = LazyScores(self._relative, self._multiplier, self.engine.last_update,
+                                           first, lower, upper, self._decay())
+            return self._entries
+        return self._scores
+
+    def refresh(self):
+        """
+        Recomputes the scores from the current pheromone trails (only the updated edges with a lazy engine).
+        """
+        if not self.engine.lazy:
+            self._scores = self._compute(slice(None))
+            return
+        self._entries = None
+        changed = self.engine.changed_edges()
+        if changed is None or self._relative is None or self._decay() < self.min_decay:
+            self._reference = self.engine.iteration
+            self._rate = (1 - self.engine.rho) ** self.alpha
+            self._relative, self._multiplier = self._compute_relative(slice(None))
+        elif len(changed):
+            self._relative[changed], self._multiplier[changed] = self._compute_relative(changed)
+        first, lower, upper = self.engine.update_limits()
+        # Finite upper limits, so that edges without pheromone (multiplier 0) get a score of 0
+        self._limits = first, lower ** self.alpha, np.minimum(upper ** self.alpha, sys.float_info.max)
+
+    def invalidate(self, edge_ids):
+        """
+        Recomputes only the scores of the specified edges.
+        """
+        edge_ids = np.asarray(edge_ids, dtype=np.int64)
+        if self.engine.lazy:
+            self._relative[edge_ids], self._multiplier[edge_ids] = self._compute_relative(edge_ids)
+            self._entries = None
+        else:
+            self._scores[edge_ids] = self._compute(edge_ids)
+
+    def lookup(self, edge_ids):
+        return self.entries[edge_ids]
+
+    def _decay(self):
+        return self._rate ** (self.engine.iteration - self._reference)
+
+    def _compute(self, edge_ids):
+        scores = (self.engine.pheromone[edge_ids] ** self.alpha) * self.eta_beta[edge_ids]
+        return np.where(self._zero_weight[edge_ids], sys.float_info.max, scores)
+
+    def _compute_relative(self, edge_ids):
+        stored, last_update = self.engine.stored(edge_ids)
+        # Edges without pheromone are not clamped: their score stays 0. Edges without weight have the
+        # maximum score (multiplier -1)
+        multiplier = np.where(stored != 0, self.eta_beta[edge_ids], 0.0)
+        relative = (stored ** self.alpha) * multiplier * self._rate ** (self._reference - last_update)
+        return relative, np.where(self._zero_weight[edge_ids], -1.0, multiplier)
+
+
+class LazyScores:
+    """
+    Scores of a lazy AttractivenessTable at the current iteration, computed when indexed:
+    the relative score scaled by the evaporation factor, clamped to the trail limits folded
+    since the last update of the edge.
+    """
+
+    def __init__(self, relative, multiplier, last_update, first, lower, upper, decay):
+        self.relative = relative
+        self.multiplier = multiplier
+        self.last_update = last_update
+        self.first = first
+        self.lower = lower
+        self.upper = upper
+        self.decay = decay
+        # Limits of every update iteration as lists, for single lookups
+        self._lower_list = lower.tolist()
+        self._upper_list = upper.tolist()
+        self._last_position = len(self._lower_list) - 1
+        # Scores already computed in this iteration (ants look up the same edges again and again)
+        self._cache = {}
+
+    def __getitem__(self, edge_ids):
+        if not isinstance(edge_ids, (int, np.integer)):
+            return self._scores(edge_ids)
+        score = self._cache.get(edge_ids)
+        if score is not None:
+            return score
+        multiplier = self.multiplier.item(edge_ids)
+        if multiplier < 0:
+            score = sys.float_info.max
+        else:
+            position = self.last_update.item(edge_ids) - self.first + 1
+            position = 0 if position < 0 else position if position < self._last_position else self._last_position
+            score = self.relative.item(edge_ids) * self.decay
+            lower = self._lower_list[position] * multiplier
+            upper = self._upper_list[position] * multiplier
+            score = lower if score < lower else upper if score > upper else score
+        self._cache[edge_ids] = score
+        return score
+
+    def _scores(self, edge_ids):
+        positions = np.clip(self.last_update[edge_ids] - self.first + 1, 0, len(self.lower) - 1)
+        multiplier = self.multiplier[edge_ids]
+        scores = np.minimum(np.maximum(self.relative[edge_ids] * self.decay, self.lower[positions] * multiplier),
+                            self.upper[positions] * multiplier)
+        return np.where(multiplier < 0, sys.float_info.max, scores)
+
+
+def _clip(pheromone, lower_bound, upper_bound):
+    # Edges without pheromone (0) are left untouched
+    return np.where(pheromone != 0, _limit(pheromone, lower_bound, upper_bound), pheromone)
+
+
+def _limit(values, lower_bound, upper_bound):
+    return np.where(values < lower_bound, lower_bound, np.where(values > upper_bound, upper_bound, values))
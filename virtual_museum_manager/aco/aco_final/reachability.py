@@ -0,0 +1,83 @@
+import networkx as nx
+
+
+class Reachability:
+    """
+    One-time connectivity precheck of the door graph.
+
+    Ants walk until every exhibit has been visited, so an exhibit that cannot be reached from
+    the start door (a room without doors, a door missing from the graph, a closed room in the
+    middle of the museum...) would keep them walking forever. This precomputes the connected
+    components of the graph, so the exhibits reachable from any start door are known up front
+    and unreachable ones can be rejected or pruned before launching the ants.
+
+    Doors that are articulation points (closing them splits the graph) are also computed.
+
+    Parameters
+    ----------
+    graph: door graph whose nodes hold a 'type' attribute ('exhibit' or 'door').
+
+    """
+
+    def __init__(self, graph):
+        self.exhibits = frozenset(n for n, node_type in graph.nodes(data='type') if node_type == 'exhibit')
+
+        # Component of every node, and exhibits of every component
+        self.component = {}
+        self.component_exhibits = []
+        for component_id, nodes in enumerate(nx.connected_components(graph)):
+            for node in nodes:
+                self.component[node] = component_id
+            self.component_exhibits.append(frozenset(nodes & self.exhibits))
+
+        self.door_articulation_points = frozenset(n for n in nx.articulation_points(graph)
+                                                  if graph.nodes[n]['type'] == 'door')
+
+    def __repr__(self):
+        return (f'{self.__class__.__name__}(n_components={self.n_components}, '
+                f'n_door_articulation_points={len(self.door_articulation_points)})')
+
+    @property
+    def n_components(self):
+        return len(self.component_exhibits)
+
+    @property
+    def is_connected(self):
+        return self.n_components <= 1
+
+    def is_reachable(self, start, node):
+        return self.component[start] == self.component[node]
+
+    def reachable_exhibits(self, start):
+        """
+        Exhibits that can be reached from the start node.
+        """
+        if start not in self.component:
+            raise ValueError(f'Start node {start} is not in the graph')
+        return self.component_exhibits[self.component[start]]
+
+    def unreachable_exhibits(self, start):
+        return self.exhibits - self.reachable_exhibits(start)
+
+    def objectives(self, start, unreachable='raise'):
+        """
+        Exhibits the ants starting at start must visit.
+
+        Parameters
+        ----------
+        start: start node of the tours.
+        unreachable: 'raise' raises a ValueError if some exhibit cannot be reached from start,
+            'prune' leaves those exhibits out of the tours.
+
+        Returns
+        -------
+        objectives (frozenset): names of the exhibits to visit.
+        """
+        if unreachable not in ('raise', 'prune'):
+            raise ValueError(f"unreachable must be 'raise' or 'prune', not {unreachable!r}")
+        missing = self.unreachable_exhibits(start)
+        if missing and unreachable == 'raise':
+            raise ValueError(f'{len(missing)} exhibits cannot be reached from {start}: {sorted(missing)}')
+        if missing:
+            print(f'Pruned {len(missing)} exhibits that cannot be reached from {start}: {sorted(missing)}')
+        return self.reachable_exhibits(start)
@@ -2,6 +2,14 @@ import functools
 import itertools
 import random
 import math
+import time
+
+import numpy as np
+
+from aco.aco_final.bounded import TourBounds
+from aco.aco_final.graph_index import GraphIndex
+from aco.aco_final.pheromones import AttractivenessTable, LazyPheromoneEngine, PheromoneEngine
+from aco.aco_final.reachability import Reachability
 
 
 class State:
@@ -21,8 +29,64 @@ class State:
         self.best_iteration = 0
         self.last_smoothing_iteration = 0
 
+        # Connectivity of the graph, and exhibits to visit from the start node (see Solver._objectives)
+        self.reachability = None
         self.start = None
         self.objectives = None
+        self.objective_nodes = None
+        self.objective_mask = None
+        # Limits of the tour construction (None for unbounded tours, see TourBounds)
+        self.bounds = None
+
+        # Array-backed pheromone storage (None when pheromones live in the graph edges)
+        self.engine = None
+        # Cached edge scores of the current iteration (only with the array engine)
+        self.attractiveness = None
+        # Lock-step constructor of the colony (None when ants build their tours one by one)
+        self.batch_colony = None
+        # Two-level (rooms, then exhibits of each room) constructor of the colony
+        self.hierarchical_colony = None
+
+    def get_pheromone(self, u, v):
+        if self.engine is not None:
+            return self.engine.get(u, v)
+        return self.graph[u][v]['pheromone']
+
+    def set_pheromone(self, u, v, value):
+        """ Sets the pheromone of a single edge, keeping graph, arrays and cached scores consistent """
+        self.graph[u][v]['pheromone'] = value
+        if self.engine is not None:
+            self.engine.set(u, v, value)
+        if self.attractiveness is not None:
+            self.attractiveness.invalidate([self.engine.index.edge_id(u, v)])
+
+    def sync_graph(self):
+        """ Writes the pheromone arrays back into the graph (only if an engine is being used) """
+        if self.engine is not None:
+            self.engine.sync_to_graph(self.graph)
+
+    def graph_changed(self):
+        """
+        Adapts the state to a change of the graph structure (see MuseumGraphManager.add_exhibit, close_door...).
+        Pheromone trails of the unchanged edges are kept; tours found so far are dropped, since
+        they may visit removed nodes or miss new exhibits.
+        """
+        if self.engine is not None:
+            self.engine.remap(self.graph)
+            self.attractiveness = AttractivenessTable(self.engine, alpha=self.colony.alpha, beta=self.colony.beta)
+        if self.hierarchical_colony is not None:
+            index = self.engine.index if self.engine is not None else None
+            self.hierarchical_colony = self.hierarchical_colony.remap(self.graph, index=index)
+        self.reachability = None
+        if self.bounds is not None:
+            self.bounds.graph_changed()
+
+        self.solutions = None
+        self.record = None
+        self.previous_record = None
+        self.is_new_record = False
+        self.best = None
+        self.best_iteration = self.current_iteration
 
     def set_best(self, best, iteration):
         self.is_new_record = self.record is None or best < self.record
@@ -76,15 +140,94 @@ class Solution:
         self._add_node(self.start)
 
 
+@functools.total_ordering
+class CompactSolution:
+    """
+    Slimmed-down, immutable solution used with the array engine.
+
+    Nodes are stored as an int array of node ids (see GraphIndex) and the ids of the
+    edges travelled are computed once, as a sorted array of unique edge ids, so that
+    edge membership tests and pheromone deposits do not go through lists of tuples.
+    No references to the graph or the ant are kept, only to the (shared) graph index.
+    """
+
+    __slots__ = ('index', 'nodes', 'cost', 'edge_ids')
+
+    def __init__(self, index, nodes, cost):
+        self.index = index
+        self.nodes = np.asarray(nodes, dtype=np.int32)
+        self.cost = float(cost)
+        self.edge_ids = np.unique(index.pair_edge_ids(self.nodes[:-1], self.nodes[1:])).astype(np.int32)
+
+    @classmethod
+    def from_solution(cls, solution, index):
+        return cls(index, [index.node_index[n] for n in solution.nodes], solution.cost)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(cost={self.cost}, n_nodes={len(self.nodes)})'
+
+    def __eq__(self, other):
+        return self.cost == other.cost
+
+    def __lt__(self, other):
+        return self.cost < other.cost
+
+    def __contains__(self, node):
+        return self.index.node_index[node] in self.nodes
+
+    def __iter__(self):
+        return iter(self.path)
+
+    def __len__(self):
+        return len(self.nodes)
+
+    @property
+    def start(self):
+        return self.index.node_names[self.nodes[0]]
+
+    @property
+    def node_names(self):
+        return [self.index.node_names[n] for n in self.nodes]
+
+    @property
+    def path(self):
+        names = self.node_names
+        return list(zip(names[:-1], names[1:]))
+
+    def contains_edge(self, edge_id):
+        position = np.searchsorted(self.edge_ids, edge_id)
+        return position < len(self.edge_ids) and self.edge_ids[position] == edge_id
+
+
 class Solver:
 
-    def __init__(self, rho=0.02, pts_factor=0.1, pBest=0.05, pts=True, state=None, print_msg=False):
+    def __init__(self, rho=0.02, pts_factor=0.1, pBest=0.05, pts=True, state=None, print_msg=False,
+                 array_engine=False, batch_ants=False, seed=None, parallel=None, lazy_evaporation=False,
+                 hierarchical=False, unreachable='raise', max_door_hops=None, cost_factor=None,
+                 completion='shortest_path'):
         self.rho = rho
         self.pts_factor = pts_factor
         self.pBest = pBest
         self.pts = pts
         self.state = state
         self.print_msg = print_msg
+        # Batched and parallel construction read pheromones from the arrays, so they need the array engine
+        self.array_engine = array_engine or batch_ants or parallel is not None or lazy_evaporation
+        # Evaporate pheromones when edges are read instead of on every iteration (see LazyPheromoneEngine)
+        self.lazy_evaporation = lazy_evaporation
+        self.batch_ants = batch_ants
+        # Ants choose a room order with room-level pheromone, rooms are ordered from cached subproblems
+        self.hierarchical = hierarchical
+        self.seed = seed
+        # ParallelColony spreading the construction of the tours across worker processes
+        self.parallel = parallel
+        # Exhibits that cannot be reached from the start node: 'raise' an error or 'prune' them from the tours
+        self.unreachable = unreachable
+        # Tours are cut after max_door_hops fruitless door moves or above cost_factor times the record,
+        # and finished through shortest paths or dropped (see TourBounds)
+        self.max_door_hops = max_door_hops
+        self.cost_factor = cost_factor
+        self.completion = completion
 
     def __repr__(self):
         return f'{self.__class__.__name__}(rho={self.rho}, pts_factor={self.pts_factor})'
@@ -99,56 +242,188 @@ class Solver:
 
     def optimize(self, graph, colony, n_ants, limit, start_room, start_node):
 
-        if not self.state:
-            ants = colony.get_ants(n_ants)
-            state = State(graph=graph, ants=ants, limit=limit, n_ants=n_ants, colony=colony)
-        else:
-            state = self.state
-            state.limit = limit
-            ants = state.ants
+        state = self._prepare_state(graph, colony, n_ants, limit)
 
         # loop to yield increasingly better solutions
         looper = range(state.current_iteration,
                        limit + state.current_iteration) if limit is not None else itertools.count()
 
         for i in looper:
-            if i % 20 == 0:
-                print("Iteration: ", i)
-
-            solutions = self._construct_solutions(state, start_room, start_node)
-            solutions, ants = self._order_solutions_ants(solutions, ants)
+            self._iterate(state, i, start_room, start_node)
+
+    def solve_anytime(self, graph, colony=None, n_ants=None, time_budget=0.05, stagnation_limit=None, limit=None,
+                      start_room=1, start_node='D1-1', callback=None):
+        """
+        Anytime solve: iterates until the time budget (seconds) is spent, the record has not improved
+        for stagnation_limit iterations or limit iterations have been computed (whatever happens first).
+        If a callback is specified it is called with every new record; returning False stops the search.
+        """
+        for record in self.iter_records(graph, colony=colony, n_ants=n_ants, time_budget=time_budget,
+                                        stagnation_limit=stagnation_limit, limit=limit,
+                                        start_room=start_room, start_node=start_node):
+            if callback is not None and callback(record) is False:
+                break
+        return self.state
 
-            state.solutions, state.ants = solutions, ants
+    def iter_records(self, graph, colony=None, n_ants=None, time_budget=None, stagnation_limit=None, limit=None,
+                     start_room=1, start_node='D1-1'):
+        """
+        Generator that yields state.record every time a new record is found.
+        The search stops on the same criteria as solve_anytime, or as soon as the caller stops iterating.
+        At least one iteration is always computed.
+        """
+        start_time = time.perf_counter()
+        state = self._prepare_state(graph, colony, n_ants, limit)
+        first_iteration = state.current_iteration
+        last_iteration_time = 0
+
+        for i in itertools.count(first_iteration):
+            if i > first_iteration:
+                elapsed = time.perf_counter() - start_time
+                # Do not start an iteration that would not be finished within the budget
+                if time_budget is not None and elapsed + last_iteration_time > time_budget:
+                    break
+                if stagnation_limit is not None and i - state.best_iteration >= stagnation_limit:
+                    break
+                if limit is not None and i - first_iteration >= limit:
+                    break
+
+            iteration_start = time.perf_counter()
+            self._iterate(state, i, start_room, start_node)
+            last_iteration_time = time.perf_counter() - iteration_start
+
+            if state.is_new_record:
+                yield state.record
+
+    def _prepare_state(self, graph, colony, n_ants, limit):
 
-            iteration_best_solution = state.solutions[0]
-            state.set_best(iteration_best_solution, i)
+        if not self.state:
+            ants = colony.get_ants(n_ants)
+            state = State(graph=graph, ants=ants, limit=limit, n_ants=n_ants, colony=colony)
+        else:
+            state = self.state
+            state.limit = limit
 
-            self._update_pheromones(state)
+        if self.array_engine and state.engine is None:
+            engine_cls = LazyPheromoneEngine if self.lazy_evaporation else PheromoneEngine
+            state.engine = engine_cls(state.graph, index=GraphIndex.of(state.graph))
+        if state.engine is not None and state.attractiveness is None:
+            state.attractiveness = AttractivenessTable(state.engine, alpha=state.colony.alpha, beta=state.colony.beta)
+        if self.batch_ants and state.batch_colony is None:
+            state.batch_colony = state.colony.get_batch_colony(seed=self.seed)
+        if self.hierarchical and state.hierarchical_colony is None:
+            index = state.engine.index if state.engine is not None else None
+            state.hierarchical_colony = state.colony.get_hierarchical_colony(state.graph, index=index, seed=self.seed)
+        bounds = self.max_door_hops, self.cost_factor, self.completion
+        if bounds[:2] == (None, None):
+            state.bounds = None
+        elif state.bounds is None or state.bounds.settings != bounds:
+            state.bounds = TourBounds(state.graph, *bounds)
 
+        self.state = state
+        return state
+
+    def _iterate(self, state, i, start_room, start_node):
+        if i % 20 == 0:
+            print("Iteration: ", i)
+
+        if state.bounds is not None:
+            state.bounds.update(state.record)
+        solutions = self._construct_solutions(state, start_room, start_node)
+        if not solutions:
+            # Every tour exceeded the bounds and was dropped
+            print(f'Iteration {i}: all tours were aborted')
+            state.is_new_record = False
             state.current_iteration = i + 1
+            return
+        if (state.engine is not None and state.batch_colony is None and self.parallel is None and
+                state.hierarchical_colony is None):
+            # Keep only compact copies of the tours built by the ants
+            solutions = [CompactSolution.from_solution(s, state.engine.index) for s in solutions]
+        solutions, ants = self._order_solutions_ants(solutions, state.ants)
 
-        self.state = state
+        state.solutions, state.ants = solutions, ants
+
+        iteration_best_solution = state.solutions[0]
+        state.set_best(iteration_best_solution, i)
+
+        self._update_pheromones(state)
+        if state.attractiveness is not None:
+            state.attractiveness.refresh()
+
+        state.current_iteration = i + 1
 
     def _construct_solutions(self, state, start_room, start_door):
-        return [ant.construct_tour(state.graph, start_room=start_room, start_door=start_door) for ant in state.ants]
+        objectives = self._objectives(state, start_door)
+        if state.hierarchical_colony is not None:
+            return state.hierarchical_colony.construct_tours(len(state.ants), start_room=start_room,
+                                                             start_door=start_door,
+                                                             objectives=state.objective_mask)
+        if self.parallel is not None:
+            return self.parallel.construct_tours(state.attractiveness, len(state.ants), start_door=start_door,
+                                                 iteration=state.current_iteration,
+                                                 objectives=state.objective_mask, bounds=state.bounds)
+        if state.batch_colony is not None:
+            return state.batch_colony.construct_tours(state.attractiveness, len(state.ants), start_door=start_door,
+                                                      objectives=state.objective_mask, bounds=state.bounds)
+        # Index resolved once for the whole colony (GraphIndex.of checks the node names of the graph)
+        index = state.engine.index if state.engine is not None else GraphIndex.of(state.graph)
+        solutions = [ant.construct_tour(state.graph, start_room=start_room, start_door=start_door,
+                                        attractiveness=state.attractiveness, objectives=objectives,
+                                        bounds=state.bounds, index=index)
+                     for ant in state.ants]
+        # Tours dropped by the bounds
+        return [solution for solution in solutions if solution is not None]
+
+    def _objectives(self, state, start_door):
+        """
+        Exhibits the ants must visit from start_door, as one byte per node id (see Ant.construct_tour).
+        Reachability is computed once per graph and start node, so unreachable exhibits fail fast
+        (or are pruned) instead of making the ants walk forever.
+        """
+        if state.reachability is None:
+            state.reachability = Reachability(state.graph)
+            state.start = None
+        if state.start != start_door:
+            state.objectives = state.reachability.objectives(start_door, unreachable=self.unreachable)
+            index = GraphIndex.of(state.graph)
+            objective_nodes = np.array([name in state.objectives for name in index.node_names], dtype=bool)
+            state.objective_nodes = objective_nodes.astype(np.uint8).tobytes()
+            # Mask by exhibit slot, for the array constructors (None when every exhibit is an objective)
+            state.objective_mask = (objective_nodes[index.is_exhibit]
+                                    if len(state.objectives) < len(state.reachability.exhibits) else None)
+            state.start = start_door
+        return state.objective_nodes
 
     def _order_solutions_ants(self, solutions, ants):
         # We need to order the solutions found by their cost (and still know its associated ant)
         data = list(zip(solutions, range(len(ants)), ants))
         data.sort()
         # Ordered list of solutions and their corresponding ants
-        solutions_ordered_costs, _, ants = zip(*data)
-
-        return solutions_ordered_costs, ants
+        solutions_ordered_costs, _, ordered_ants = zip(*data)
+        # Tours dropped by the bounds leave fewer solutions than ants: the colony keeps its size
+        return solutions_ordered_costs, ordered_ants + tuple(ants[len(data):])
 
     def _update_pheromones(self, state):
 
         best_solution = state.best  # iteration best # self._best_solution_type_choice(state)
         self._update_pheromone_bounds(state, best_solution)
 
+        if state.hierarchical_colony is not None:
+            state.hierarchical_colony.update(best_solution, self.rho, state.current_lower_bound,
+                                             state.current_upper_bound)
+
+        if state.engine is not None:
+            self._update_pheromone_arrays(state, best_solution)
+            return
+
+        # Edges of the best path in both orientations, built once for O(1) membership tests
+        best_edges = set(best_solution.path)
+        best_edges.update((v, u) for u, v in best_solution.path)
+
         for edge in state.graph.edges:
             # Evaporate and increase pheromone trails
-            self._evaporate_and_increase_pheromone_trails(state, edge, best_solution)
+            self._evaporate_and_increase_pheromone_trails(state, edge, best_solution, best_edges)
 
             # Update pheromone trail lower and upper bounds
             self._adjust_pheromone_trail_limits(state, edge)
@@ -156,6 +431,12 @@ class Solver:
             # Pheromone trail smoothing
             # self._pheromone_trail_smoothing(state,edge)
 
+    def _update_pheromone_arrays(self, state, best_solution):
+        # Same update as the per-edge loop, applied to the whole pheromone array at once
+        engine = state.engine
+        engine.update(best_solution.edge_ids, self.rho, 1.0 / best_solution.cost,
+                      state.current_lower_bound, state.current_upper_bound)
+
     def sigmoid(self, x, a=1, b=1):
         # Sigmoid-like function with parameters 'a' and 'b'
         return 1 / (1 + math.exp(-a * (x - b)))
@@ -208,7 +489,7 @@ class Solver:
 
         return best_solution
 
-    def _evaporate_and_increase_pheromone_trails(self, state, edge, best_solution):
+    def _evaporate_and_increase_pheromone_trails(self, state, edge, best_solution, best_edges):
 
         best_length = best_solution.cost
 
@@ -216,7 +497,7 @@ class Solver:
         old_pheromone = state.graph.edges[edge]['pheromone']
 
         # Only increase pheromone in edges that are relevant
-        if edge in best_solution.path:  # and old_pheromone != 0 :
+        if edge in best_edges:  # and old_pheromone != 0 :
             pheromone_increase = 1.0 / best_length
 
         state.graph.edges[edge]['pheromone'] = (1 - self.rho) * old_pheromone + pheromone_increase
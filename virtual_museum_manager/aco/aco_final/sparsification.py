@@ -0,0 +1,70 @@
+import numpy as np
+
+
+def sparse_room_links(distances, is_door, k):
+    """
+    Selects the links of a room that are kept when the room clique is sparsified.
+
+    A link between two elements of the room is kept if it is any of:
+
+    - one of the k nearest neighbors of either element,
+    - a door-door link (connections between rooms are never pruned),
+    - the link of an element to its nearest door (every exhibit can always leave through a door,
+      so ants never get stuck in an exhibit whose neighbors have all been visited),
+    - a link of the minimum spanning tree of the room (the room stays connected).
+
+    Parameters
+    ----------
+    distances: m x m pairwise distances between the elements of the room.
+    is_door: boolean array, True for the doors of the room.
+    k: number of nearest neighbors kept for every element.
+
+    Returns
+    -------
+    keep (m x m boolean array): symmetric matrix of the links to keep.
+    """
+    m = len(distances)
+    keep = np.zeros((m, m), dtype=bool)
+    if m < 2:
+        return keep
+    others = distances + np.diag(np.full(m, np.inf))
+    rows = np.arange(m)
+
+    # k nearest neighbors
+    nearest = np.argsort(others, axis=1, kind='stable')[:, :min(k, m - 1)]
+    keep[rows[:, None], nearest] = True
+
+    # Door-door links and nearest door of every element
+    doors = np.flatnonzero(is_door)
+    if len(doors):
+        keep[np.ix_(doors, doors)] = True
+        keep[rows, doors[np.argmin(distances[:, doors] + np.where(rows[:, None] == doors[None, :], np.inf, 0),
+                                   axis=1)]] = True
+
+    # Minimum spanning tree (Prim)
+    in_tree = np.zeros(m, dtype=bool)
+    in_tree[0] = True
+    best = distances[0].copy()
+    parent = np.zeros(m, dtype=np.int64)
+    for _ in range(m - 1):
+        candidates = np.where(in_tree, np.inf, best)
+        node = int(np.argmin(candidates))
+        keep[node, parent[node]] = True
+        in_tree[node] = True
+        closer = distances[node] < best
+        best = np.where(closer, distances[node], best)
+        parent = np.where(closer, node, parent)
+
+    keep |= keep.T
+    np.fill_diagonal(keep, False)
+    return keep
+
+
+def summarize(report):
+    """
+    Totals of a sparsification report (list of per room dicts with edges_before and edges_after).
+    """
+    before = sum(room['edges_before'] for room in report)
+    after = sum(room['edges_after'] for room in report)
+    return {'edges_before': before, 'edges_after': after, 'edges_removed': before - after,
+            'removed_ratio': (before - after) / before if before else 0.0}
@@ -0,0 +1,216 @@
+import numpy as np
+
+from aco.aco_final.graph_index import GraphIndex
+from aco.aco_final.walking_distances import _floyd_warshall, _unwind
+
+
+class RoomSubproblems:
+    """
+    Cache of the best exhibit ordering of every room, between an entry and an exit node.
+
+    A subproblem (room, entry, exit) is the shortest path that starts at entry, visits every
+    exhibit of the room and ends at exit (or at the last exhibit if exit is None), using only
+    the links of the room. Distances between elements are shortest paths inside the room, so
+    sparsified rooms (not every pair linked) are supported. Rooms with up to exact_limit exhibits are solved exactly
+    (Held-Karp dynamic programming), bigger ones with a nearest neighbor tour improved with 2-opt.
+    Results are cached, so every subproblem is only solved once.
+
+    Parameters
+    ----------
+    graph: door graph whose edges hold 'weight' and 'room' attributes.
+    index: GraphIndex of the graph. Built from the graph if not specified.
+    exact_limit: maximum number of exhibits of a room solved exactly.
+
+    """
+
+    def __init__(self, graph, index=None, exact_limit=10):
+        self.index = index if index is not None else GraphIndex.of(graph)
+        self.exact_limit = exact_limit
+        self.weight = self.index.read_edge_attribute(graph, 'weight')
+        self.edge_room = edge_room = self.index.read_edge_attribute(graph, 'room').astype(np.int64)
+
+        # Rooms of every node (doors belong to the two rooms they connect)
+        self.node_rooms = [set() for _ in range(self.index.n_nodes)]
+        for (u, v), room in zip(self.index.edge_nodes.tolist(), edge_room.tolist()):
+            self.node_rooms[u].add(room)
+            self.node_rooms[v].add(room)
+
+        members = {}
+        for node, rooms in enumerate(self.node_rooms):
+            for room in rooms:
+                members.setdefault(room, []).append(node)
+        is_exhibit = self.index.is_exhibit
+        self.room_exhibits = {room: np.array([n for n in nodes if is_exhibit[n]], dtype=np.int64)
+                              for room, nodes in sorted(members.items())}
+        self.room_doors = {room: np.array([n for n in nodes if not is_exhibit[n]], dtype=np.int64)
+                           for room, nodes in sorted(members.items())}
+
+        self._cache = {}
+        self._blocks = {}
+        self._links = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(n_rooms={len(self.room_exhibits)}, cached={len(self._cache)})'
+
+    def distance(self, room, u, v):
+        """
+        Walking distance between two nodes of the room (using only the links of the room).
+        """
+        if u == v:
+            return 0.0
+        distance = self._links.get((room, u, v))
+        if distance is None:
+            members, distances, _ = self._block(room)
+            i, j = np.searchsorted(members, [u, v]).tolist()
+            distance = self._links[(room, u, v)] = self._links[(room, v, u)] = float(distances[i, j])
+        return distance
+
+    def crossing(self, room, entry, exit):
+        """
+        Shortest path between two nodes of the room, without visiting its exhibits.
+
+        Returns
+        -------
+        nodes (int array): nodes visited after entry (exit included).
+        cost (float): length of the path.
+        """
+        if entry == exit:
+            return np.empty(0, dtype=np.int64), 0.0
+        members, distances, predecessors = self._block(room)
+        i, j = np.searchsorted(members, [entry, exit]).tolist()
+        return members[np.array(_unwind(predecessors, i, j)[1:], dtype=np.int64)], float(distances[i, j])
+
+    def _block(self, room):
+        """
+        Members (sorted node ids), shortest path distances and predecessors of the room (cached).
+        """
+        block = self._blocks.get(room)
+        if block is None:
+            in_room = self.edge_room == room
+            edges = self.index.edge_nodes[in_room]
+            members = np.unique(edges)
+            local = np.searchsorted(members, edges)
+            weights = np.full((len(members), len(members)), np.inf)
+            weights[local[:, 0], local[:, 1]] = self.weight[in_room]
+            weights[local[:, 1], local[:, 0]] = self.weight[in_room]
+            block = self._blocks[room] = (members, *_floyd_warshall(weights))
+        return block
+
+    def solve(self, room, entry, exit=None):
+        """
+        Best ordering of the exhibits of the room between entry and exit (node ids).
+
+        Returns
+        -------
+        nodes (int array): nodes visited after entry (the exhibits and then exit, if specified).
+        cost (float): length of the path.
+        """
+        key = (room, entry, exit)
+        result = self._cache.get(key)
+        if result is None:
+            self.misses += 1
+            result = self._cache[key] = self._solve(room, entry, exit)
+        else:
+            self.hits += 1
+        return result
+
+    def _solve(self, room, entry, exit):
+        exhibits = self.room_exhibits.get(room, np.empty(0, dtype=np.int64))
+        members, room_distances, predecessors = self._block(room)
+        if not len(exhibits) and (exit is None or exit == entry):
+            return np.empty(0, dtype=np.int64), 0.0
+
+        # Distances between entry (0), the exhibits (1..n) and exit (n + 1)
+        nodes = np.concatenate([[entry], exhibits, [exit] if exit is not None else []]).astype(np.int64)
+        local = np.searchsorted(members, nodes)
+        distances = room_distances[np.ix_(local, local)]
+        if not len(exhibits):
+            order, cost = [], float(distances[0, 1])
+        elif len(exhibits) <= self.exact_limit:
+            order, cost = self._held_karp(distances, len(exhibits), exit is not None)
+        else:
+            order, cost = self._two_opt(distances, len(exhibits), exit is not None)
+
+        # Expand every step of the ordering to the links of the room it goes through
+        stops = [0] + list(order) + ([len(nodes) - 1] if exit is not None else [])
+        path = []
+        for a, b in zip(stops, stops[1:]):
+            path += _unwind(predecessors, local[a], local[b])[1:]
+        return members[np.array(path, dtype=np.int64)], cost
+
+    @staticmethod
+    def _held_karp(distances, n, has_exit):
+        """
+        Exact open path from node 0 through nodes 1..n (and then node n + 1 if has_exit).
+        Subsets are processed by number of exhibits, all subsets of the same size at once.
+        """
+        n_masks = 1 << n
+        cost = np.full((n_masks, n), np.inf)
+        parent = np.full((n_masks, n), -1, dtype=np.int64)
+        singles = 1 << np.arange(n)
+        cost[singles, np.arange(n)] = distances[0, 1:n + 1]
+
+        masks = np.arange(n_masks)
+        popcount = np.array([bin(mask).count('1') for mask in range(n_masks)])
+        between = distances[1:n + 1, 1:n + 1]
+        for size in range(2, n + 1):
+            layer = masks[popcount == size]
+            for j in range(n):
+                with_j = layer[(layer >> j) & 1 == 1]
+                previous = with_j ^ (1 << j)
+                candidates = cost[previous] + between[:, j][None, :]
+                best = np.argmin(candidates, axis=1)
+                cost[with_j, j] = candidates[np.arange(len(with_j)), best]
+                parent[with_j, j] = best
+
+        full = n_masks - 1
+        final = cost[full] + (distances[1:n + 1, n + 1] if has_exit else 0)
+        last = int(np.argmin(final))
+        total = float(final[last])
+
+        order = []
+        mask = full
+        while last >= 0:
+            order.append(last + 1)
+            previous = parent[mask, last]
+            mask ^= 1 << last
+            last = int(previous)
+        return order[::-1], total
+
+    @staticmethod
+    def _two_opt(distances, n, has_exit):
+        """
+        Nearest neighbor open path from node 0 through nodes 1..n, improved with 2-opt moves.
+        """
+        unvisited = set(range(1, n + 1))
+        sequence = [0]
+        while unvisited:
+            current = sequence[-1]
+            nearest = min(unvisited, key=lambda node: distances[current, node])
+            sequence.append(nearest)
+            unvisited.remove(nearest)
+        if has_exit:
+            sequence.append(n + 1)
+
+        # Reverse sequence[i..k] while it shortens the path (first node and fixed exit never move)
+        last_movable = len(sequence) - 2 if has_exit else len(sequence) - 1
+        improved = True
+        while improved:
+            improved = False
+            for i in range(1, last_movable):
+                for k in range(i + 1, last_movable + 1):
+                    a, b = sequence[i - 1], sequence[i]
+                    c = sequence[k]
+                    after = sequence[k + 1] if k + 1 < len(sequence) else None
+                    delta = distances[a, c] - distances[a, b]
+                    if after is not None:
+                        delta += distances[b, after] - distances[c, after]
+                    if delta < -1e-9:
+                        sequence[i:k + 1] = sequence[i:k + 1][::-1]
+                        improved = True
+
+        total = float(sum(distances[a, b] for a, b in zip(sequence, sequence[1:])))
+        order = sequence[1:-1] if has_exit else sequence[1:]
+        return order, total
@@ -0,0 +1,129 @@
+import numpy as np
+
+from aco.aco_final.subproblems import RoomSubproblems
+
+
+class SubsetRouter:
+    """
+    Tours through a visitor-selected subset of exhibits.
+
+    Instead of letting the ants walk the whole door graph, the tour is solved on the metric
+    closure of the chosen exhibits: the complete graph between the start node, the exhibits
+    (and the end node, if any) weighted with their walking distances (WalkingDistances).
+    Up to exact_limit exhibits are ordered exactly (Held-Karp, see RoomSubproblems); larger
+    subsets are solved with a small MMAS colony on the closure. The best ordering is then
+    expanded back into a door-level path through the shortest paths between its stops.
+
+    Parameters
+    ----------
+    distances: WalkingDistances of the door graph (MuseumGraphManager.walking_distances).
+    exact_limit: maximum number of exhibits ordered exactly.
+    n_ants: ants of the MMAS colony.
+    iterations: iterations of the MMAS colony.
+    alpha: pheromone importance.
+    beta: distance importance.
+    rho: evaporation rate.
+    pBest: probability of building the best tour once converged (sets the trail limits).
+    seed: seed of the random generator of the colony.
+
+    """
+
+    def __init__(self, distances, exact_limit=15, n_ants=20, iterations=100, alpha=1, beta=3, rho=0.02,
+                 pBest=0.05, seed=None):
+        self.distances = distances
+        self.exact_limit = exact_limit
+        self.n_ants = n_ants
+        self.iterations = iterations
+        self.alpha = alpha
+        self.beta = beta
+        self.rho = rho
+        self.pBest = pBest
+        self.rng = np.random.default_rng(seed)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(exact_limit={self.exact_limit}, n_ants={self.n_ants})'
+
+    def solve(self, start, objectives, end=None):
+        """
+        Shortest tour from start through every exhibit of objectives (ending at end, if specified).
+
+        Returns
+        -------
+        order (list): objectives in visiting order.
+        path (list): door-level path of the tour (node names, start included).
+        cost (float): length of the tour.
+        """
+        objectives = list(dict.fromkeys(o for o in objectives if o != start and o != end))
+        stops = [start] + objectives + ([end] if end is not None else [])
+        unknown = [stop for stop in stops if stop not in self.distances.node_index]
+        if unknown:
+            raise ValueError(f'{unknown} are not in the graph')
+        closure = self.distances.matrix(stops)
+        if not np.isfinite(closure[0]).all():
+            missing = [stops[i] for i in np.flatnonzero(~np.isfinite(closure[0]))]
+            raise ValueError(f'{missing} cannot be reached from {start}')
+
+        n = len(objectives)
+        has_exit = end is not None
+        if not n:
+            sequence, cost = [], float(closure[0, 1]) if has_exit else 0.0
+        elif n <= self.exact_limit:
+            sequence, cost = RoomSubproblems._held_karp(closure, n, has_exit)
+        else:
+            sequence, cost = self._mmas(closure, n, has_exit)
+
+        order = [stops[i] for i in sequence]
+        path = [start]
+        for a, b in zip([start] + order, order + ([end] if has_exit else [])):
+            path += self.distances.path(a, b)[1:]
+        return order, path, cost
+
+    def _mmas(self, closure, n, has_exit):
+        """
+        MMAS on the metric closure: open path from node 0 through nodes 1..n (then n + 1 if has_exit).
+        All ants of the colony build their tours at once. The nearest neighbor + 2-opt path is
+        used as the first record, so the result is never worse than it.
+        """
+        between = closure[:n + 1, :n + 1]
+        exit_cost = closure[:n + 1, n + 1] if has_exit else np.zeros(n + 1)
+        with np.errstate(divide='ignore'):
+            eta_beta = np.where(between > 0, 1.0 / between, 1e6) ** self.beta
+
+        best_order, best_cost = RoomSubproblems._two_opt(closure, n, has_exit)
+        upper = 1.0 / (self.rho * best_cost) if best_cost > 0 else 1.0
+        pheromone = np.full((n + 1, n + 1), upper)
+        rows = np.arange(self.n_ants)
+
+        for _ in range(self.iterations):
+            current = np.zeros(self.n_ants, dtype=np.int64)
+            visited = np.zeros((self.n_ants, n + 1), dtype=bool)
+            visited[:, 0] = True
+            tours = np.empty((self.n_ants, n), dtype=np.int64)
+            costs = np.zeros(self.n_ants)
+            for step in range(n):
+                scores = np.where(visited, 0.0, pheromone[current] ** self.alpha * eta_beta[current])
+                cumulative = np.cumsum(scores, axis=1)
+                draw = self.rng.random(self.n_ants) * cumulative[:, -1]
+                chosen = np.minimum((cumulative <= draw[:, None]).sum(axis=1), n)
+                # Rounding can select a visited node: take the first unvisited one instead
+                invalid = visited[rows, chosen]
+                chosen[invalid] = np.argmax(~visited[invalid], axis=1)
+                costs += between[current, chosen]
+                visited[rows, chosen] = True
+                tours[:, step] = current = chosen
+            costs += exit_cost[current]
+
+            ant = int(np.argmin(costs))
+            if costs[ant] < best_cost:
+                best_order, best_cost = tours[ant].tolist(), float(costs[ant])
+
+            # MMAS update with the iteration best tour, within the trail limits of the record
+            upper = 1.0 / (self.rho * best_cost)
+            root = self.pBest ** (1.0 / (n + 1))
+            lower = upper * (1 - root) / (max((n + 1) / 2.0 - 1, 1) * root)
+            pheromone *= (1 - self.rho)
+            path = np.concatenate([[0], tours[ant]])
+            pheromone[path[:-1], path[1:]] += 1.0 / costs[ant]
+            np.clip(pheromone, lower, upper, out=pheromone)
+
+        return best_order, best_cost
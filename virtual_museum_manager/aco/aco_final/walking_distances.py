@@ -0,0 +1,235 @@
+import numpy as np
+
+
+def _floyd_warshall(weights):
+    """
+    All-pairs shortest paths of a dense weight matrix (np.inf where there is no edge).
+
+    Returns
+    -------
+    distances (float array): shortest path lengths.
+    predecessors (int array): predecessors[i, j] is the node before j in the shortest path from i (-1 if none).
+    """
+    n = len(weights)
+    distances = weights.astype(np.float64, copy=True)
+    np.fill_diagonal(distances, 0)
+    predecessors = np.where(np.isfinite(distances), np.arange(n)[:, None], -1)
+    np.fill_diagonal(predecessors, -1)
+    through_k = np.empty_like(distances)
+    improved = np.empty(distances.shape, dtype=bool)
+    for k in range(n):
+        np.add(distances[:, k:k + 1], distances[k:k + 1, :], out=through_k)
+        np.less(through_k, distances, out=improved)
+        np.copyto(distances, through_k, where=improved)
+        np.copyto(predecessors, predecessors[k:k + 1, :], where=improved)
+    return distances, predecessors
+
+
+def _unwind(predecessors, i, j):
+    """
+    Positions of the shortest path from i to j, following the predecessor matrix (both ends included).
+    """
+    path = [j]
+    while j != i:
+        j = predecessors[i, j]
+        path.append(j)
+    return path[::-1]
+
+
+class WalkingDistances:
+    """
+    All-pairs walking distances (and paths) of the door graph.
+
+    The distances are built hierarchically, so they scale with the number of rooms:
+
+    - Room blocks: shortest paths between the elements of each room, using only the links of that room.
+    - Boundary graph: nodes that belong to several rooms (the doors between them) linked with their
+      room block distances. Its all-pairs shortest paths are the distances between any two doors.
+    - Exits: for every node, the distance to every door, leaving its room(s) through the best door.
+
+    The distance between two nodes is then the best of going directly inside a shared room or
+    reaching one of the doors of the destination room, which is a handful of operations
+    (number of doors of a room) per lookup.
+
+    Parameters
+    ----------
+    node_names: names of the nodes (node id = position).
+    edge_nodes: E x 2 node ids of the links.
+    edge_weight: length of every link.
+    edge_room: room of every link.
+
+    """
+
+    def __init__(self, node_names, edge_nodes, edge_weight, edge_room):
+        self.node_names = list(node_names)
+        self.node_index = {name: idx for idx, name in enumerate(self.node_names)}
+        n_nodes = len(self.node_names)
+        edge_nodes = np.asarray(edge_nodes, dtype=np.int64).reshape(-1, 2)
+        edge_weight = np.asarray(edge_weight, dtype=np.float64)
+        edge_room = np.asarray(edge_room, dtype=np.int64)
+
+        # Room blocks
+        self._node_rooms = [[] for _ in range(n_nodes)]  # (room, position in the room block) of every node
+        self._room_members = {}
+        self._room_distances = {}
+        self._room_predecessors = {}
+        for room in np.unique(edge_room).tolist():
+            in_room = edge_room == room
+            members = np.unique(edge_nodes[in_room])
+            position = {node: p for p, node in enumerate(members.tolist())}
+            weights = np.full((len(members), len(members)), np.inf)
+            local = np.searchsorted(members, edge_nodes[in_room])
+            np.minimum.at(weights, (local[:, 0], local[:, 1]), edge_weight[in_room])
+            np.minimum.at(weights, (local[:, 1], local[:, 0]), edge_weight[in_room])
+            distances, predecessors = _floyd_warshall(weights)
+            self._room_members[room] = members
+            self._room_distances[room] = distances
+            self._room_predecessors[room] = predecessors
+            for node, p in position.items():
+                self._node_rooms[node].append((room, p))
+
+        # Boundary graph: nodes shared by several rooms
+        self.boundary = np.array([node for node in range(n_nodes) if len(self._node_rooms[node]) > 1],
+                                 dtype=np.int64)
+        self._boundary_position = np.full(n_nodes, -1, dtype=np.int64)
+        self._boundary_position[self.boundary] = np.arange(len(self.boundary))
+        # Boundary nodes of every room: (positions in the room block, positions in the boundary graph)
+        self._room_boundary = {}
+        for room, members in self._room_members.items():
+            local = np.flatnonzero(self._boundary_position[members] >= 0)
+            self._room_boundary[room] = (local, self._boundary_position[members[local]])
+
+        n_boundary = len(self.boundary)
+        weights = np.full((n_boundary, n_boundary), np.inf)
+        # Room used by every link of the boundary graph, to expand it to a path of the door graph
+        self._boundary_room = np.full((n_boundary, n_boundary), -1, dtype=np.int64)
+        for room, (local, positions) in self._room_boundary.items():
+            block = self._room_distances[room][np.ix_(local, local)]
+            better = block < weights[np.ix_(positions, positions)]
+            rows, cols = np.nonzero(better)
+            weights[positions[rows], positions[cols]] = block[rows, cols]
+            self._boundary_room[positions[rows], positions[cols]] = room
+        self._boundary_distances, self._boundary_predecessors = _floyd_warshall(weights)
+
+        # Exits: distance from every node to every boundary node, and the exit used (boundary position, room)
+        self._exit_distances = np.full((n_nodes, n_boundary), np.inf)
+        self._exit_via = np.full((n_nodes, n_boundary), -1, dtype=np.int64)
+        self._exit_room = np.full((n_nodes, n_boundary), -1, dtype=np.int64)
+        for room, (local, positions) in self._room_boundary.items():
+            if not len(local):
+                continue
+            members = self._room_members[room]
+            # members x room doors x all boundary nodes
+            candidates = (self._room_distances[room][:, local][:, :, None] +
+                          self._boundary_distances[positions][None, :, :])
+            best = np.argmin(candidates, axis=1)
+            best_distances = np.take_along_axis(candidates, best[:, None, :], axis=1)[:, 0, :]
+            better = best_distances < self._exit_distances[members]
+            rows, cols = np.nonzero(better)
+            self._exit_distances[members[rows], cols] = best_distances[rows, cols]
+            self._exit_via[members[rows], cols] = positions[best[rows, cols]]
+            self._exit_room[members[rows], cols] = room
+
+    def __repr__(self):
+        return (f'{self.__class__.__name__}(n_nodes={len(self.node_names)}, n_rooms={len(self._room_members)}, '
+                f'n_doors={len(self.boundary)})')
+
+    @classmethod
+    def from_arrays(cls, door_arrays):
+        """
+        Builds the distances of a compiled door graph (MuseumGraphManager.door_arrays).
+        """
+        return cls(door_arrays['node_names'], door_arrays['edge_nodes'], door_arrays['edge_weight'],
+                   door_arrays['edge_room'])
+
+    @classmethod
+    def from_graph(cls, graph):
+        """
+        Builds the distances of a door graph whose links have 'weight' and 'room' attributes.
+        """
+        node_names = list(graph.nodes())
+        node_index = {name: idx for idx, name in enumerate(node_names)}
+        edges = list(graph.edges(data=True))
+        edge_nodes = [(node_index[u], node_index[v]) for u, v, _ in edges]
+        return cls(node_names, edge_nodes, [data['weight'] for _, _, data in edges],
+                   [data['room'] for _, _, data in edges])
+
+    def distance(self, origin, dest):
+        """
+        Walking distance between two nodes (np.inf if dest cannot be reached).
+        """
+        return self._best_route(self.node_index[origin], self.node_index[dest])[0]
+
+    def path(self, origin, dest):
+        """
+        Shortest path between two nodes, as a list of node names (both ends included).
+        Returns None if dest cannot be reached.
+        """
+        u, v = self.node_index[origin], self.node_index[dest]
+        distance, room, via = self._best_route(u, v)
+        if not np.isfinite(distance):
+            return None
+        if via < 0:
+            return [self.node_names[node] for node in self._room_path(room, u, v)]
+
+        # origin -> exit door (in the origin room) -> ... doors ... -> via (a door of the dest room) -> dest
+        path = [u]
+        exit_door = self._exit_via[u, via]
+        path += self._room_path(self._exit_room[u, via], u, self.boundary[exit_door])[1:]
+        boundary_path = _unwind(self._boundary_predecessors, exit_door, via)
+        for a, b in zip(boundary_path, boundary_path[1:]):
+            path += self._room_path(self._boundary_room[a, b], self.boundary[a], self.boundary[b])[1:]
+        path += self._room_path(room, self.boundary[via], v)[1:]
+        return [self.node_names[node] for node in path]
+
+    def matrix(self, nodes=None):
+        """
+        Dense distance matrix between the specified nodes (all nodes by default), in the same order.
+        """
+        ids = np.array([self.node_index[node] for node in nodes], dtype=np.int64) if nodes is not None \
+            else np.arange(len(self.node_names))
+        result = np.full((len(ids), len(ids)), np.inf)
+        for column, v in enumerate(ids.tolist()):
+            for room, v_position in self._node_rooms[v]:
+                local, positions = self._room_boundary[room]
+                distances = self._room_distances[room]
+                if len(local):
+                    through = (self._exit_distances[ids][:, positions] + distances[local, v_position][None, :]).min(1)
+                    result[:, column] = np.minimum(result[:, column], through)
+                # Nodes of the same room can go directly
+                members = self._room_members[room]
+                rows = np.flatnonzero(np.isin(ids, members))
+                direct = distances[np.searchsorted(members, ids[rows]), v_position]
+                result[rows, column] = np.minimum(result[rows, column], direct)
+        np.fill_diagonal(result, 0)
+        return result
+
+    def _best_route(self, u, v):
+        """
+        Returns (distance, room of dest, boundary position of the door used to enter that room or -1 if
+        the route goes directly inside a shared room).
+        """
+        if u == v:
+            room, _ = self._node_rooms[u][0] if self._node_rooms[u] else (-1, -1)
+            return 0.0, room, -1
+        best = (np.inf, -1, -1)
+        u_rooms = dict(self._node_rooms[u])
+        for room, v_position in self._node_rooms[v]:
+            distances = self._room_distances[room]
+            if room in u_rooms and distances[u_rooms[room], v_position] < best[0]:
+                best = (distances[u_rooms[room], v_position], room, -1)
+            local, positions = self._room_boundary[room]
+            if len(local):
+                through = self._exit_distances[u, positions] + distances[local, v_position]
+                k = int(np.argmin(through))
+                if through[k] < best[0]:
+                    best = (through[k], room, positions[k])
+        return float(best[0]), best[1], int(best[2])
+
+    def _room_path(self, room, u, v):
+        """
+        Shortest path (node ids) between two nodes of the same room, using only the links of the room.
+        """
+        members = self._room_members[room]
+        i, j = np.searchsorted(members, [u, v]).tolist()
+        return members[_unwind(self._room_predecessors[room], i, j)].tolist()
@@ -8,7 +8,6 @@ from space.Wall import Wall
 from agents.Exhibit import Exhibit
 from utils.utils import print_trace
 from datetime import timedelta
-import asyncio
 
 
 class Visitor(Agent):
@@ -62,7 +61,12 @@ class Visitor(Agent):
         print_trace(f'Accumulated rotation: {accumulated_rotation} rad')
 
         # Calculate next position and obtain collisions (if any) within the given field of view (FoV)
-        collision_object = self.room.check_collision(old_pos, movement_vector, self.fov)
+        walkability = self.model.walkability
+        if walkability is not None and walkability.circle_clear(self.room, old_pos + movement_vector, self.fov):
+            # Nothing in the FoV, without looking at the geometry of the room
+            collision_object = None
+        else:
+            collision_object = self.room.check_collision(old_pos, movement_vector, self.fov)
 
         if isinstance(collision_object, Wall):
             self.direction_vector = np.array((0, 0))
@@ -111,8 +115,7 @@ class Visitor(Agent):
                         # Interactive ML
                         e0 = self.edge_path[-2]
                         e1 = self.edge_path[-1]
-                        # self.model.mmas_controller.manual_pheromone_and_continue_iters((e0.name,e1.name))
-                        # asyncio.run(self.model.mmas_controller.manual_pheromone_and_continue_iters((e0.name,e1.name)))
+                        self.model.submit_iml_feedback((e0.name, e1.name))
                     print("GOT DOOR. Edge path: {0}".format(self.edge_path))
 
                 self.last_step_was_door = (False, None)  # reset
@@ -178,7 +181,7 @@ class Visitor(Agent):
                 e0 = self.edge_path[-2]
                 e1 = self.edge_path[-1]
                 print("EDGES to add pheromone to: ", e0.name, e1.name)
-                # self.model.mmas_controller.manual_pheromone_and_continue_iters((e0.name, e1.name))
+                self.model.submit_iml_feedback((e0.name, e1.name))
 
             print("EDGES: ", self.edge_path)
 
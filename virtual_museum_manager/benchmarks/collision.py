@@ -0,0 +1,164 @@
+"""
+Collision checks of Room: cached geometry engine (RoomCollisionEngine) against the shapely version.
+
+Usage (from virtual_museum_manager):
+
+    python -m benchmarks.collision --moves 20000 --record collision_trace.json
+    python -m benchmarks.collision --trace collision_trace.json
+
+Builds the rooms of resources/space.json and a trace of moves in them (random moves, moves
+close to the walls and moves through the doors), or loads a recorded one. Every move is
+checked with both versions: the decisions (None, Wall or the same Door) must be identical.
+Reports the time per move of both versions, and of the batched checks of CollisionKernel
+(all the moves of the trace at once), whose decisions must be the same too.
+"""
+import argparse
+import contextlib
+import io
+import json
+import math
+import random
+import time
+
+import numpy as np
+from shapely.geometry import Point
+
+from space.collision import CollisionKernel
+from space.Door import Door
+from space.Room import Room
+from space.Wall import Wall
+
+FOV = 30
+GRID_DIMENSIONS = (2900, 2400)
+
+
+def load_rooms(path='resources/space.json'):
+    with open(path, 'r') as f:
+        rooms_json = json.load(f)
+    return [Room(name=room['room_name'], vertices=room.get('vertices', []), doors=room.get('doors', []),
+                 exhibits=room.get('exhibits', []), grid_dimensions=GRID_DIMENSIONS) for room in rooms_json]
+
+
+def generate_trace(rooms, n_moves=20000, seed=0):
+    """
+    Moves as (room name, old position, movement vector): a third of them at random positions,
+    a third within 2 * FOV of a wall and a third around the doors, pointing at them.
+    """
+    rng = random.Random(seed)
+    trace = []
+    while len(trace) < n_moves:
+        room = rng.choice(rooms)
+        x_min, y_min, x_max, y_max = room.polygon.bounds
+        kind = len(trace) % 3
+        if kind == 2 and room.doors:
+            door = rng.choice(room.doors)
+            cx, cy = (door.start_point + door.end_point) / 2.0
+            position = (cx + rng.uniform(-2 * FOV, 2 * FOV), cy + rng.uniform(-2 * FOV, 2 * FOV))
+        elif kind == 1:
+            boundary = room.polygon.exterior
+            point = boundary.interpolate(rng.uniform(0, boundary.length))
+            position = (point.x + rng.uniform(-2 * FOV, 2 * FOV), point.y + rng.uniform(-2 * FOV, 2 * FOV))
+        else:
+            position = (rng.uniform(x_min, x_max), rng.uniform(y_min, y_max))
+        if not Point(position).intersects(room.polygon):
+            continue
+        if kind == 2 and room.doors:
+            # Towards the door, with some noise
+            angle = math.atan2(cy - position[1], cx - position[0]) + rng.gauss(0, 0.5)
+        else:
+            angle = rng.uniform(0, 2 * math.pi)
+        modulus = rng.uniform(1, 40)
+        trace.append((room.name, position, (modulus * math.cos(angle), modulus * math.sin(angle))))
+    return trace
+
+
+def decision(collision_object):
+    if isinstance(collision_object, Door):
+        return collision_object.name
+    if isinstance(collision_object, Wall):
+        return 'Wall'
+    return None
+
+
+def run(rooms, trace, repeats=3):
+    by_name = {room.name: room for room in rooms}
+    moves = [(by_name[name], np.array(position), np.array(vector)) for name, position, vector in trace]
+
+    mismatches = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i, (room, position, vector) in enumerate(moves):
+            shapely_decision = decision(room.check_collision_shapely(position, vector, FOV))
+            engine_decision = decision(room.check_collision(position, vector, FOV))
+            if shapely_decision != engine_decision:
+                mismatches.append({'move': i, 'shapely': shapely_decision, 'engine': engine_decision})
+
+        timings = {}
+        for label, method in (('shapely', Room.check_collision_shapely), ('engine', Room.check_collision)):
+            best = math.inf
+            for _ in range(repeats):
+                start = time.perf_counter()
+                for room, position, vector in moves:
+                    method(room, position, vector, FOV)
+                best = min(best, time.perf_counter() - start)
+            timings[label] = best / len(moves) * 1e6
+
+        # Batched checks
+        kernel = CollisionKernel(rooms)
+        room_ids = np.array([kernel.room_ids[room.name] for room, _, _ in moves])
+        positions = np.array([position for _, position, _ in moves])
+        vectors = np.array([vector for _, _, vector in moves])
+        best = math.inf
+        for _ in range(repeats):
+            start = time.perf_counter()
+            codes, door_ids = kernel.check_collisions(room_ids, positions, vectors, FOV)
+            best = min(best, time.perf_counter() - start)
+        timings['batch'] = best / len(moves) * 1e6
+
+    decisions = [decision(room.check_collision_shapely(p, v, FOV)) for room, p, v in moves]
+    batch_decisions = [kernel.doors[door].name if code == kernel.DOOR else 'Wall' if code == kernel.WALL else None
+                       for code, door in zip(codes, door_ids)]
+    batch_mismatches = [{'move': i, 'shapely': a, 'batch': b}
+                        for i, (a, b) in enumerate(zip(decisions, batch_decisions)) if a != b]
+    return {'n_moves': len(moves), 'mismatches': mismatches,
+            'n_wall': decisions.count('Wall'), 'n_door': sum(d not in (None, 'Wall') for d in decisions),
+            'us_per_move_shapely': timings['shapely'], 'us_per_move_engine': timings['engine'],
+            'speedup': timings['shapely'] / timings['engine'],
+            'batch_mismatches': batch_mismatches, 'us_per_move_batch': timings['batch'],
+            'n_exact_batch': kernel.n_exact // repeats,
+            'n_exact': sum(room.collision_engine.n_exact for room in rooms)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Collision checks of the cached geometry engine against shapely.')
+    parser.add_argument('--moves', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--trace', help='recorded trace to check instead of generating one')
+    parser.add_argument('--record', help='file where the generated trace is written')
+    args = parser.parse_args(argv)
+
+    rooms = load_rooms()
+    if args.trace:
+        with open(args.trace, 'r') as f:
+            trace = json.load(f)
+    else:
+        trace = generate_trace(rooms, n_moves=args.moves, seed=args.seed)
+        if args.record:
+            with open(args.record, 'w') as f:
+                json.dump(trace, f)
+            print(f'Trace written to {args.record}')
+
+    result = run(rooms, trace, repeats=args.repeats)
+    print(f'{result["n_moves"]} moves ({result["n_wall"]} walls, {result["n_door"]} doors): '
+          f'{len(result["mismatches"])} different decisions, {result["n_exact"]} predicates decided by shapely')
+    print(f'shapely {result["us_per_move_shapely"]:.1f} us/move, engine {result["us_per_move_engine"]:.1f} us/move '
+          f'({result["speedup"]:.1f}x)')
+    print(f'batch: {len(result["batch_mismatches"])} different decisions, {result["us_per_move_batch"]:.1f} us/move, '
+          f'{result["n_exact_batch"]} moves checked one by one')
+    for mismatch in (result['mismatches'] + result['batch_mismatches'])[:10]:
+        print(mismatch)
+    return result
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+import json
+import math
+import random
+
+
+def generate_floorplan(n_rooms, exhibits_per_room=5, room_width=500, room_height=400, door_width=100, seed=None):
+    """
+    Generates a synthetic floorplan with the same structure as resources/space.json.
+
+    Rooms are rectangles laid out in a grid (as square as possible), numbered row by row
+    starting at 1. Every pair of neighboring rooms is connected by a door in the middle of
+    their shared wall, and room 1 has an entrance door (D1-1) on its bottom wall.
+    Exhibits are hung along the walls of each room.
+
+    Parameters
+    ----------
+    n_rooms: number of rooms.
+    exhibits_per_room: number of exhibits in every room.
+    room_width, room_height: size of every room.
+    door_width: length of the door segments.
+    seed: seed used to place the exhibits along the walls.
+
+    Returns
+    -------
+    rooms (list dict): list of rooms, ready to be dumped as a space.json file.
+    """
+    rng = random.Random(seed)
+    n_cols = math.ceil(math.sqrt(n_rooms))
+
+    def position(room_number):
+        return (room_number - 1) % n_cols, (room_number - 1) // n_cols
+
+    def neighbors(room_number):
+        col, row = position(room_number)
+        candidates = []
+        if col > 0:
+            candidates.append(room_number - 1)
+        if col < n_cols - 1 and room_number + 1 <= n_rooms:
+            candidates.append(room_number + 1)
+        if row > 0:
+            candidates.append(room_number - n_cols)
+        if room_number + n_cols <= n_rooms:
+            candidates.append(room_number + n_cols)
+        return sorted(candidates)
+
+    rooms = []
+    for room_number in range(1, n_rooms + 1):
+        col, row = position(room_number)
+        x0, y0 = col * room_width, row * room_height
+        x1, y1 = x0 + room_width, y0 + room_height
+        xm, ym = (x0 + x1) / 2.0, (y0 + y1) / 2.0
+
+        doors = []
+        if room_number == 1:
+            doors.append(_door((xm - door_width / 2.0, y0), (xm + door_width / 2.0, y0), 1))
+        for neighbor in neighbors(room_number):
+            n_col, n_row = position(neighbor)
+            if n_col != col:
+                # Shared vertical wall
+                x = x1 if n_col > col else x0
+                doors.append(_door((x, ym - door_width / 2.0), (x, ym + door_width / 2.0), neighbor))
+            else:
+                # Shared horizontal wall
+                y = y1 if n_row > row else y0
+                doors.append(_door((xm - door_width / 2.0, y), (xm + door_width / 2.0, y), neighbor))
+
+        exhibits = []
+        for k in range(exhibits_per_room):
+            # Random point on the walls, slightly inside the room
+            side = rng.randrange(4)
+            t = rng.uniform(0.1, 0.9)
+            location = [(x0 + t * room_width, y0 + 3), (x1 - 3, y0 + t * room_height),
+                        (x0 + t * room_width, y1 - 3), (x0 + 3, y0 + t * room_height)][side]
+            exhibits.append({"name": f"Exhibit {room_number}-{k + 1}",
+                             "location": {"x": round(location[0], 2), "y": round(location[1], 2)}})
+
+        connected_rooms = ([1] if room_number == 1 else []) + neighbors(room_number)
+        rooms.append({"room_name": f"room_{room_number}",
+                      "vertices": [{"x": x0, "y": y0}, {"x": x1, "y": y0}, {"x": x1, "y": y1}, {"x": x0, "y": y1}],
+                      "connected_rooms": sorted(connected_rooms),
+                      "doors": doors,
+                      "exhibits": exhibits})
+    return rooms
+
+
+def write_floorplan(path, n_rooms, **kwargs):
+    """
+    Generates a synthetic floorplan (see generate_floorplan) and writes it as a space.json file.
+    """
+    rooms = generate_floorplan(n_rooms, **kwargs)
+    with open(path, 'w') as f:
+        json.dump(rooms, f, indent=2)
+    return rooms
+
+
+def _door(p_start, p_end, connects_to_room):
+    return {"p_start": {"x": p_start[0], "y": p_start[1]},
+            "p_end": {"x": p_end[0], "y": p_end[1]},
+            "connects_to_room": str(connects_to_room)}
@@ -0,0 +1,75 @@
+"""
+Checks of the state history (SnapshotStore) of AlgorithmController.
+
+Usage (from virtual_museum_manager):
+
+    python -m benchmarks.history --keep-last 2 --rounds 6
+
+For every engine, runs the solver on resources/space.json for several rounds of
+compute_next_iterations, holding a snapshot of every round. Checks that every snapshot,
+kept or evicted by the retention policy, still returns the pheromone vector it had when it
+was recorded, and that snapshots survive a pickle round trip (notebook
+save_algorithm_states_to_pickles / load_algorithm_states_from_pickles) without the store.
+"""
+import argparse
+import contextlib
+import io
+import json
+import pickle
+
+import numpy as np
+
+from aco.aco_final.AlgorithmController import AlgorithmController
+
+ENGINES = {'graph': {}, 'array': {'array_engine': True}, 'lazy': {'array_engine': True, 'lazy_evaporation': True},
+           'batch': {'batch_ants': True, 'seed': 0}}
+
+
+def check_history(rooms, engine, keep_last=2, rounds=6, n_ants=5, iterations=2):
+    with contextlib.redirect_stdout(io.StringIO()):
+        controller = AlgorithmController(rooms, num_ants=n_ants, history_keep_last=keep_last, **ENGINES[engine])
+        controller.compute_initial_iterations(limit=iterations)
+        snapshots = [controller.algorithm_states[-1]]
+        vectors = [snapshots[0].pheromone]
+        for _ in range(rounds):
+            controller.compute_next_iterations(limit=iterations)
+            snapshots.append(controller.algorithm_states[-1])
+            vectors.append(snapshots[-1].pheromone)
+
+    wrong_vectors = sum(not np.array_equal(s.pheromone, v) for s, v in zip(snapshots, vectors))
+    wrong_pickles, pickle_bytes = 0, []
+    for snapshot, vector in zip(snapshots, vectors):
+        data = pickle.dumps(snapshot)
+        pickle_bytes.append(len(data))
+        loaded = pickle.loads(data)
+        wrong_pickles += not (np.array_equal(loaded.pheromone, vector) and
+                              loaded.current_iteration == snapshot.current_iteration and
+                              loaded.limit == snapshot.limit and
+                              loaded.current_lower_bound == snapshot.current_lower_bound and
+                              loaded.record.cost == snapshot.record.cost and
+                              loaded.graph.number_of_edges() == snapshot.graph.number_of_edges())
+    return {'engine': engine, 'n_snapshots': len(snapshots), 'n_kept': len(controller.algorithm_states),
+            'wrong_vectors': wrong_vectors, 'wrong_pickles': wrong_pickles, 'max_pickle_bytes': max(pickle_bytes)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Checks of the state history of AlgorithmController.')
+    parser.add_argument('--engines', nargs='+', choices=list(ENGINES), default=list(ENGINES))
+    parser.add_argument('--keep-last', type=int, default=2)
+    parser.add_argument('--rounds', type=int, default=6)
+    args = parser.parse_args(argv)
+
+    with open('resources/space.json', 'r') as f:
+        rooms = json.load(f)
+    results = []
+    for engine in args.engines:
+        result = check_history(rooms, engine, keep_last=args.keep_last, rounds=args.rounds)
+        print(f'{engine}: {result["n_snapshots"]} snapshots ({result["n_kept"]} kept), '
+              f'{result["wrong_vectors"]} wrong pheromone vectors, {result["wrong_pickles"]} wrong pickles, '
+              f'pickles up to {result["max_pickle_bytes"]} bytes')
+        results.append(result)
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""
+Room lookup of the visitor (Museum.locate_visitor): RoomIndex against scanning every room.
+
+Usage (from virtual_museum_manager):
+
+    python -m benchmarks.room_lookup --sizes 14 100 500
+
+For resources/space.json and synthetic floorplans, walks a visitor through random positions
+(and positions on the walls and doors) and locates it with both methods. The rooms found
+must be the same. Reports the time per lookup of both methods.
+"""
+import argparse
+import math
+import random
+import time
+
+from benchmarks.collision import GRID_DIMENSIONS, load_rooms
+from benchmarks.floorplan import generate_floorplan
+from space.Room import Room
+from space.room_index import RoomIndex
+
+
+def scan(rooms, position):
+    for room in rooms:
+        if room.inside_room(position):
+            return room
+
+
+def walk(rooms, n_positions=20000, step=40, seed=0):
+    """
+    Random walk through the floorplan, with a position on a wall or a door every 10 steps.
+    """
+    rng = random.Random(seed)
+    x_min = min(room.polygon.bounds[0] for room in rooms)
+    y_min = min(room.polygon.bounds[1] for room in rooms)
+    x_max = max(room.polygon.bounds[2] for room in rooms)
+    y_max = max(room.polygon.bounds[3] for room in rooms)
+    x, y = rng.uniform(x_min, x_max), rng.uniform(y_min, y_max)
+    positions = []
+    while len(positions) < n_positions:
+        if len(positions) % 10 == 9:
+            room = rng.choice(rooms)
+            point = room.polygon.exterior.interpolate(rng.uniform(0, room.polygon.exterior.length))
+            if room.doors and rng.random() < 0.5:
+                door = rng.choice(room.doors)
+                point = door.door_line.interpolate(rng.random(), normalized=True)
+            positions.append((point.x, point.y))
+            continue
+        angle = rng.uniform(0, 2 * math.pi)
+        x = min(x_max, max(x_min, x + step * math.cos(angle)))
+        y = min(y_max, max(y_min, y + step * math.sin(angle)))
+        positions.append((x, y))
+    return positions
+
+
+def run(rooms, positions, repeats=3):
+    index = RoomIndex(rooms)
+    expected = [scan(rooms, position) for position in positions]
+
+    mismatches, current = 0, None
+    for position, room in zip(positions, expected):
+        found = index.locate(position, current=current)
+        mismatches += found is not room
+        current = found or current
+
+    timings = {}
+    for label in ('scan', 'index'):
+        best = math.inf
+        for _ in range(repeats):
+            current = None
+            start = time.perf_counter()
+            for position in positions:
+                if label == 'scan':
+                    scan(rooms, position)
+                else:
+                    current = index.locate(position, current=current) or current
+            best = min(best, time.perf_counter() - start)
+        timings[label] = best / len(positions) * 1e6
+    return {'n_rooms': len(rooms), 'n_positions': len(positions), 'mismatches': mismatches,
+            'grid': [index.n_cols, index.n_rows], 'us_per_lookup_scan': timings['scan'],
+            'us_per_lookup_index': timings['index']}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Room lookup with RoomIndex against scanning every room.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[14, 100, 500],
+                        help='rooms of the synthetic floorplans')
+    parser.add_argument('--positions', type=int, default=20000)
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    floorplans = {'space.json': load_rooms()}
+    for n_rooms in args.sizes:
+        rooms_json = generate_floorplan(n_rooms, exhibits_per_room=0, seed=0)
+        floorplans[f'synthetic_{n_rooms}'] = [Room(name=room['room_name'], vertices=room['vertices'],
+                                                   doors=room['doors'], exhibits=[], grid_dimensions=GRID_DIMENSIONS)
+                                              for room in rooms_json]
+    results = []
+    for name, rooms in floorplans.items():
+        result = run(rooms, walk(rooms, n_positions=args.positions), repeats=args.repeats)
+        result['floorplan'] = name
+        print(f'{name} ({result["n_rooms"]} rooms): {result["mismatches"]} different rooms, '
+              f'scan {result["us_per_lookup_scan"]:.1f} us/lookup, index {result["us_per_lookup_index"]:.1f} us/lookup')
+        results.append(result)
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+"""
+Benchmarks of the MMAS solver on synthetic floorplans of increasing size.
+
+Usage (from virtual_museum_manager):
+
+    python -m benchmarks.solver_benchmarks --sizes 14 100 500 --output benchmark_results.json
+
+Every benchmark is repeated and the raw timings are written, together with the
+environment and the size of the graphs, to a JSON file that can be compared between releases.
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import platform
+import random
+import statistics
+import time
+
+import networkx as nx
+import numpy as np
+
+from aco.aco_final.AlgorithmController import AlgorithmController
+from aco.aco_final.MuseumGraphManager import MuseumGraphManager
+from aco.aco_final.ant import Ant, Colony
+from aco.aco_final.solvers import Solver
+from benchmarks.floorplan import generate_floorplan
+
+DEFAULT_SIZES = (14, 100, 500)
+
+# Solver options of every pheromone engine / tour construction mode
+ENGINES = {
+    'graph': {},
+    'array': {'array_engine': True},
+    'lazy': {'lazy_evaporation': True},
+    'batch': {'batch_ants': True},
+    'hierarchical': {'hierarchical': True, 'array_engine': True},
+}
+
+
+def _timed(function, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        # The solver reports its progress with prints: keep the benchmark output clean
+        with contextlib.redirect_stdout(io.StringIO()):
+            function()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def _initialised_graph(rooms):
+    graph_manager = MuseumGraphManager(rooms)
+    graph = graph_manager.door_graph
+    graph_manager.initialise_pheromones(graph)
+    return graph
+
+
+def bench_graph_construction(rooms, repeats=3, **kwargs):
+    times = _timed(lambda: MuseumGraphManager(rooms), repeats)
+    return {'times_s': times}
+
+
+def bench_construct_tour(rooms, repeats=3, n_tours=10, **kwargs):
+    graph = _initialised_graph(rooms)
+    ant = Ant()
+    times = _timed(lambda: [ant.construct_tour(graph) for _ in range(n_tours)], repeats)
+    return {'times_s': times, 'n_tours': n_tours,
+            'tours_per_s': n_tours / statistics.median(times)}
+
+
+def bench_solver_iterations(rooms, repeats=3, n_ants=20, iterations=5, engine='graph', **kwargs):
+    def run():
+        graph = _initialised_graph(rooms)
+        solver = Solver(rho=0.02, pts=False, **ENGINES[engine])
+        solver.optimize(graph, Colony(), n_ants, iterations, 1, 'D1-1')
+
+    times = _timed(run, repeats)
+    return {'times_s': times, 'n_ants': n_ants, 'iterations': iterations,
+            'iterations_per_s': iterations / statistics.median(times)}
+
+
+def bench_compute_next_iterations(rooms, repeats=3, n_ants=20, iterations=5, engine='graph', **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        controller = AlgorithmController(rooms, num_ants=n_ants, **ENGINES[engine])
+        controller.compute_initial_iterations(limit=iterations)
+    times = _timed(lambda: controller.compute_next_iterations(limit=iterations), repeats)
+    controller.close()
+    return {'times_s': times, 'n_ants': n_ants, 'iterations': iterations,
+            'latency_s': statistics.median(times)}
+
+
+BENCHMARKS = {
+    'graph_construction': bench_graph_construction,
+    'construct_tour': bench_construct_tour,
+    'solver_iterations': bench_solver_iterations,
+    'compute_next_iterations': bench_compute_next_iterations,
+}
+
+
+def run_benchmarks(sizes=DEFAULT_SIZES, benchmarks=None, exhibits_per_room=5, repeats=3, seed=0, engine='graph',
+                   **kwargs):
+    """
+    Runs the selected benchmarks (all of them by default) on a synthetic floorplan of every size.
+
+    Returns
+    -------
+    report (dict): environment information and one result per (benchmark, size).
+    """
+    benchmarks = benchmarks if benchmarks is not None else list(BENCHMARKS)
+    results = []
+    for n_rooms in sizes:
+        rooms = generate_floorplan(n_rooms, exhibits_per_room=exhibits_per_room, seed=seed)
+        graph = MuseumGraphManager(rooms).door_graph
+        for name in benchmarks:
+            # Same random choices for every run of the benchmark
+            random.seed(seed)
+            print(f'Running {name} with {n_rooms} rooms...')
+            result = BENCHMARKS[name](rooms, repeats=repeats, engine=engine, **kwargs)
+            times = result['times_s']
+            result.update(benchmark=name, n_rooms=n_rooms, exhibits_per_room=exhibits_per_room,
+                          n_nodes=graph.number_of_nodes(), n_edges=graph.number_of_edges(),
+                          engine=engine, repeats=repeats, median_s=statistics.median(times), min_s=min(times))
+            print(f'    median {result["median_s"]:.4f} s')
+            results.append(result)
+
+    return {'created': datetime.datetime.now().isoformat(timespec='seconds'),
+            'environment': {'python': platform.python_version(),
+                            'platform': platform.platform(),
+                            'numpy': np.__version__,
+                            'networkx': nx.__version__},
+            'results': results}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='MMAS solver benchmarks on synthetic floorplans.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES), help='number of rooms')
+    parser.add_argument('--benchmarks', nargs='+', choices=list(BENCHMARKS), default=None)
+    parser.add_argument('--exhibits-per-room', type=int, default=5)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--ants', type=int, default=20)
+    parser.add_argument('--iterations', type=int, default=5)
+    parser.add_argument('--engine', choices=list(ENGINES), default='graph',
+                        help='pheromone engine used by the solver benchmarks')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='benchmark_results.json')
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(sizes=args.sizes, benchmarks=args.benchmarks, exhibits_per_room=args.exhibits_per_room,
+                            repeats=args.repeats, seed=args.seed, engine=args.engine, n_ants=args.ants, iterations=args.iterations)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'Results written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
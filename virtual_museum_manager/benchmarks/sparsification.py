@@ -0,0 +1,97 @@
+"""
+Solution quality / throughput trade-off of the sparsification of the room cliques.
+
+Usage (from virtual_museum_manager):
+
+    python -m benchmarks.sparsification --k 2 4 8 --output sparsification_results.json
+
+For every floorplan (resources/space.json and synthetic floorplans) and every k (plus the
+full graph), reports the links removed, the solver iterations per second and the best tour
+cost after a fixed number of iterations (averaged over several seeds).
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import random
+import statistics
+import time
+
+from aco.aco_final.MuseumGraphManager import MuseumGraphManager
+from aco.aco_final.ant import Colony
+from aco.aco_final.sparsification import summarize
+from aco.aco_final.solvers import Solver
+from benchmarks.floorplan import generate_floorplan
+from benchmarks.solver_benchmarks import ENGINES
+
+
+def benchmark_floorplans(synthetic_sizes=(14, 100), exhibits_per_room=20):
+    with open('resources/space.json', 'r') as f:
+        floorplans = {'space.json': json.load(f)}
+    for n_rooms in synthetic_sizes:
+        floorplans[f'synthetic_{n_rooms}x{exhibits_per_room}'] = generate_floorplan(
+            n_rooms, exhibits_per_room=exhibits_per_room, seed=0)
+    return floorplans
+
+
+def run_tradeoff(floorplans, ks=(2, 4, 8), n_ants=20, iterations=10, seeds=(0, 1, 2), engine='batch'):
+    """
+    Returns one result per (floorplan, k), k None being the full graph.
+    """
+    results = []
+    for name, rooms in floorplans.items():
+        for k in (None,) + tuple(ks):
+            graph_manager = MuseumGraphManager(rooms, sparsify=k)
+            graph = graph_manager.door_graph
+            costs, times = [], []
+            for seed in seeds:
+                random.seed(seed)
+                g = graph.copy()
+                graph_manager.initialise_pheromones(g)
+                options = dict(ENGINES[engine])
+                if options:
+                    options['seed'] = seed
+                solver = Solver(rho=0.02, pts=False, **options)
+                start = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    solver.optimize(g, Colony(), n_ants, iterations, 1, 'D1-1')
+                times.append(time.perf_counter() - start)
+                costs.append(solver.state.record.cost)
+
+            result = {'floorplan': name, 'k': k, 'engine': engine, 'n_nodes': graph.number_of_nodes(),
+                      'n_edges': graph.number_of_edges(), 'iterations': iterations, 'n_ants': n_ants,
+                      'iterations_per_s': iterations / statistics.median(times),
+                      'mean_best_cost': statistics.mean(costs), 'best_costs': costs}
+            if k is not None:
+                result.update(summarize(graph_manager.sparsification_report))
+                result['rooms'] = graph_manager.sparsification_report
+            print(f'{name} k={k}: {result["n_edges"]} links, {result["iterations_per_s"]:.2f} it/s, '
+                  f'mean best cost {result["mean_best_cost"]:.1f}')
+            results.append(result)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Sparsification trade-off on the benchmark floorplans.')
+    parser.add_argument('--k', type=int, nargs='+', default=[2, 4, 8], help='nearest neighbors kept')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[14, 100], help='rooms of the synthetic floorplans')
+    parser.add_argument('--exhibits-per-room', type=int, default=20)
+    parser.add_argument('--ants', type=int, default=20)
+    parser.add_argument('--iterations', type=int, default=10)
+    parser.add_argument('--seeds', type=int, nargs='+', default=[0, 1, 2])
+    parser.add_argument('--engine', choices=list(ENGINES), default='batch')
+    parser.add_argument('--output', default='sparsification_results.json')
+    args = parser.parse_args(argv)
+
+    floorplans = benchmark_floorplans(args.sizes, args.exhibits_per_room)
+    results = run_tradeoff(floorplans, ks=args.k, n_ants=args.ants, iterations=args.iterations,
+                           seeds=args.seeds, engine=args.engine)
+    with open(args.output, 'w') as f:
+        json.dump({'created': datetime.datetime.now().isoformat(timespec='seconds'), 'results': results}, f,
+                  indent=2)
+    print(f'Results written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
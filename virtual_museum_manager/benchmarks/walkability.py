@@ -0,0 +1,88 @@
+"""
+Movement checks with the walkability raster (WalkabilityRaster) against the exact geometry.
+
+Usage (from virtual_museum_manager):
+
+    python -m benchmarks.walkability --moves 20000 --cell-size 5
+
+On the collision trace of benchmarks.collision, checks that every move the raster declares
+clear (circle_clear) is not a collision for Room.check_collision, and that every room the
+raster finds (room_at) is the room found by scanning the rooms. Reports the share of moves
+answered by the raster, the time per move and the time to build and to load the raster.
+"""
+import argparse
+import contextlib
+import io
+import math
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.collision import FOV, GRID_DIMENSIONS, generate_trace, load_rooms
+from benchmarks.room_lookup import scan
+from space.walkability import WalkabilityRaster
+
+
+def run(rooms, trace, cell_size=5, repeats=3):
+    width, height = GRID_DIMENSIONS
+    start = time.perf_counter()
+    raster = WalkabilityRaster(rooms, width, height, cell_size=cell_size, portal_radius=FOV)
+    build_time = time.perf_counter() - start
+    with tempfile.TemporaryDirectory() as cache_dir:
+        WalkabilityRaster.load_or_build([], rooms, width, height, cell_size=cell_size, cache_dir=cache_dir)
+        start = time.perf_counter()
+        WalkabilityRaster.load_or_build([], rooms, width, height, cell_size=cell_size, cache_dir=cache_dir)
+        load_time = time.perf_counter() - start
+
+    by_name = {room.name: room for room in rooms}
+    moves = [(by_name[name], np.array(position), np.array(vector)) for name, position, vector in trace]
+    wrong_clear = wrong_room = n_clear = n_room = 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        for room, position, vector in moves:
+            if raster.circle_clear(room, position + vector, FOV):
+                n_clear += 1
+                wrong_clear += room.check_collision(position, vector, FOV) is not None
+            found = raster.room_at(position + vector)
+            if found is not None:
+                n_room += 1
+                wrong_room += found is not scan(rooms, position + vector)
+
+        timings = {}
+        for label in ('exact', 'raster'):
+            best = math.inf
+            for _ in range(repeats):
+                start = time.perf_counter()
+                for room, position, vector in moves:
+                    if label == 'exact' or not raster.circle_clear(room, position + vector, FOV):
+                        room.check_collision(position, vector, FOV)
+                best = min(best, time.perf_counter() - start)
+            timings[label] = best / len(moves) * 1e6
+
+    return {'n_moves': len(moves), 'cell_size': cell_size, 'wrong_clear': wrong_clear, 'wrong_room': wrong_room,
+            'clear_rate': n_clear / len(moves), 'room_rate': n_room / len(moves),
+            'us_per_move_exact': timings['exact'], 'us_per_move_raster': timings['raster'],
+            'build_s': build_time, 'load_s': load_time}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Movement checks with the walkability raster.')
+    parser.add_argument('--moves', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--cell-size', type=float, default=5)
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    rooms = load_rooms()
+    result = run(rooms, generate_trace(rooms, n_moves=args.moves, seed=args.seed), cell_size=args.cell_size,
+                 repeats=args.repeats)
+    print(f'{result["n_moves"]} moves: {result["clear_rate"]:.0%} clear from the raster '
+          f'({result["wrong_clear"]} wrong), {result["room_rate"]:.0%} rooms from the raster '
+          f'({result["wrong_room"]} wrong)')
+    print(f'exact {result["us_per_move_exact"]:.1f} us/move, with the raster {result["us_per_move_raster"]:.1f} '
+          f'us/move; raster built in {result["build_s"]:.2f} s, loaded in {result["load_s"]:.3f} s')
+    return result
+
+
+if __name__ == '__main__':
+    main()
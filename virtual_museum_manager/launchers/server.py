@@ -45,7 +45,21 @@ model_params = {
     "exhibit_radius": exhibit_radius,
     "width": 2900,
     "height": 2400,
-    "rooms_json": rooms_json
+    "rooms_json": rooms_json,
+    # Movement checks with array lookups far from walls and doors (raster cached in resources/)
+    "walkability_cell_size": 5
 }
 
-server = MuseumServer(Museum, [museum_canvas], "SIMLER", model_params)
+# MMAS trained in the background with the visitors' feedback
+iml_params = {
+    "raw_museum_floorplan": rooms_json,
+    "alpha": 1,
+    "beta": 3,
+    "rho": 0.02,
+    "num_ants": 100,
+    "batch_ants": True,
+    "start_room": 1,
+    "start_node": "D1-1"
+}
+
+server = MuseumServer(Museum, [museum_canvas], "SIMLER", model_params, iml_params=iml_params)
@@ -113,6 +113,8 @@ from mesa.visualization.UserParam import UserSettableParameter
 # pylint: disable=attribute-defined-outside-init
 
 # Change the event loop policy for windows
+from aco.aco_final.AlgorithmController import AlgorithmController
+from aco.aco_final.iml_worker import ImlSolverWorker
 from launchers.server_config.museum_rest_api import api_handlers
 from utils.utils import print_trace
 
@@ -261,9 +263,12 @@ class MuseumServer(tornado.web.Application):
     EXCLUDE_LIST = ("width", "height")
 
     def __init__(
-            self, model_cls, visualization_elements, name="Mesa Model", model_params={}
+            self, model_cls, visualization_elements, name="Mesa Model", model_params={}, iml_params=None
     ):
-        """ Create a new visualization server with the given elements. """
+        """ Create a new visualization server with the given elements.
+        If iml_params (AlgorithmController parameters) are specified, visitor feedback is used
+        to train the MMAS algorithm in a background worker.
+        """
         # Prep visualization elements:
         self.visualization_elements = visualization_elements
         self.package_includes = set()
@@ -286,6 +291,9 @@ class MuseumServer(tornado.web.Application):
             self.description = model_cls.__doc__
 
         self.model_kwargs = model_params
+
+        # The iML worker outlives model resets, so the learned knowledge is kept between visits
+        self.iml_worker = ImlSolverWorker(AlgorithmController(**iml_params)) if iml_params is not None else None
         self.reset_model()
 
         # Initializing the application itself:
@@ -315,6 +323,7 @@ class MuseumServer(tornado.web.Application):
                 model_params[key] = val
 
         self.model = self.model_cls(**model_params)
+        self.model.iml_worker = self.iml_worker
         print("Model has been reset!")
 
     def render_model(self):
@@ -330,6 +339,8 @@ class MuseumServer(tornado.web.Application):
 
     async def launch(self, port=None, open_browser=True, autoreload=False):
         self._configure_api_handlers()
+        if self.iml_worker is not None:
+            self.iml_worker.start()
         await self._launch_modular_server(port=port, open_browser=open_browser, autoreload=autoreload)
 
     def _configure_api_handlers(self):
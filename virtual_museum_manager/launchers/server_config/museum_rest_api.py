@@ -68,12 +68,22 @@ class MuseumAPI(RequestHandler, ABC):
             modulus_multiplier = instruction_data.get("modulus_multiplier")
             self.move_with_obstacles(movement_direction, axis_rotation_angle, modulus_multiplier)
 
+        elif instruction_type == "move_visitor_batch":
+            # Ordered list of moves: dicts with the data of move_visitor, or [direction, rotation, modulus_multiplier]
+            steps = instruction_data.get("steps")
+            self.move_batch_with_obstacles(steps)
+
         elif instruction_type == "watch_painting":
             painting_name = instruction_data.get("painting_name")
             self.model.visitor.watch_painting(painting_name)
             response_payload = {'travel_score': self.model.visitor.travel_score}
             self.write(json.dumps(response_payload))
 
+        elif instruction_type == "get_best_route":
+            iml_worker = self.mesa_manager.iml_worker
+            best_route = iml_worker.best_route if iml_worker is not None else None
+            self.write(json.dumps({'best_route': best_route}))
+
         elif instruction_type == "reset":
             await self.reset_simulation()
 
@@ -100,6 +110,65 @@ class MuseumAPI(RequestHandler, ABC):
         response_payload = {'movement_allowed': can_visitor_move, 'travel_score': self.model.visitor.travel_score}
         self.write(json.dumps(response_payload))
 
+    def move_batch_with_obstacles(self, steps):
+        """
+        Applies several moves in one request (fast input of the client). Every move is checked from
+        the position left by the previous one, as with one move_visitor per move, but the model is
+        stepped and the response written once.
+
+        @param steps: ordered list of moves (direction, rotation, modulus_multiplier).
+        @return: writes the 'movement_allowed' of every move and the final 'travel_score'.
+        """
+        # Every step is validated before moving the visitor, so a bad request leaves it where it was
+        try:
+            moves = self._parse_steps(steps)
+        except ValueError as e:
+            self.set_status(400)
+            self.write(f'Error: {e}')
+            return
+
+        visitor = self.model.visitor
+        movements_allowed = []
+        for movement_direction, axis_rotation_angle, modulus_multiplier in moves:
+            movements_allowed.append(visitor.calculate_movement_vector(
+                movement_direction, axis_rotation_angle, modulus_multiplier=modulus_multiplier))
+            # Apply the move now, so the next one starts from the new position (what the visitor does on model.step)
+            visitor.step()
+        self.model.step()
+
+        print_trace(f"New position after {len(steps)} moves: {visitor.pos}")
+        response_payload = {'movement_allowed': movements_allowed, 'travel_score': visitor.travel_score}
+        self.write(json.dumps(response_payload))
+
+    @staticmethod
+    def _parse_steps(steps):
+        """
+        Moves of a move_visitor_batch request as (direction, rotation, modulus_multiplier) tuples.
+
+        @param steps: list of moves, as dicts or as [direction, rotation, modulus_multiplier] lists.
+        @return: list of moves, with rotation and modulus_multiplier as floats.
+        @raise ValueError: if steps is not a list or some step is malformed.
+        """
+        if not isinstance(steps, list):
+            raise ValueError('move_visitor_batch needs a list of steps')
+        moves = []
+        for i, step in enumerate(steps):
+            if isinstance(step, dict):
+                step = (step.get("direction"), step.get("rotation"), step.get("modulus_multiplier"))
+            elif not isinstance(step, (list, tuple)) or len(step) != 3:
+                raise ValueError(f'step {i} must be an object or a list [direction, rotation, modulus_multiplier]')
+            movement_direction, axis_rotation_angle, modulus_multiplier = step
+            if not isinstance(movement_direction, str):
+                raise ValueError(f'step {i} has no direction')
+            try:
+                axis_rotation_angle, modulus_multiplier = float(axis_rotation_angle), float(modulus_multiplier)
+            except (TypeError, ValueError):
+                raise ValueError(f'step {i} needs numeric rotation and modulus_multiplier')
+            if not np.isfinite([axis_rotation_angle, modulus_multiplier]).all():
+                raise ValueError(f'step {i} needs finite rotation and modulus_multiplier')
+            moves.append((movement_direction, axis_rotation_angle, modulus_multiplier))
+        return moves
+
     def set_position(self, position):
         pos_x = position["x"]
         pos_y = position["y"]
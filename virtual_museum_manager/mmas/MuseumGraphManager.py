@@ -201,8 +201,9 @@ class MuseumGraphManager:
             return graph[node]
 
     def _nearest_neighbor_heuristic(self, graph, start, objectives):
-        sps = [nx.shortest_path_length(graph, source=start,
-                                       target=objective, weight='weight') for objective in objectives]
+        # A single Dijkstra for all objectives
+        lengths = nx.single_source_dijkstra_path_length(graph, start, weight='weight')
+        sps = [lengths[objective] for objective in objectives]
         furthest_exhibit = max(sps)
         sum_paths = sum(sps)
         estimated_cost = sum_paths / 1.8
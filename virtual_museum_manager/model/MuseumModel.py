@@ -22,9 +22,12 @@ from agents.Exhibit import Exhibit
 from agents.Visitor import Visitor
 from space.Door import Door
 from space.Room import Room
+from space.room_index import RoomIndex
+from space.walkability import WalkabilityRaster
 
 from aco.aco_final.AlgorithmController import AlgorithmController
 from aco.aco_final.MuseumGraphManager import MuseumGraphManager
+from aco.aco_final.graph_cache import GraphCache
 from utils.utils import print_trace
 
 
@@ -40,10 +43,14 @@ class Museum(Model):
             exhibit_radius=4,
             width=100,
             height=100,
-            rooms_json=None
+            rooms_json=None,
+            walkability_cell_size=None
     ):
         """
         Create a new Museum model.
+
+        walkability_cell_size: cell size of the walkability raster used for the movement checks
+        (None to always use the exact geometry, see WalkabilityRaster).
        """
         super().__init__()
         self.schedule = RandomActivation(self)
@@ -63,6 +70,10 @@ class Museum(Model):
 
         # Functions to execute at the instantiation time of the model
         self.create_floor_plan()
+        # Cached on disk next to space.json (keyed by the floorplan content)
+        self.walkability = WalkabilityRaster.load_or_build(
+            self.rooms_json, self.obstacle_map, width, height,
+            cell_size=walkability_cell_size) if walkability_cell_size is not None else None
 
         self.visitor = None
         self.visitor_start_pos = np.array((1450, 2300))  # 1450 2300
@@ -73,7 +84,11 @@ class Museum(Model):
         # self.choose_exhibits_and_place_all()
 
         # self.choose_exhibits_and_place_agents(["room_13"])
-        self.graph_manager = MuseumGraphManager(self.rooms_json)
+        # Compiled graphs are cached on disk (keyed by the floorplan content), see GraphCache
+        self.graph_manager = GraphCache().get_manager(self.rooms_json)
+
+        # Background iML solver (owned by the server, see MuseumServer.iml_worker)
+        self.iml_worker = None
 
         # self.config_mmas()
         # self.initial_iterations = 10
@@ -145,6 +160,9 @@ class Museum(Model):
 
             self.obstacle_map.append(room_object)
 
+        # Grid of candidate rooms for locate_visitor
+        self.room_index = RoomIndex(self.obstacle_map)
+
     def locate_visitor(self, locate_start=False):
         """
         Function that checks where is the visitor located, and thus outputs
@@ -159,10 +177,14 @@ class Museum(Model):
         -------
         room (Room): room where visitor is located in.
         """
-
-        for room in self.obstacle_map:
-            if room.inside_room(self.visitor.pos):
+        if self.walkability is not None:
+            # Far from the walls, the raster knows the room
+            room = self.walkability.room_at(self.visitor.pos)
+            if room is not None:
                 return room
+        # The current room and its neighbors are tried first (see RoomIndex)
+        current = None if locate_start else self.visitor.room
+        return self.room_index.locate(self.visitor.pos, current=current)
 
     def step(self):
         self.schedule.step()
@@ -245,6 +267,13 @@ class Museum(Model):
         # ac.compute_initial_iterations(limit=initial_iters)
         return ac
 
+    def submit_iml_feedback(self, edge):
+        """
+        Sends a travelled edge (u, v) to the background iML solver, without waiting for it.
+        """
+        if self.iml_worker is not None:
+            self.iml_worker.submit_feedback(edge)
+
     def get_tour_data(self):
         print("*******************************")
         print("      Retrieving Tour Data     ")
@@ -2,6 +2,7 @@ import numpy as np
 import re
 from shapely.geometry import Point, Polygon, LineString
 
+from space.collision import RoomCollisionEngine
 from space.Door import Door
 from space.Wall import Wall
 from utils.utils import print_trace
@@ -36,6 +37,8 @@ class Room:
         self.polygon = Polygon(self.vertices)
         self.doors = self._create_doors(doors)
         self.exhibits = self._create_exhibits(exhibits)
+        # Cached geometry for the collision checks of every move
+        self.collision_engine = RoomCollisionEngine(self.polygon, self.doors)
 
     def inside_room(self, position):
         """
@@ -56,7 +59,21 @@ class Room:
         return point.intersects(self.polygon)
 
     def check_collision(self, old_position, movement_vector, fov):
-        """ Checks collisions of the specified movement
+        """ Checks collisions of the specified movement (see RoomCollisionEngine)
+
+        @param old_position: current visitor's position
+        @param movement_vector: movement vector that defines which will be
+        the new position of the visitor
+        @param fov: range of collision detection
+        @return: object with which visitor collides (Door, Wall or None if there is no collision)
+        """
+        if not np.any(movement_vector):
+            # Degenerate (zero length) rays
+            return self.check_collision_shapely(old_position, movement_vector, fov)
+        return self.collision_engine.check_collision(old_position, movement_vector, fov)
+
+    def check_collision_shapely(self, old_position, movement_vector, fov):
+        """ Checks collisions of the specified movement, building the shapely geometries on every call
 
         @param old_position: current visitor's position
         @param movement_vector: movement vector that defines which will be
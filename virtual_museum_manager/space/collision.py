@@ -0,0 +1,401 @@
+import math
+
+import numpy as np
+from shapely.geometry import LineString, Point
+
+from space.Wall import Wall
+from utils.utils import print_trace
+
+# Point.buffer builds the FoV circle as a 64-gon inscribed in the true circle, so it contains
+# every point closer than fov * cos(pi / 64) to the center, and nothing farther than fov
+BUFFER_INRADIUS = math.cos(math.pi / 64)
+# Cases closer than this to a decision boundary are decided with the exact shapely predicates
+RELATIVE_TOLERANCE = 1e-9
+ABSOLUTE_TOLERANCE = 1e-7
+
+
+def point_segment_distance(px, py, ax, ay, bx, by):
+    dx, dy = bx - ax, by - ay
+    length2 = dx * dx + dy * dy
+    t = 0.0 if length2 == 0 else max(0.0, min(1.0, ((px - ax) * dx + (py - ay) * dy) / length2))
+    return math.hypot(px - ax - t * dx, py - ay - t * dy)
+
+
+def segment_relation(px, py, qx, qy, ax, ay, bx, by):
+    """
+    Relation between segments pq and ab.
+
+    Returns
+    -------
+    1 if they cross, -1 if they are apart, 0 if they (almost) touch or are (almost) collinear,
+    i.e. when floating point rounding could change the answer.
+    """
+    abx, aby, pqx, pqy = bx - ax, by - ay, qx - px, qy - py
+    o1 = abx * (py - ay) - aby * (px - ax)
+    o2 = abx * (qy - ay) - aby * (qx - ax)
+    o3 = pqx * (ay - py) - pqy * (ax - px)
+    o4 = pqx * (by - py) - pqy * (bx - px)
+    e1 = ABSOLUTE_TOLERANCE * math.hypot(abx, aby)
+    e2 = ABSOLUTE_TOLERANCE * math.hypot(pqx, pqy)
+    if min(abs(o1), abs(o2)) <= e1 or min(abs(o3), abs(o4)) <= e2:
+        return 0
+    # Otherwise every endpoint is farther than the tolerance from the line of the other segment,
+    # and so is the other segment if they do not cross
+    return 1 if (o1 > 0) != (o2 > 0) and (o3 > 0) != (o4 > 0) else -1
+
+
+class RoomCollisionEngine:
+    """
+    Collision checks of a Room, built once per room.
+
+    Room.check_collision used to build shapely objects on every move (the FoV circle as a
+    buffered polygon, the movement and direction rays) and test them against the room
+    polygon and door lines. Here the boundary and door segments are cached as plain
+    coordinates and the same predicates are answered with analytic tests (point/segment
+    distances against the FoV radius, segment orientation tests). Only the cases that fall
+    within a rounding tolerance of a decision boundary are handed to the shapely predicates
+    the shapely version uses, so decisions are the same. They take the room polygon as second
+    argument, so the room polygon being prepared (see RoomIndex) does not change them: prepared
+    predicates decide some degenerate cases (rays through a vertex) differently.
+
+    Parameters
+    ----------
+    polygon: shapely Polygon of the room.
+    doors: Door objects of the room.
+
+    """
+
+    def __init__(self, polygon, doors):
+        self.polygon = polygon
+        coords = list(polygon.exterior.coords)
+        self.boundary = [(x1, y1, x2, y2) for (x1, y1), (x2, y2) in zip(coords, coords[1:])]
+        self.doors = doors
+        self.door_segments = [(float(door.start_point[0]), float(door.start_point[1]),
+                               float(door.end_point[0]), float(door.end_point[1])) for door in doors]
+        # Number of predicates decided by shapely (near a decision boundary)
+        self.n_exact = 0
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(n_segments={len(self.boundary)}, n_doors={len(self.doors)})'
+
+    def check_collision(self, old_position, movement_vector, fov):
+        """
+        Same as Room.check_collision_shapely: Door, Wall or None.
+        """
+        ox, oy = float(old_position[0]), float(old_position[1])
+        vx, vy = float(movement_vector[0]), float(movement_vector[1])
+        x, y = ox + vx, oy + vy
+
+        if self.circle_within(x, y, fov):
+            print_trace('No obstacles found. Advance.')
+            return None
+
+        # Direction ray (2 * fov times the movement vector, centered at the new position),
+        # its perpendicular and the movement line, as (x1, y1, x2, y2)
+        direction_ray = (x - vx * fov, y - vy * fov, x + vx * fov, y + vy * fov)
+        perpendicular_ray = (x + vy * fov, y - vx * fov, x - vy * fov, y + vx * fov)
+        movement_line = (ox, oy, x, y)
+
+        for door, segment in zip(self.doors, self.door_segments):
+            if door.name == '1_1' or not self.circle_intersects(x, y, fov, door, segment):
+                continue
+            ray_intersects_door = self.segments_intersect(direction_ray, door, segment)
+            crossing_door = ray_intersects_door and self.segments_intersect(movement_line, door, segment)
+            moving_away_from_door = ((ray_intersects_door or self.segments_intersect(perpendicular_ray, door, segment))
+                                     and self.farther(x, y, ox, oy, door, segment))
+
+            # Visitor is approaching or moving away from the door
+            if (ray_intersects_door or moving_away_from_door) and not crossing_door:
+                print_trace('Moving around door {}'.format(door.name))
+                return None
+            # Visitor is crossing a door with this movement
+            elif crossing_door:
+                print_trace('Crossing door {}'.format(door.name))
+                return door if door.name != 'D1-1' else Wall()
+
+        norm = math.sqrt(vx * vx + vy * vy) + 1e-16
+        direction_ray_forward = (x, y, x + vx / norm * fov, y + vy / norm * fov)
+        if self.segment_within(*direction_ray_forward):
+            return None
+        elif not self.segment_within(*direction_ray) or not self.segment_within(*perpendicular_ray):
+            print_trace('Intersecting wall')
+            return Wall()
+        return None
+
+    # Predicates
+
+    def contains_point(self, x, y):
+        """
+        Ray casting test, only used far from the boundary (where it is exact).
+        """
+        inside = False
+        for x1, y1, x2, y2 in self.boundary:
+            if (y1 > y) != (y2 > y) and x < x1 + (y - y1) * (x2 - x1) / (y2 - y1):
+                inside = not inside
+        return inside
+
+    def boundary_distance(self, x, y):
+        return min(point_segment_distance(x, y, *segment) for segment in self.boundary)
+
+    def circle_within(self, x, y, fov):
+        distance = self.boundary_distance(x, y)
+        if distance >= fov * (1 + RELATIVE_TOLERANCE):
+            # Whole circle on one side of the boundary
+            return self.contains_point(x, y)
+        if distance < fov * BUFFER_INRADIUS * (1 - RELATIVE_TOLERANCE):
+            # The boundary goes through the (buffered) circle
+            return False
+        self.n_exact += 1
+        return Point(x, y).buffer(fov).within(self.polygon)
+
+    def segment_within(self, x1, y1, x2, y2):
+        relations = [segment_relation(x1, y1, x2, y2, *segment) for segment in self.boundary]
+        if 1 in relations:
+            # Crosses a wall
+            return False
+        if 0 not in relations:
+            # The segment does not touch the boundary: it is inside if its midpoint is
+            return self.contains_point((x1 + x2) / 2, (y1 + y2) / 2)
+        self.n_exact += 1
+        return LineString([(x1, y1), (x2, y2)]).within(self.polygon)
+
+    def circle_intersects(self, x, y, fov, door, segment):
+        distance = point_segment_distance(x, y, *segment)
+        if distance > fov * (1 + RELATIVE_TOLERANCE):
+            return False
+        if distance < fov * BUFFER_INRADIUS * (1 - RELATIVE_TOLERANCE):
+            return True
+        self.n_exact += 1
+        return Point(x, y).buffer(fov).intersects(door.door_line)
+
+    def segments_intersect(self, line, door, segment):
+        relation = segment_relation(*line, *segment)
+        if relation:
+            return relation > 0
+        self.n_exact += 1
+        x1, y1, x2, y2 = line
+        return LineString([(x1, y1), (x2, y2)]).intersects(door.door_line)
+
+    def farther(self, x, y, ox, oy, door, segment):
+        """
+        True if (x, y) is at least as far from the door as (ox, oy).
+        """
+        new_distance = point_segment_distance(x, y, *segment)
+        old_distance = point_segment_distance(ox, oy, *segment)
+        if abs(new_distance - old_distance) > ABSOLUTE_TOLERANCE:
+            return new_distance >= old_distance
+        self.n_exact += 1
+        return Point(x, y).distance(door.door_line) >= Point(ox, oy).distance(door.door_line)
+
+
+class CollisionKernel:
+    """
+    Collision checks of many agents at once (crowds, or several sessions served by one process).
+
+    The wall and door segments of every room are stored in padded arrays, and the checks of
+    RoomCollisionEngine are evaluated for all the agents with vectorized segment orientation
+    and point/segment distance tests. Agents with a zero movement, or with some predicate within
+    the rounding tolerance of its decision boundary, are checked one by one with
+    Room.check_collision, so decisions are the same as moving every agent alone.
+
+    Parameters
+    ----------
+    rooms: Room objects (their position in the list is the room id used by check_collisions).
+
+    """
+
+    NONE = 0
+    WALL = 1
+    DOOR = 2
+
+    def __init__(self, rooms):
+        self.rooms = list(rooms)
+        self.room_ids = {room.name: i for i, room in enumerate(self.rooms)}
+        # Flat list of the doors: door ids returned by check_collisions are positions in it
+        self.doors = [door for room in self.rooms for door in room.doors]
+        self.door_ids = {id(door): i for i, door in enumerate(self.doors)}
+
+        n_rooms = len(self.rooms)
+        max_walls = max(len(room.collision_engine.boundary) for room in self.rooms)
+        max_doors = max([len(room.doors) for room in self.rooms] + [1])
+        self.walls = np.full((n_rooms, max_walls, 4), np.nan)
+        self.wall_mask = np.zeros((n_rooms, max_walls), dtype=bool)
+        self.door_segments = np.full((n_rooms, max_doors, 4), np.nan)
+        self.door_mask = np.zeros((n_rooms, max_doors), dtype=bool)
+        # Flat door id of every door slot (-1 for padding)
+        self.door_slots = np.full((n_rooms, max_doors), -1, dtype=np.int64)
+        for r, room in enumerate(self.rooms):
+            engine = room.collision_engine
+            self.walls[r, :len(engine.boundary)] = engine.boundary
+            self.wall_mask[r, :len(engine.boundary)] = True
+            if room.doors:
+                self.door_segments[r, :len(room.doors)] = engine.door_segments
+                self.door_mask[r, :len(room.doors)] = True
+                self.door_slots[r, :len(room.doors)] = [self.door_ids[id(door)] for door in room.doors]
+        # Number of agents checked one by one (zero movements or near a decision boundary)
+        self.n_exact = 0
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(n_rooms={len(self.rooms)}, n_doors={len(self.doors)})'
+
+    def check_collisions(self, room_ids, positions, movement_vectors, fov):
+        """
+        Collision checks of N agents (see Room.check_collision).
+
+        Parameters
+        ----------
+        room_ids: (N,) room of every agent (position in self.rooms, see self.room_ids).
+        positions: (N, 2) current positions.
+        movement_vectors: (N, 2) movement vectors.
+        fov: range of collision detection.
+
+        Returns
+        -------
+        codes (int8 array): NONE, WALL or DOOR for every agent.
+        doors (int64 array): id of the door crossed (position in self.doors), -1 if none.
+        """
+        room_ids = np.asarray(room_ids, dtype=np.int64)
+        old = np.asarray(positions, dtype=float).reshape(-1, 2)
+        v = np.asarray(movement_vectors, dtype=float).reshape(-1, 2)
+        n = len(room_ids)
+        new = old + v
+        walls, wall_mask = self.walls[room_ids], self.wall_mask[room_ids]
+
+        # FoV circle within the room: nothing else to check for most of the agents
+        distance = np.where(wall_mask, _point_segment_distances(new[:, 0:1], new[:, 1:2], walls), np.inf).min(axis=1)
+        inside = _contains_points(new[:, 0], new[:, 1], walls)
+        circle_within = (distance >= fov * (1 + RELATIVE_TOLERANCE)) & inside
+        ambiguous = ((distance < fov * (1 + RELATIVE_TOLERANCE)) &
+                     (distance >= fov * BUFFER_INRADIUS * (1 - RELATIVE_TOLERANCE)))
+        ambiguous |= ~v.any(axis=1)
+
+        codes = np.full(n, self.NONE, dtype=np.int8)
+        door_ids = np.full(n, -1, dtype=np.int64)
+        near = np.flatnonzero(~circle_within & ~ambiguous)
+        codes[near], door_ids[near], ambiguous[near] = self._check_near(room_ids[near], old[near], v[near], fov)
+
+        # Zero movements and cases near a decision boundary
+        for i in np.flatnonzero(ambiguous):
+            self.n_exact += 1
+            codes[i], door_ids[i] = self._code(self.rooms[room_ids[i]].check_collision(old[i], v[i], fov))
+        return codes, door_ids
+
+    def _check_near(self, room_ids, old, v, fov):
+        """
+        Doors and walls checks of the agents whose FoV circle is not within their room.
+        Returns their codes, door ids and whether they are near a decision boundary.
+        """
+        n = len(room_ids)
+        new = old + v
+        x, y = new[:, 0:1], new[:, 1:2]
+        vx, vy = v[:, 0:1], v[:, 1:2]
+        walls, wall_mask = self.walls[room_ids], self.wall_mask[room_ids]
+        doors, door_mask = self.door_segments[room_ids], self.door_mask[room_ids]
+
+        # Rays as (n, 1, 4) segments
+        direction_ray = np.concatenate([x - vx * fov, y - vy * fov, x + vx * fov, y + vy * fov], axis=1)[:, None]
+        perpendicular_ray = np.concatenate([x + vy * fov, y - vx * fov, x - vy * fov, y + vx * fov], axis=1)[:, None]
+        movement_line = np.concatenate([old, new], axis=1)[:, None]
+        norm = np.sqrt(vx * vx + vy * vy) + 1e-16
+        forward_ray = np.concatenate([x, y, x + vx / norm * fov, y + vy / norm * fov], axis=1)[:, None]
+
+        # Doors, in the order of the room: the first one in the FoV that is approached,
+        # left or crossed decides the movement (door names are read now, they can change)
+        names = np.array([door.name for door in self.doors] + [''], dtype=object)[self.door_slots[room_ids]]
+        door_mask = door_mask & (names != '1_1')
+        door_distance = _point_segment_distances(x, y, doors)
+        in_fov = door_mask & (door_distance <= fov * (1 + RELATIVE_TOLERANCE))
+        ambiguous_door = in_fov & (door_distance >= fov * BUFFER_INRADIUS * (1 - RELATIVE_TOLERANCE))
+        ray_relation = _segment_relations(direction_ray, doors)
+        movement_relation = _segment_relations(movement_line, doors)
+        perpendicular_relation = _segment_relations(perpendicular_ray, doors)
+        old_distance = _point_segment_distances(old[:, 0:1], old[:, 1:2], doors)
+        ambiguous_door |= in_fov & ((ray_relation == 0) | (movement_relation == 0) | (perpendicular_relation == 0) |
+                                    (np.abs(door_distance - old_distance) <= ABSOLUTE_TOLERANCE))
+        ray_intersects_door = ray_relation > 0
+        crossing_door = in_fov & ray_intersects_door & (movement_relation > 0)
+        moving_away_from_door = (ray_intersects_door | (perpendicular_relation > 0)) & (door_distance >= old_distance)
+        around_door = in_fov & (ray_intersects_door | moving_away_from_door) & ~crossing_door
+        decisive = around_door | crossing_door
+        has_door = decisive.any(axis=1)
+        first = np.argmax(decisive, axis=1)
+        rows = np.arange(n)
+        crossed = has_door & crossing_door[rows, first]
+        ambiguous = ambiguous_door.any(axis=1)
+
+        # Walls
+        forward_within, forward_ambiguous = _segments_within(forward_ray, walls, wall_mask)
+        direction_within, direction_ambiguous = _segments_within(direction_ray, walls, wall_mask)
+        perpendicular_within, perpendicular_ambiguous = _segments_within(perpendicular_ray, walls, wall_mask)
+        ambiguous |= ~has_door & (forward_ambiguous | direction_ambiguous | perpendicular_ambiguous)
+        wall = ~has_door & ~forward_within & ~(direction_within & perpendicular_within)
+
+        codes = np.where(wall, self.WALL, self.NONE).astype(np.int8)
+        door_ids = np.full(n, -1, dtype=np.int64)
+        entrance = names[rows[crossed], first[crossed]] == 'D1-1'
+        codes[crossed] = np.where(entrance, self.WALL, self.DOOR)
+        door_ids[crossed] = np.where(entrance, -1, self.door_slots[room_ids[crossed], first[crossed]])
+        return codes, door_ids, ambiguous
+
+    def _code(self, collision_object):
+        if isinstance(collision_object, Wall):
+            return self.WALL, -1
+        if collision_object is None:
+            return self.NONE, -1
+        return self.DOOR, self.door_ids[id(collision_object)]
+
+
+def _point_segment_distances(px, py, segments):
+    """
+    Distances between the points (N, 1) and the segments (N, K, 4).
+    """
+    ax, ay, bx, by = segments[..., 0], segments[..., 1], segments[..., 2], segments[..., 3]
+    dx, dy = bx - ax, by - ay
+    length2 = dx * dx + dy * dy
+    with np.errstate(invalid='ignore', divide='ignore'):
+        t = np.where(length2 == 0, 0.0, np.clip(((px - ax) * dx + (py - ay) * dy) / length2, 0.0, 1.0))
+    return np.hypot(px - ax - t * dx, py - ay - t * dy)
+
+
+def _segment_relations(lines, segments):
+    """
+    segment_relation between the lines (N, 1, 4) and the segments (N, K, 4): (N, K) array of 1, -1 or 0
+    (padding segments are apart).
+    """
+    px, py, qx, qy = lines[..., 0], lines[..., 1], lines[..., 2], lines[..., 3]
+    ax, ay, bx, by = segments[..., 0], segments[..., 1], segments[..., 2], segments[..., 3]
+    abx, aby, pqx, pqy = bx - ax, by - ay, qx - px, qy - py
+    o1 = abx * (py - ay) - aby * (px - ax)
+    o2 = abx * (qy - ay) - aby * (qx - ax)
+    o3 = pqx * (ay - py) - pqy * (ax - px)
+    o4 = pqx * (by - py) - pqy * (bx - px)
+    e1 = ABSOLUTE_TOLERANCE * np.hypot(abx, aby)
+    e2 = ABSOLUTE_TOLERANCE * np.hypot(pqx, pqy)
+    touching = (np.minimum(np.abs(o1), np.abs(o2)) <= e1) | (np.minimum(np.abs(o3), np.abs(o4)) <= e2)
+    crossing = ((o1 > 0) != (o2 > 0)) & ((o3 > 0) != (o4 > 0))
+    relations = np.where(touching, 0, np.where(crossing, 1, -1))
+    return np.where(np.isnan(ax), -1, relations)
+
+
+def _contains_points(x, y, walls):
+    """
+    Ray casting test of the points (N,) against the boundaries (N, S, 4) (NaN padded).
+    """
+    x1, y1, x2, y2 = walls[..., 0], walls[..., 1], walls[..., 2], walls[..., 3]
+    x, y = x[:, None], y[:, None]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        straddles = (y1 > y) != (y2 > y)
+        crossings = straddles & (x < x1 + (y - y1) * (x2 - x1) / np.where(straddles, y2 - y1, 1.0))
+    return (crossings.sum(axis=1) % 2).astype(bool)
+
+
+def _segments_within(lines, walls, wall_mask):
+    """
+    Segments (N, 1, 4) within the rooms of the boundaries (N, S, 4): within and ambiguous (N,) masks.
+    """
+    relations = np.where(wall_mask, _segment_relations(lines, walls), -1)
+    crosses = (relations == 1).any(axis=1)
+    touches = (relations == 0).any(axis=1)
+    midpoints = (lines[:, 0, 0:2] + lines[:, 0, 2:4]) / 2
+    inside = _contains_points(midpoints[:, 0], midpoints[:, 1], walls)
+    return ~crosses & ~touches & inside, ~crosses & touches
@@ -0,0 +1,94 @@
+import math
+import re
+from collections import defaultdict
+
+import shapely
+from shapely.geometry import box
+
+
+class RoomIndex:
+    """
+    Lookup of the room that contains a position.
+
+    The bounding box of the floorplan is split into a uniform grid, and every cell keeps the
+    rooms whose polygon touches it (in floorplan order), so only one or two polygons are tested
+    per lookup whatever the number of rooms. Before that, the current room of the visitor and the
+    rooms connected to it through doors are tried: they hold the new position almost always.
+
+    The result is the same as scanning the rooms in order with Room.inside_room: the fast path only
+    accepts a room whose interior holds the position (positions on a wall, shared by two rooms, go
+    through the ordered candidates of the grid).
+
+    Parameters
+    ----------
+    rooms: Room objects of the floorplan (Museum.obstacle_map).
+    cell_size: side of the grid cells (by default, half the mean shortest side of the rooms).
+
+    """
+
+    def __init__(self, rooms, cell_size=None):
+        self.rooms = list(rooms)
+        if not self.rooms:
+            raise ValueError('The floorplan has no rooms')
+        bounds = [room.polygon.bounds for room in self.rooms]
+        self.x_min = min(b[0] for b in bounds)
+        self.y_min = min(b[1] for b in bounds)
+        x_max = max(b[2] for b in bounds)
+        y_max = max(b[3] for b in bounds)
+        if cell_size is None:
+            cell_size = sum(min(b[2] - b[0], b[3] - b[1]) for b in bounds) / (2.0 * len(bounds))
+        self.cell_size = cell_size
+        self.n_cols = max(1, math.ceil((x_max - self.x_min) / cell_size))
+        self.n_rows = max(1, math.ceil((y_max - self.y_min) / cell_size))
+
+        # Candidate rooms of every cell, as indexes of self.rooms
+        self.cells = defaultdict(list)
+        for i, (room, (rx_min, ry_min, rx_max, ry_max)) in enumerate(zip(self.rooms, bounds)):
+            for col in range(self._col(rx_min), self._col(rx_max) + 1):
+                for row in range(self._row(ry_min), self._row(ry_max) + 1):
+                    x0, y0 = self.x_min + col * cell_size, self.y_min + row * cell_size
+                    if room.polygon.intersects(box(x0, y0, x0 + cell_size, y0 + cell_size)):
+                        self.cells[col, row].append(i)
+
+        # Rooms connected to every room through its doors
+        by_number = {re.findall(r"\d+", room.name)[0]: room for room in self.rooms}
+        self.adjacent = {room.name: [by_number[str(door.room_destination)] for door in room.doors
+                                     if str(door.room_destination) in by_number and
+                                     by_number[str(door.room_destination)] is not room]
+                         for room in self.rooms}
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(n_rooms={len(self.rooms)}, grid={self.n_cols}x{self.n_rows})'
+
+    def _col(self, x):
+        return min(self.n_cols - 1, max(0, int((x - self.x_min) // self.cell_size)))
+
+    def _row(self, y):
+        return min(self.n_rows - 1, max(0, int((y - self.y_min) // self.cell_size)))
+
+    def candidates(self, x, y):
+        col = (x - self.x_min) // self.cell_size
+        row = (y - self.y_min) // self.cell_size
+        # Positions on the far edges of the floorplan belong to the last cells
+        col = self.n_cols - 1 if col == self.n_cols else col
+        row = self.n_rows - 1 if row == self.n_rows else row
+        return [self.rooms[i] for i in self.cells.get((int(col), int(row)), [])]
+
+    def locate(self, position, current=None):
+        """
+        Room that contains the position (None if it is outside the floorplan).
+
+        Parameters
+        ----------
+        position: (x, y) position.
+        current: room where the visitor was (None if unknown).
+        """
+        x, y = float(position[0]), float(position[1])
+        if current is not None:
+            for room in [current] + self.adjacent.get(current.name, []):
+                if shapely.contains_xy(room.polygon, x, y):
+                    return room
+        for room in self.candidates(x, y):
+            if shapely.intersects_xy(room.polygon, x, y):
+                return room
+        return None
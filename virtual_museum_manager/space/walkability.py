@@ -0,0 +1,182 @@
+import hashlib
+import json
+import math
+import os
+import tempfile
+
+import numpy as np
+import shapely
+
+from space.collision import RELATIVE_TOLERANCE
+from utils.utils import get_project_root
+
+# Bump when the stored arrays (or the way they are built) change, so old files are not used
+RASTER_VERSION = 1
+
+DEFAULT_CACHE_DIR = os.path.join(get_project_root(), 'resources')
+
+
+class WalkabilityRaster:
+    """
+    Precomputed raster of the floorplan, for movement checks with array lookups.
+
+    The space is split into square cells, and for the center of every cell the raster stores
+    the room that contains it (-1 if none), its distance to the walls of that room and the door
+    portal it is in (the nearest door closer than portal_radius, -1 if none). Distances are exact
+    (point to wall segment distances, computed for all the cells of a room at once).
+
+    Since the distance to the walls changes at most as much as the position, a position whose cell
+    is farther than fov plus half the cell diagonal from the walls has its whole FoV circle in the
+    room (circle_clear) and is in the room of the cell (room_at). Anything closer to a wall or a
+    door returns None / False, and the exact geometry (Room.check_collision, RoomIndex) is used.
+
+    Parameters
+    ----------
+    rooms: Room objects of the floorplan (Museum.obstacle_map).
+    width, height: size of the space.
+    cell_size: side of the cells.
+    portal_radius: distance to a door within which cells are tagged with it.
+
+    """
+
+    def __init__(self, rooms, width, height, cell_size=5, portal_radius=30, arrays=None):
+        self.rooms = list(rooms)
+        self.doors = [door for room in self.rooms for door in room.doors]
+        self.width = width
+        self.height = height
+        self.cell_size = cell_size
+        self.portal_radius = portal_radius
+        self.n_cols = math.ceil(width / cell_size)
+        self.n_rows = math.ceil(height / cell_size)
+        # Distance from the center of a cell to its farthest point
+        self.half_diagonal = cell_size * math.sqrt(2) / 2
+        if arrays is None:
+            arrays = self._rasterize()
+        self.room, self.wall_distance, self.door = arrays['room'], arrays['wall_distance'], arrays['door']
+        # Distance to the walls of the room of the cell from anywhere in the cell (-1 outside the rooms)
+        self.clearance = np.where(self.room >= 0, self.wall_distance - self.half_diagonal, -1.0)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(cell_size={self.cell_size}, grid={self.n_cols}x{self.n_rows})'
+
+    @classmethod
+    def load_or_build(cls, rooms_map, rooms, width, height, cell_size=5, portal_radius=30, cache_dir=None):
+        """
+        Returns the raster of the floorplan, loading it from the cache directory (the resources
+        directory, next to space.json, by default) if it has already been built.
+
+        Parameters
+        ----------
+        rooms_map: rooms of the floorplan as loaded from space.json (the cache key).
+        rooms: Room objects built from rooms_map.
+        """
+        cache_dir = cache_dir if cache_dir is not None else DEFAULT_CACHE_DIR
+        content = json.dumps({'version': RASTER_VERSION, 'rooms': rooms_map, 'size': [width, height],
+                              'cell_size': cell_size, 'portal_radius': portal_radius},
+                             sort_keys=True, separators=(',', ':'))
+        path = os.path.join(cache_dir, f'walkability_{hashlib.sha256(content.encode("utf-8")).hexdigest()}.npz')
+
+        if os.path.isfile(path):
+            try:
+                with np.load(path, allow_pickle=False) as data:
+                    arrays = {name: data[name] for name in ('room', 'wall_distance', 'door')}
+                return cls(rooms, width, height, cell_size=cell_size, portal_radius=portal_radius, arrays=arrays)
+            except (OSError, KeyError, ValueError) as e:
+                print(f"Ignoring invalid walkability raster file {path}: {e!r}")
+
+        raster = cls(rooms, width, height, cell_size=cell_size, portal_radius=portal_radius)
+        raster.store(path)
+        return raster
+
+    def store(self, path):
+        """
+        Writes the raster arrays atomically (see GraphCache.store).
+        """
+        directory = os.path.dirname(path) or '.'
+        fd, tmp_path = tempfile.mkstemp(suffix='.npz', dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez_compressed(f, room=self.room, wall_distance=self.wall_distance, door=self.door)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            # The cache is only an optimization: failing to write it must not stop the model
+            print(f"Could not write walkability raster file: {e!r}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _rasterize(self):
+        room = np.full((self.n_rows, self.n_cols), -1, dtype=np.int16)
+        wall_distance = np.zeros((self.n_rows, self.n_cols))
+        door = np.full((self.n_rows, self.n_cols), -1, dtype=np.int16)
+        door_distance = np.full((self.n_rows, self.n_cols), np.inf)
+
+        door_id = 0
+        for r, room_object in enumerate(self.rooms):
+            # Cells of the bounding box of the room (plus the portals of its doors)
+            x_min, y_min, x_max, y_max = room_object.polygon.bounds
+            margin = self.portal_radius + self.cell_size
+            cols = self._cells(x_min - margin, x_max + margin, self.n_cols)
+            rows = self._cells(y_min - margin, y_max + margin, self.n_rows)
+            x, y = np.meshgrid((cols + 0.5) * self.cell_size, (rows + 0.5) * self.cell_size)
+            block = np.ix_(rows, cols)
+
+            inside = shapely.contains_xy(room_object.polygon, x, y)
+            distances = np.min([_point_segment_distances(x, y, segment)
+                                for segment in room_object.collision_engine.boundary], axis=0)
+            room[block] = np.where(inside, r, room[block])
+            wall_distance[block] = np.where(inside, distances, wall_distance[block])
+
+            for segment in room_object.collision_engine.door_segments:
+                distances = _point_segment_distances(x, y, segment)
+                nearest = (distances <= self.portal_radius) & (distances < door_distance[block])
+                door[block] = np.where(nearest, door_id, door[block])
+                door_distance[block] = np.where(nearest, distances, door_distance[block])
+                door_id += 1
+        return {'room': room, 'wall_distance': wall_distance, 'door': door}
+
+    def _cells(self, low, high, n):
+        return np.arange(max(0, int(low // self.cell_size)), min(n, int(high // self.cell_size) + 1))
+
+    def cell(self, position):
+        """
+        (row, col) of the cell of the position, None if it is outside the space.
+        """
+        col, row = int(float(position[0]) // self.cell_size), int(float(position[1]) // self.cell_size)
+        if 0 <= col < self.n_cols and 0 <= row < self.n_rows:
+            return row, col
+        return None
+
+    def room_at(self, position):
+        """
+        Room that contains the position, None if it is too close to a wall to tell from the raster.
+        """
+        cell = self.cell(position)
+        if cell is None or self.clearance.item(cell) <= 0:
+            return None
+        return self.rooms[self.room.item(cell)]
+
+    def circle_clear(self, room, position, fov):
+        """
+        True if the FoV circle at the position is within the room (no wall or door in the FoV).
+        False means the exact check is needed.
+        """
+        cell = self.cell(position)
+        return (cell is not None and self.clearance.item(cell) >= fov * (1 + RELATIVE_TOLERANCE) and
+                self.rooms[self.room.item(cell)] is room)
+
+    def door_at(self, position):
+        """
+        Door whose portal (cells closer than portal_radius to it) holds the position, None if none.
+        """
+        cell = self.cell(position)
+        if cell is None or self.door[cell] < 0:
+            return None
+        return self.doors[self.door[cell]]
+
+
+def _point_segment_distances(x, y, segment):
+    ax, ay, bx, by = segment
+    dx, dy = bx - ax, by - ay
+    length2 = dx * dx + dy * dy
+    t = np.zeros_like(x) if length2 == 0 else np.clip(((x - ax) * dx + (y - ay) * dy) / length2, 0.0, 1.0)
+    return np.hypot(x - ax - t * dx, y - ay - t * dy)
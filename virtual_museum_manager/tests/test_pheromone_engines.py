@@ -0,0 +1,150 @@
+"""
+Equivalence of the pheromone engines of the solver: the same MMAS updates applied with the pheromones in the graph
+edges, in arrays (array_engine, batch_ants) or in arrays evaporated lazily (lazy_evaporation) must give the same
+trails and the same edge scores to the ants.
+
+Run from virtual_museum_manager:
+
+    python -m pytest -q tests
+"""
+import contextlib
+import io
+import json
+import random
+import sys
+
+import numpy as np
+import pytest
+
+from aco.aco_final.AlgorithmController import AlgorithmController
+from aco.aco_final.MuseumGraphManager import MuseumGraphManager
+from aco.aco_final.ant import Ant, Colony
+from aco.aco_final.solvers import CompactSolution, Solver
+
+MODES = {
+    'graph': {},
+    'array': {'array_engine': True},
+    'lazy': {'lazy_evaporation': True},
+    'batch': {'batch_ants': True},
+}
+ITERATIONS = 60
+# Iterations after which the iML feedback (manual pheromone update) is applied to BOOSTED_EDGE
+BOOST_ITERATIONS = (10, 11, 40)
+BOOSTED_EDGE = 3
+
+
+@pytest.fixture(scope='module')
+def rooms():
+    with open('resources/space.json') as f:
+        return json.load(f)
+
+
+def _initialised_graph(rooms):
+    graph_manager = MuseumGraphManager(rooms)
+    graph = graph_manager.door_graph
+    graph_manager.initialise_pheromones(graph)
+    return graph
+
+
+@pytest.fixture(scope='module')
+def tours(rooms):
+    # Tours of different lengths, so that the trail limits change at every iteration
+    graph = _initialised_graph(rooms)
+    random.seed(0)
+    ant = Ant()
+    return [ant.construct_tour(graph) for _ in range(ITERATIONS)]
+
+
+def _pheromones(state):
+    return np.array([state.get_pheromone(u, v) for u, v in state.graph.edges])
+
+
+def _graph_scores(state, alpha=1, beta=3):
+    # Scores of the ants of the graph mode (see Colony._score_edge)
+    scores = []
+    for u, v in state.graph.edges:
+        weight = state.graph[u][v]['weight']
+        scores.append(sys.float_info.max if weight == 0 else
+                      state.get_pheromone(u, v) ** alpha * (1.0 / weight) ** beta)
+    return np.array(scores)
+
+
+def _table_scores(state):
+    # Scores of the per-ant lookups (entries) and of the batch / parallel constructors (scores)
+    entries = state.attractiveness.entries
+    lookups = np.array([entries[edge_id] for edge_id in range(state.engine.index.n_edges)])
+    return lookups, state.attractiveness.scores
+
+
+def _run_updates(rooms, tours, rho, **options):
+    """
+    Applies the MMAS update of every tour as iteration best with a solver of the given options,
+    and returns the pheromones and scores of every edge after each iteration.
+    """
+    solver = Solver(rho=rho, pts=False, **options)
+    state = solver._prepare_state(_initialised_graph(rooms), Colony(), 1, len(tours))
+    u, v = list(state.graph.edges)[BOOSTED_EDGE]
+    pheromones, scores = [], []
+    for i, tour in enumerate(tours):
+        best = CompactSolution.from_solution(tour, state.engine.index) if state.engine is not None else tour
+        state.set_best(best, i)
+        with contextlib.redirect_stdout(io.StringIO()):
+            solver._update_pheromones(state)
+        if state.attractiveness is not None:
+            state.attractiveness.refresh()
+        if i in BOOST_ITERATIONS:
+            state.set_pheromone(u, v, state.get_pheromone(u, v) * 250)
+        pheromones.append(_pheromones(state))
+        scores.append(_graph_scores(state) if state.engine is None else _table_scores(state))
+    return state, pheromones, scores
+
+
+@pytest.mark.parametrize('rho', [0.02, 0.3])
+@pytest.mark.parametrize('mode', ['array', 'lazy', 'batch'])
+def test_engines_match_graph_updates(rooms, tours, rho, mode):
+    _, expected_pheromones, expected_scores = _run_updates(rooms, tours, rho)
+    state, pheromones, scores = _run_updates(rooms, tours, rho, **MODES[mode])
+
+    assert state.engine.lazy == (mode == 'lazy')
+    for i in range(ITERATIONS):
+        np.testing.assert_allclose(pheromones[i], expected_pheromones[i], rtol=1e-12, err_msg=f'iteration {i}')
+        for table_scores in scores[i]:
+            np.testing.assert_allclose(table_scores, expected_scores[i], rtol=1e-12, err_msg=f'iteration {i}')
+
+
+def test_trail_limits_are_applied(rooms, tours):
+    # With a fast evaporation the trails reach the lower limit, which the lazy engine applies without touching them
+    state, pheromones, _ = _run_updates(rooms, tours, 0.3, **MODES['lazy'])
+    assert np.all(pheromones[-1] >= state.current_lower_bound * (1 - 1e-12))
+    assert np.all(pheromones[-1] <= state.current_upper_bound * (1 + 1e-12))
+    assert np.any(np.isclose(pheromones[-1], state.current_lower_bound, rtol=1e-12))
+
+
+@pytest.mark.parametrize('mode', list(MODES))
+def test_manual_update_lasts_until_next_update(rooms, mode):
+    with contextlib.redirect_stdout(io.StringIO()):
+        controller = AlgorithmController(rooms, num_ants=5, seed=0, **MODES[mode])
+        controller.compute_initial_iterations(limit=5)
+        state = controller.state
+        # Edge with the strongest trail (at the upper limit): the boost takes it above the limit
+        u, v = max(state.graph.edges, key=lambda edge: state.get_pheromone(*edge))
+        before = state.get_pheromone(u, v)
+        before_score = state.attractiveness.lookup([state.engine.index.edge_id(u, v)])[0] \
+            if state.engine is not None else None
+
+        controller.manual_pheromone_update((u, v))
+
+    # The boost is not clamped to the trail limits before the ants use it
+    assert state.get_pheromone(u, v) == pytest.approx(before * 250, rel=1e-12)
+    assert state.get_pheromone(u, v) > state.current_upper_bound
+    assert state.graph[u][v]['pheromone'] == pytest.approx(before * 250, rel=1e-12)
+    if state.engine is not None:
+        edge_id = state.engine.index.edge_id(u, v)
+        assert state.attractiveness.lookup([edge_id])[0] == pytest.approx(before_score * 250, rel=1e-12)
+        assert state.attractiveness.entries[edge_id] == pytest.approx(before_score * 250, rel=1e-12)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        controller.compute_next_iterations(limit=1)
+    # The next pheromone update applies the limits again
+    assert state.get_pheromone(u, v) == pytest.approx(controller.state.current_upper_bound, rel=1e-12)
+    controller.close()